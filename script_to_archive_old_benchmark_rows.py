@@ -0,0 +1,21 @@
+import argparse
+from web_app.app.database.init_db import SessionLocal, init_db
+from web_app.app.utils.archive import archive_old_rows, ARCHIVE_RETENTION_DAYS, ARCHIVE_DIRECTORY
+
+# Moves raw rows older than the retention period into the Parquet archive and vacuums the database. The scheduler
+# does this after every job when ARCHIVE_RETENTION_DAYS is set; this runs it once, e.g. to shrink an existing database:
+# python3 script_to_archive_old_benchmark_rows.py --retention-days 180
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old raw benchmark rows to Parquet.")
+    parser.add_argument("--retention-days", type=int, default=ARCHIVE_RETENTION_DAYS, help="Keep this many days of rows in the database.")
+    args = parser.parse_args()
+    if args.retention_days <= 0:
+        parser.error("Set --retention-days (or ARCHIVE_RETENTION_DAYS) to a positive number of days.")
+    init_db()
+    db = SessionLocal()
+    try:
+        number_of_rows = archive_old_rows(db, args.retention_days)
+    finally:
+        db.close()
+    print(f"Archived {number_of_rows} rows to {ARCHIVE_DIRECTORY}.")
@@ -0,0 +1,16 @@
+from web_app.app.database.init_db import SessionLocal, init_db
+from web_app.app.utils.rollups import rebuild_rollups
+
+# Fills the rollup table from the raw history of an existing database. The scheduler's maintenance pass keeps it up to
+# date with new ingests, so this only needs to run once after upgrading, or after changing
+# PLAYBOOK_RUN_INTERVAL_IN_MINUTES (which decides the resolutions kept). It is safe to run again:
+# python3 script_to_backfill_rollup_tables.py
+
+if __name__ == "__main__":
+    init_db()
+    db = SessionLocal()
+    try:
+        number_of_rows = rebuild_rollups(db)
+    finally:
+        db.close()
+    print(f"Wrote {number_of_rows} rollup rows.")
@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Measures /data/latest/ latency while big chart renders and CSV exports run, against a throwaway SQLite database:
+# python3 script_to_benchmark_api_latency_under_load.py --hosts 50 --runs 2000
+# The database location has to be set before the app modules create their engines.
+temp_dir = tempfile.TemporaryDirectory()
+os.environ["SQLALCHEMY_ENGINE_CONNECTION_STRING"] = f"sqlite:///{os.path.join(temp_dir.name, 'latency_benchmark.sqlite')}"
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore
+from web_app.app.database.init_db import SessionLocal, init_db
+from web_app.app.database.bulk_upsert import upsert_rows
+from web_app.app.database.hosts import register_hosts, with_host_ids
+from web_app.app.database.latest_host_scores import rebuild_latest_host_scores
+from web_app.app.routes.api_routes import router
+from web_app.app.utils.ingest import RAW_METRIC_COLUMNS, CONFLICT_COLUMNS
+from web_app.app.utils.rollups import rebuild_rollups
+
+
+def populate_history(number_of_hosts, number_of_runs, seed=42):
+    rng = random.Random(seed)
+    start_datetime = datetime.now() - timedelta(hours=6 * number_of_runs)
+    db = SessionLocal()
+    try:
+        for run_index in range(number_of_runs):
+            conditions = [{"datetime": start_datetime + timedelta(hours=6 * run_index), "hostname": f"synthetic-host-{index:04d}", "IP_address": f"10.0.{index // 256}.{index % 256}"}
+                          for index in range(number_of_hosts)]
+            conditions = with_host_ids(conditions, register_hosts(db, conditions))
+            upsert_rows(db, RawBenchmarkSubscores, [{**row, **{column: rng.uniform(1, 100) for column in RAW_METRIC_COLUMNS}} for row in conditions], CONFLICT_COLUMNS)
+            upsert_rows(db, OverallNormalizedScore, [{**row, "overall_score": rng.uniform(0, 100)} for row in conditions], CONFLICT_COLUMNS)
+        db.commit()
+        rebuild_latest_host_scores(db)
+        rebuild_rollups(db)
+    finally:
+        db.close()
+
+
+def start_server():
+    app = FastAPI()
+    app.include_router(router)
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def measure_latencies(base_url, duration_in_seconds):
+    latencies = []
+    with httpx.Client(base_url=base_url) as client:
+        stop_time = time.perf_counter() + duration_in_seconds
+        while time.perf_counter() < stop_time:
+            start_time = time.perf_counter()
+            client.get("/data/latest/").raise_for_status()
+            latencies.append(time.perf_counter() - start_time)
+    return np.array(latencies) * 1000
+
+
+def run_heavy_requests(base_url, number_of_requests):
+    # A distinct `points` value per chart request keeps the rendered chart cache from answering
+    with httpx.Client(base_url=base_url, timeout=None) as client:
+        for index in range(number_of_requests):
+            client.get("/benchmark_charts/", params={"points": 1000 - index, "start": (datetime.now() - timedelta(days=30)).isoformat()})
+            client.get("/benchmark_historical_csv/")
+
+
+def report(label, latencies):
+    print(f"{label:>28}: {len(latencies):5d} requests, p50 {np.percentile(latencies, 50):7.1f} ms, p99 {np.percentile(latencies, 99):7.1f} ms, max {latencies.max():7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /data/latest/ latency while charts and CSV exports are generated.")
+    parser.add_argument("--hosts", type=int, default=50, help="Number of synthetic hosts.")
+    parser.add_argument("--runs", type=int, default=2000, help="Number of benchmark runs of history.")
+    parser.add_argument("--heavy-requests", type=int, default=3, help="Number of chart + CSV request pairs to run under load.")
+    args = parser.parse_args()
+    init_db()
+    print(f"Populating {args.runs} runs of {args.hosts} synthetic hosts...")
+    populate_history(args.hosts, args.runs)
+    server, base_url = start_server()
+    report("idle", measure_latencies(base_url, 3))
+    heavy_thread = threading.Thread(target=run_heavy_requests, args=(base_url, args.heavy_requests))
+    heavy_start_time = time.perf_counter()
+    heavy_thread.start()
+    latencies = []
+    while heavy_thread.is_alive():
+        latencies.extend(measure_latencies(base_url, 0.5))
+    print(f"Heavy requests took {time.perf_counter() - heavy_start_time:.1f}s.")
+    report("during charts + CSV export", np.array(latencies))
+    server.should_exit = True
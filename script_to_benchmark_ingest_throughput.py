@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from web_app.app.database.data_models import Base, RawBenchmarkSubscores, OverallNormalizedScore
+from web_app.app.database.hosts import ensure_hosts
+from web_app.app.utils.ingest import ingest_data
+
+# Benchmarks the scheduler's ingest path against a throwaway SQLite database:
+# python3 script_to_benchmark_ingest_throughput.py --hosts 10000 --runs 2
+
+
+def generate_synthetic_fleet(number_of_hosts, seed=42):
+    rng = random.Random(seed)
+    raw_data = {}
+    overall_data = {}
+    host_to_ip = {}
+    for index in range(number_of_hosts):
+        hostname = f"synthetic-host-{index:05d}.example.com"
+        raw_data[hostname] = {
+            "cpu_speed_test__events_per_second": rng.uniform(500, 5000),
+            "fileio_test__reads_per_second": rng.uniform(100, 20000),
+            "memory_speed_test__MiB_transferred": rng.uniform(20000, 100000),
+            "mutex_test__avg_latency": rng.uniform(0.1, 5.0),
+            "threads_test__avg_latency": rng.uniform(0.1, 5.0)
+        }
+        overall_data[hostname] = rng.uniform(0, 100)
+        host_to_ip[hostname] = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+    return raw_data, overall_data, host_to_ip
+
+
+def legacy_ingest_data(db, raw_data, overall_data, datetime_from_file, host_to_ip):
+    # The original ingest path: two SELECTs plus one ORM add per host (rows now reference their host by id)
+    hosts = ensure_hosts(db, raw_data)
+    for hostname, scores in raw_data.items():
+        conditions = {
+            "datetime": datetime_from_file,
+            "host_id": hosts[hostname].id,
+            "IP_address": host_to_ip.get(hostname, 'UNKNOWN')
+        }
+        raw_record = db.query(RawBenchmarkSubscores).filter_by(**conditions).first()
+        if raw_record:
+            for k, v in scores.items():
+                setattr(raw_record, k, v)
+        else:
+            db.add(RawBenchmarkSubscores(**conditions, **scores))
+        overall_record = db.query(OverallNormalizedScore).filter_by(**conditions).first()
+        if overall_record:
+            overall_record.overall_score = overall_data[hostname]
+        else:
+            db.add(OverallNormalizedScore(**conditions, overall_score=overall_data[hostname]))
+    db.commit()
+
+
+def time_ingest(ingest_function, raw_data, overall_data, host_to_ip, number_of_runs):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(temp_dir, 'ingest_benchmark.sqlite')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        start_datetime = datetime(2024, 1, 1)
+        rows_written = 0
+        start_time = time.perf_counter()
+        for run_index in range(number_of_runs):
+            db = session_factory()
+            try:
+                ingest_function(db, raw_data, overall_data, start_datetime + timedelta(hours=6 * run_index), host_to_ip)
+            finally:
+                db.close()
+            rows_written += 2 * len(raw_data)
+        elapsed = time.perf_counter() - start_time
+        engine.dispose()
+    return rows_written, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest throughput into SQLite.")
+    parser.add_argument("--hosts", type=int, default=10000, help="Number of synthetic hosts per run.")
+    parser.add_argument("--runs", type=int, default=2, help="Number of benchmark runs to ingest.")
+    args = parser.parse_args()
+    raw_data, overall_data, host_to_ip = generate_synthetic_fleet(args.hosts)
+    print(f"Ingesting {args.runs} run(s) of {args.hosts} synthetic hosts into SQLite...")
+    for label, ingest_function in [("before (row-by-row)", legacy_ingest_data), ("after (bulk upsert)", ingest_data)]:
+        rows_written, elapsed = time_ingest(ingest_function, raw_data, overall_data, host_to_ip, args.runs)
+        print(f"{label:>22}: {rows_written} rows in {elapsed:.2f}s = {rows_written / elapsed:,.0f} rows/s")
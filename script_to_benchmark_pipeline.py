@@ -0,0 +1,150 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# End-to-end performance suite against a simulated fleet and a throwaway SQLite database. History grows in steps,
+# and after every step it reports ingest throughput, chart render time, CSV export time and API latency, so a change
+# to any of those paths can be compared before and after:
+# python3 script_to_benchmark_pipeline.py --hosts 100 --runs-per-step 250 --steps 4
+# The database, results directory and playbook command have to be set before the app modules read their config.
+temp_dir = tempfile.TemporaryDirectory()
+os.environ["SQLALCHEMY_ENGINE_CONNECTION_STRING"] = f"sqlite:///{os.path.join(temp_dir.name, 'pipeline_benchmark.sqlite')}"
+os.environ["BENCHMARK_RESULTS_DIRECTORY"] = temp_dir.name
+os.environ["ANSIBLE_INVENTORY_FILE_PATH"] = os.path.join(temp_dir.name, "simulated_inventory.ini")
+os.environ["ANSIBLE_PLAYBOOK_COMMAND"] = f"{sys.executable} {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script_to_simulate_benchmark_fleet.py')} playbook"
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select, func
+from web_app.app.chart import render_benchmark_charts_html, CHART_POINTS_PER_HOST
+from web_app.app.database.data_models import RawBenchmarkSubscores
+from web_app.app.database.init_db import SessionLocal, init_db
+from web_app.app.routes.api_routes import router
+from web_app.app.utils.csv_export import stream_benchmark_historical_csv
+from web_app.app.utils.fleet_simulator import simulated_fleet, simulate_run, score_run, write_inventory
+from web_app.app.utils.ingest import ingest_data
+from web_app.app.utils.rollups import refresh_stale_rollups
+from web_app.app.utils import scheduler
+from web_app.app.utils.run_queue import request_run
+
+API_REQUESTS = [
+    ("/data/latest/", {}),
+    ("/data/raw/", {"limit": 1000}),
+    ("/data/overall/", {"time_period": "last_30_days"}),
+    ("/alerts/", {}),
+]
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def ingest_runs(host_to_ip, rng, start_datetime, first_run_index, number_of_runs, interval_hours, trials):
+    start_time = time.perf_counter()
+    for run_index in range(first_run_index, first_run_index + number_of_runs):
+        raw_data = simulate_run(host_to_ip, rng, trials)
+        db = SessionLocal()
+        try:
+            ingest_data(db, raw_data, score_run(raw_data), start_datetime + timedelta(hours=interval_hours * run_index), host_to_ip)
+        finally:
+            db.close()
+    return number_of_runs * len(host_to_ip) / (time.perf_counter() - start_time)
+
+
+def refresh_rollups():
+    # What the scheduler's maintenance pass does after ingest
+    db = SessionLocal()
+    try:
+        return refresh_stale_rollups(db)
+    finally:
+        db.close()
+
+
+def render_charts(start=None):
+    # Straight to the renderer, so the rendered chart cache never answers
+    db = SessionLocal()
+    try:
+        return render_benchmark_charts_html(db, start, None, CHART_POINTS_PER_HOST)
+    finally:
+        db.close()
+
+
+def export_csv():
+    return sum(len(chunk) for chunk in stream_benchmark_historical_csv())
+
+
+def api_latencies(client, number_of_requests):
+    latencies = {}
+    for path, params in API_REQUESTS:
+        samples = []
+        for _ in range(number_of_requests):
+            start_time = time.perf_counter()
+            client.get(path, params=params).raise_for_status()
+            samples.append((time.perf_counter() - start_time) * 1000)
+        latencies[path] = (np.percentile(samples, 50), np.percentile(samples, 99))
+    return latencies
+
+
+def count_raw_rows():
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).select_from(RawBenchmarkSubscores)).scalar()
+    finally:
+        db.close()
+
+
+def run_scheduler_jobs(number_of_jobs, hostnames):
+    # A manual run of the whole fleet makes every job() run the (simulated) playbook, whatever the hosts' due times
+    scheduler.renew_leadership()
+    scheduler.sync_inventory(os.environ["ANSIBLE_INVENTORY_FILE_PATH"])
+    durations = []
+    for _ in range(number_of_jobs):
+        request_run(hostnames)
+        durations.append(timed(scheduler.job)[1])
+    return durations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, charts, CSV export and API latency as the history grows.")
+    parser.add_argument("--hosts", type=int, default=100, help="Number of simulated hosts.")
+    parser.add_argument("--runs-per-step", type=int, default=250, help="Runs of history added before each measurement.")
+    parser.add_argument("--steps", type=int, default=4, help="Number of measurements.")
+    parser.add_argument("--interval-hours", type=float, default=6, help="Time between simulated runs.")
+    parser.add_argument("--trials", type=int, default=1, help="Trials per metric, as with BENCHMARK_TRIALS.")
+    parser.add_argument("--api-requests", type=int, default=20, help="Requests per endpoint for the latency percentiles.")
+    parser.add_argument("--scheduler-jobs", type=int, default=2, help="Full scheduler jobs (simulated playbook, ingest, detection) to time at the end.")
+    args = parser.parse_args()
+    init_db()
+    host_to_ip = simulated_fleet(args.hosts)
+    write_inventory(os.environ["ANSIBLE_INVENTORY_FILE_PATH"], host_to_ip)
+    rng = random.Random(42)
+    total_runs = args.runs_per_step * args.steps
+    start_datetime = datetime.now() - timedelta(hours=args.interval_hours * total_runs)
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    print(f"Simulating {args.hosts} hosts, {args.runs_per_step} runs per step, {args.steps} steps.")
+    for step in range(args.steps):
+        ingest_rate = ingest_runs(host_to_ip, rng, start_datetime, step * args.runs_per_step, args.runs_per_step, args.interval_hours, args.trials)
+        _, rollup_time = timed(refresh_rollups)
+        _, chart_all_time = timed(render_charts)
+        _, chart_recent_time = timed(render_charts, datetime.now() - timedelta(days=30))
+        csv_bytes, csv_time = timed(export_csv)
+        latencies = api_latencies(client, args.api_requests)
+        print(f"\n{count_raw_rows():,} raw rows")
+        print(f"  ingest: {ingest_rate:,.0f} host results/s")
+        print(f"  rollup refresh: {rollup_time:.2f}s")
+        print(f"  charts: {chart_all_time:.2f}s all history, {chart_recent_time:.2f}s last 30 days")
+        print(f"  CSV export: {csv_time:.2f}s for {csv_bytes / 2 ** 20:.1f} MiB")
+        for path, (p50, p99) in latencies.items():
+            print(f"  {path}: p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+    if args.scheduler_jobs:
+        durations = run_scheduler_jobs(args.scheduler_jobs, list(host_to_ip))
+        print(f"\nscheduler job() with the simulated playbook: {', '.join(f'{duration:.2f}s' for duration in durations)}")
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Cold-start benchmark for the web app: every sample is a fresh interpreter that imports the app, runs its startup
+# and serves a first request against a throwaway SQLite database, so it measures what a new API replica pays:
+# python3 script_to_benchmark_startup_time.py --repeats 5
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "plotly"]
+CHILD_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+from web_app.app.main import app
+import_seconds = time.perf_counter() - start_time
+loaded_after_import = [module for module in {heavy_modules} if module in sys.modules]
+from fastapi.testclient import TestClient
+start_time = time.perf_counter()
+with TestClient(app) as client:
+    startup_seconds = time.perf_counter() - start_time
+    timings = {{}}
+    for path in {paths}:
+        start_time = time.perf_counter()
+        client.get(path).raise_for_status()
+        timings[path] = time.perf_counter() - start_time
+    loaded_after_requests = [module for module in {heavy_modules} if module in sys.modules]
+print(json.dumps({{"import": import_seconds, "startup": startup_seconds, "requests": timings,
+                  "loaded_after_import": loaded_after_import, "loaded_after_requests": loaded_after_requests}}))
+"""
+
+
+def cold_start(paths, scheduler_enabled, temp_dir):
+    inventory_file_path = os.path.join(temp_dir, "empty_inventory.ini")
+    open(inventory_file_path, 'w').close()
+    env = {**os.environ,
+           "SQLALCHEMY_ENGINE_CONNECTION_STRING": f"sqlite:///{os.path.join(temp_dir, 'startup_benchmark.sqlite')}",
+           "BENCHMARK_RESULTS_DIRECTORY": temp_dir,
+           "ANSIBLE_INVENTORY_FILE_PATH": inventory_file_path,
+           "ARCHIVE_DIRECTORY": os.path.join(temp_dir, "benchmark_archive"),
+           "SCHEDULER_ENABLED": str(scheduler_enabled)}
+    child_script = CHILD_SCRIPT.format(heavy_modules=HEAVY_MODULES, paths=paths)
+    result = subprocess.run([sys.executable, "-c", child_script], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def report(title, samples, paths):
+    print(f"\n{title}, median of {len(samples)} cold starts:")
+    print(f"  import web_app.app.main: {statistics.median(sample['import'] for sample in samples):.2f}s"
+          f" (heavy modules loaded: {', '.join(samples[0]['loaded_after_import']) or 'none'})")
+    print(f"  startup (init_db and lifespan): {statistics.median(sample['startup'] for sample in samples):.2f}s")
+    for path in paths:
+        print(f"  first {path}: {statistics.median(sample['requests'][path] for sample in samples) * 1000:.0f} ms")
+    print(f"  heavy modules loaded after these requests: {', '.join(samples[0]['loaded_after_requests']) or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the web app's cold start: import, startup and first requests.")
+    parser.add_argument("--repeats", type=int, default=5, help="Cold starts per scenario.")
+    args = parser.parse_args()
+    light_paths = ["/data/latest/", "/hosts/", "/metrics"]
+    heavy_paths = ["/data/latest/", "/benchmark_charts/", "/benchmark_historical_csv/"]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report("API only (SCHEDULER_ENABLED=False)", [cold_start(light_paths, False, temp_dir) for _ in range(args.repeats)], light_paths)
+        report("API only, first chart and CSV requests", [cold_start(heavy_paths, False, temp_dir) for _ in range(args.repeats)], heavy_paths)
+        report("With the scheduler", [cold_start(light_paths, True, temp_dir) for _ in range(args.repeats)], light_paths)
@@ -0,0 +1,29 @@
+import argparse
+from web_app.app.database.init_db import SessionLocal, init_db
+from web_app.app.utils.rescoring import rescore_history
+from web_app.app.utils.scoring import DEFAULT_CUSTOM_WEIGHTS, NORMALIZATION_METHODS
+from web_app.app.utils.scoring_baseline import SCORING_MODE, scored_metrics, update_scoring_baseline
+
+# Recomputes every overall score in the database from the stored raw subscores, e.g. after changing weights:
+# python3 script_to_rescore_benchmark_history.py --weighting custom --normalization min_max
+# or, to recompute the scoring baseline from the whole history and rescore everything against it:
+# python3 script_to_rescore_benchmark_history.py --normalization baseline --refresh-baseline
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore the whole benchmark history stored in the database.")
+    parser.add_argument("--weighting", choices=["equal_weighting", "custom"], default="custom", help="Use equal weights or DEFAULT_CUSTOM_WEIGHTS.")
+    parser.add_argument("--normalization", choices=NORMALIZATION_METHODS, default="baseline" if SCORING_MODE == "baseline" else "min_max",
+                        help="How each metric is normalized: within a run, or against the stored scoring baseline.")
+    parser.add_argument("--refresh-baseline", action="store_true", help="Recompute every metric's baseline bounds, settled ones included.")
+    args = parser.parse_args()
+    init_db()
+    db = SessionLocal()
+    try:
+        weights = DEFAULT_CUSTOM_WEIGHTS if args.weighting == "custom" else None
+        if args.normalization == "baseline":
+            update_scoring_baseline(db, scored_metrics(db, weights), refresh=args.refresh_baseline)
+            db.commit()
+        number_of_rows = rescore_history(db, weights=weights, method=args.normalization)
+    finally:
+        db.close()
+    print(f"Rescored {number_of_rows} overall score rows.")
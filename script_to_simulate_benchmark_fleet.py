@@ -0,0 +1,87 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from web_app.app.utils.fleet_simulator import simulated_fleet, simulate_run, score_run, write_inventory, write_playbook_outputs
+
+# Simulates a fleet of benchmarked hosts, without any real hosts:
+# - write an inventory and months of history into the database configured in .env:
+#   python3 script_to_simulate_benchmark_fleet.py history --hosts 200 --runs 500 --inventory-file simulated_inventory.ini
+# - stand in for ansible-playbook, so the scheduler's job() runs end to end against the simulated fleet:
+#   ANSIBLE_PLAYBOOK_COMMAND="python3 script_to_simulate_benchmark_fleet.py playbook" ANSIBLE_INVENTORY_FILE_PATH=simulated_inventory.ini \
+#   BENCHMARK_RESULTS_DIRECTORY=/tmp/simulated_results uvicorn web_app.app.main:app
+
+
+def read_inventory_hostnames(file_path):
+    with open(file_path) as f:
+        return {line.split()[0]: line.split("ansible_host=")[1].split()[0] for line in f if "ansible_host=" in line}
+
+
+def simulate_history(args):
+    from web_app.app.database.init_db import SessionLocal, init_db
+    from web_app.app.utils.ingest import ingest_data
+    from web_app.app.utils.rollups import refresh_stale_rollups
+    host_to_ip = simulated_fleet(args.hosts)
+    if args.inventory_file:
+        write_inventory(args.inventory_file, host_to_ip)
+    rng = random.Random(args.seed)
+    init_db()
+    start_datetime = datetime.now() - timedelta(hours=args.interval_hours * args.runs)
+    start_time = time.perf_counter()
+    for run_index in range(args.runs):
+        raw_data = simulate_run(host_to_ip, rng, args.trials)
+        db = SessionLocal()
+        try:
+            ingest_data(db, raw_data, score_run(raw_data), start_datetime + timedelta(hours=args.interval_hours * run_index), host_to_ip)
+        finally:
+            db.close()
+    db = SessionLocal()
+    try:
+        refresh_stale_rollups(db)  # As the scheduler's maintenance pass would
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"Ingested {args.runs} runs of {args.hosts} hosts in {elapsed:.1f}s ({args.runs * args.hosts / elapsed:,.0f} host results/s).")
+
+
+def simulate_playbook(args):
+    # Accepts the scheduler's ansible-playbook command line and writes the files the playbook would
+    extra_vars = dict(extra_var.split("=", 1) for extra_var in args.extra_vars)
+    host_to_ip = read_inventory_hostnames(args.inventory)
+    if args.limit is not None:
+        limit = args.limit.split(",")
+        # Like Ansible, a limit without localhost skips the localhost plays that write the result files
+        if "localhost" not in limit:
+            print(f"Skipped the localhost plays: localhost is not in --limit {args.limit}.")
+            return
+        host_to_ip = {hostname: ip_address for hostname, ip_address in host_to_ip.items() if hostname in limit}
+    if "shard_hosts" in extra_vars:
+        host_to_ip = {hostname: host_to_ip[hostname] for hostname in extra_vars["shard_hosts"].split(",") if hostname in host_to_ip}
+    raw_data = simulate_run(host_to_ip, random.Random(args.seed), int(extra_vars.get("benchmark_trials", 1)))
+    write_playbook_outputs(raw_data, host_to_ip, extra_vars.get("combined_results_file"), extra_vars.get("overall_results_file"),
+                           extra_vars.get("ndjson_results_file"))
+    print(f"Simulated a benchmark run of {len(raw_data)} hosts.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate benchmark results for a fleet of hosts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    history_parser = subparsers.add_parser("history", help="Ingest simulated runs into the configured database.")
+    history_parser.add_argument("--hosts", type=int, default=100, help="Number of simulated hosts.")
+    history_parser.add_argument("--runs", type=int, default=100, help="Number of runs, ending now.")
+    history_parser.add_argument("--interval-hours", type=float, default=6, help="Time between runs.")
+    history_parser.add_argument("--trials", type=int, default=1, help="Trials per metric, as with BENCHMARK_TRIALS.")
+    history_parser.add_argument("--seed", type=int, default=42)
+    history_parser.add_argument("--inventory-file", default=None, help="Also write an Ansible inventory of the simulated hosts.")
+    playbook_parser = subparsers.add_parser("playbook", help="Stand in for ansible-playbook (takes the same arguments the scheduler passes).")
+    playbook_parser.add_argument("playbook_file", nargs="?")
+    playbook_parser.add_argument("-i", "--inventory", required=True)
+    playbook_parser.add_argument("-e", "--extra-vars", action="append", default=[])
+    playbook_parser.add_argument("-l", "--limit", default=None)
+    playbook_parser.add_argument("-v", "--verbose", action="count", default=0)
+    playbook_parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.command == "history":
+        simulate_history(args)
+    else:
+        simulate_playbook(args)
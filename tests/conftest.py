@@ -0,0 +1,37 @@
+import os
+import tempfile
+import pytest
+
+# The app reads its settings and creates its engines when first imported, and conftest.py is loaded before any test
+# module, so the throwaway database is configured here. The logger writes cloud_benchmarker.log and old_logs/ to the
+# working directory, which moves along.
+TEST_DIRECTORY = tempfile.mkdtemp(prefix="cloud_benchmarker_tests_")
+os.environ["SQLALCHEMY_ENGINE_CONNECTION_STRING"] = f"sqlite:///{os.path.join(TEST_DIRECTORY, 'cloud_benchmarker.sqlite')}"
+os.environ["ASYNC_SQLALCHEMY_ENGINE_CONNECTION_STRING"] = ""
+os.environ["ARCHIVE_DIRECTORY"] = os.path.join(TEST_DIRECTORY, "benchmark_archive")
+os.environ["ARCHIVE_RETENTION_DAYS"] = "0"
+os.environ["SCHEDULER_ENABLED"] = "False"
+os.chdir(TEST_DIRECTORY)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from web_app.app.database.init_db import init_db, engine
+    init_db()
+    yield
+    engine.dispose()
+
+
+@pytest.fixture
+def db():
+    # A session on the test database; every table is emptied afterwards
+    from web_app.app.database.data_models import Base
+    from web_app.app.database.init_db import SessionLocal, engine
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
@@ -0,0 +1,62 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import select
+from web_app.app.database.bulk_upsert import upsert_rows, _upsert_rows_one_at_a_time
+from web_app.app.database.data_models import LatestHostScore, RawBenchmarkSubscores
+from web_app.app.database.hosts import register_hosts, with_host_ids
+
+
+def latest_row(moment, overall_score):
+    return {"hostname": "web-1.example.com", "IP_address": "10.0.0.1", "datetime": moment, "overall_score": overall_score}
+
+
+def stored_latest(db):
+    db.expire_all()
+    return db.execute(select(LatestHostScore.datetime, LatestHostScore.overall_score)).one()
+
+
+# The native ON CONFLICT statement and the row-by-row fallback for other dialects must agree
+UPSERTS = [upsert_rows, _upsert_rows_one_at_a_time]
+
+
+@pytest.mark.parametrize("upsert", UPSERTS)
+def test_older_row_does_not_overwrite_newer_one(db, upsert):
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 2), 80.0)], ["hostname"], only_if_not_older_column="datetime")
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 1), 10.0)], ["hostname"], only_if_not_older_column="datetime")
+    db.commit()
+    assert stored_latest(db) == (datetime(2024, 1, 2), 80.0)
+
+
+@pytest.mark.parametrize("upsert", UPSERTS)
+def test_newer_or_equal_row_overwrites(db, upsert):
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 1), 10.0)], ["hostname"], only_if_not_older_column="datetime")
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 2), 80.0)], ["hostname"], only_if_not_older_column="datetime")
+    db.commit()
+    assert stored_latest(db) == (datetime(2024, 1, 2), 80.0)
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 2), 90.0)], ["hostname"], only_if_not_older_column="datetime")
+    db.commit()
+    assert stored_latest(db) == (datetime(2024, 1, 2), 90.0)
+
+
+@pytest.mark.parametrize("upsert", UPSERTS)
+def test_without_only_if_not_older_column_the_last_row_wins(db, upsert):
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 2), 80.0)], ["hostname"])
+    upsert(db, LatestHostScore, [latest_row(datetime(2024, 1, 1), 10.0)], ["hostname"])
+    db.commit()
+    assert stored_latest(db) == (datetime(2024, 1, 1), 10.0)
+
+
+def test_fact_rows_are_keyed_on_datetime_and_host_id(db):
+    rows = [{"datetime": datetime(2024, 1, 1), "hostname": hostname, "IP_address": "10.0.0.1", "cpu_speed_test__events_per_second": 1000.0}
+            for hostname in ("web-1.example.com", "web-2.example.com")]
+    host_ids = register_hosts(db, rows)
+    assert upsert_rows(db, RawBenchmarkSubscores, with_host_ids(rows, host_ids), ["datetime", "host_id"]) == 2
+    rows[0]["cpu_speed_test__events_per_second"] = 2000.0
+    upsert_rows(db, RawBenchmarkSubscores, with_host_ids(rows, host_ids), ["datetime", "host_id"], chunk_size=1)
+    db.commit()
+    stored = dict(db.execute(select(RawBenchmarkSubscores.host_id, RawBenchmarkSubscores.cpu_speed_test__events_per_second)).all())
+    assert stored == {host_ids["web-1.example.com"]: 2000.0, host_ids["web-2.example.com"]: 1000.0}
+
+
+def test_no_rows(db):
+    assert upsert_rows(db, LatestHostScore, [], ["hostname"], only_if_not_older_column="datetime") == 0
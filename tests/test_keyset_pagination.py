@@ -0,0 +1,65 @@
+import base64
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from web_app.app.database.data_models import RawBenchmarkSubscores
+from web_app.app.main import app
+from web_app.app.utils.ingest import build_ingest_rows, stage_ingest_rows
+from web_app.app.utils.keyset_pagination import encode_cursor, decode_cursor, build_keyset_query
+
+HOSTNAMES = ["web-1.example.com", "web-2.example.com", "db-1.example.com"]
+
+
+def ingest_runs(db, number_of_runs):
+    # Every host of a run shares its datetime, so pages have to break ties on the id
+    for run_index in range(number_of_runs):
+        raw_data = {hostname: {"cpu_speed_test__events_per_second": 1000.0 + run_index} for hostname in HOSTNAMES}
+        stage_ingest_rows(db, *build_ingest_rows(raw_data, {hostname: 50.0 for hostname in HOSTNAMES}, datetime(2024, 1, 1) + timedelta(hours=run_index), {}))
+    db.commit()
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 1, 2, 3, 4, 5, 678901)
+    assert decode_cursor(encode_cursor(moment, 42)) == (moment, 42)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode("2024-01-01T00:00:00"), encode("2024-01-01T00:00:00|abc"), encode("yesterday|1"),
+                                    encode("2024-01-01T00:00:00|1|2"), base64.urlsafe_b64encode(b"\xff\xfe|1").decode()])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_row_once(db):
+    ingest_runs(db, 3)
+    columns = ["id", "datetime", "hostname"]
+    all_rows = db.execute(build_keyset_query(RawBenchmarkSubscores, columns)).all()
+    assert len(all_rows) == 9
+    pages, cursor = [], None
+    while rows := db.execute(build_keyset_query(RawBenchmarkSubscores, columns, cursor=cursor).limit(2)).all():
+        pages += rows
+        cursor = encode_cursor(rows[-1].datetime, rows[-1].id)
+    assert pages == all_rows
+
+
+def test_api_follows_next_cursor(db):
+    ingest_runs(db, 3)
+    client = TestClient(app)
+    response = client.get("/data/raw/", params={"limit": 4})
+    rows = response.json()
+    while "X-Next-Cursor" in response.headers:
+        response = client.get("/data/raw/", params={"limit": 4, "cursor": response.headers["X-Next-Cursor"]})
+        rows += response.json()
+    assert len(rows) == 9
+    assert len({row["id"] for row in rows}) == 9
+    assert [(row["datetime"], row["id"]) for row in rows] == sorted((row["datetime"], row["id"]) for row in rows)
+    assert {row["hostname"] for row in rows} == set(HOSTNAMES)
+
+
+def test_api_rejects_invalid_cursor(db):
+    response = TestClient(app).get("/data/raw/", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,88 @@
+import json
+from sqlalchemy import select, func
+from web_app.app.database.data_models import RawBenchmarkSubscores, IngestFileOffset
+from web_app.app.utils.ingest import ingest_ndjson_results
+from web_app.app.utils.results_format import read_ndjson_records, massage_combined_results_content
+
+
+def record_line(run_id, hostname, run_hosts=1, timestamp="2024-01-01T00:00:00Z"):
+    record = {"run_id": run_id, "timestamp": timestamp, "run_hosts": run_hosts, "hostname": hostname, "ip_address": "10.0.0.1",
+              "metrics": {"cpu_speed_test__events_per_second": 1000.0, "fileio_test__reads_per_second": 500.0,
+                          "memory_speed_test__MiB_transferred": 2000.0, "mutex_test__avg_latency": 1.5, "threads_test__avg_latency": 0.5},
+              "duration_seconds": 60}
+    return json.dumps(record) + "\n"
+
+
+def write(path, content, mode="a"):
+    with open(path, mode) as f:
+        f.write(content)
+
+
+def test_read_resumes_from_offset(tmp_path):
+    path = tmp_path / "results.ndjson"
+    write(path, record_line("run-1", "web-1.example.com") + record_line("run-2", "web-2.example.com"))
+    records, offset = read_ndjson_records(path, 0, 1)
+    assert [record["hostname"] for record in records] == ["web-1.example.com"]
+    records, offset = read_ndjson_records(path, offset, 10)
+    assert [record["hostname"] for record in records] == ["web-2.example.com"]
+    assert offset == path.stat().st_size
+    assert read_ndjson_records(path, offset, 10) == ([], offset)
+
+
+def test_partial_trailing_line_is_left_for_the_next_read(tmp_path):
+    path = tmp_path / "results.ndjson"
+    first_line = record_line("run-1", "web-1.example.com")
+    second_line = record_line("run-2", "web-2.example.com")
+    write(path, first_line + second_line[:20])
+    records, offset = read_ndjson_records(path, 0, 10)
+    assert len(records) == 1
+    assert offset == len(first_line.encode())
+    write(path, second_line[20:])
+    records, offset = read_ndjson_records(path, offset, 10)
+    assert [record["hostname"] for record in records] == ["web-2.example.com"]
+    assert offset == path.stat().st_size
+
+
+def test_incomplete_run_is_held_back(tmp_path):
+    path = tmp_path / "results.ndjson"
+    write(path, record_line("run-1", "web-1.example.com", run_hosts=2))
+    assert read_ndjson_records(path, 0, 10) == ([], 0)
+    write(path, record_line("run-1", "web-2.example.com", run_hosts=2))
+    records, _ = read_ndjson_records(path, 0, 10)
+    assert len(records) == 2
+
+
+def test_malformed_line_is_skipped(tmp_path):
+    path = tmp_path / "results.ndjson"
+    write(path, "{not json\n" + record_line("run-1", "web-1.example.com"))
+    records, offset = read_ndjson_records(path, 0, 10)
+    assert [record["hostname"] for record in records] == ["web-1.example.com"]
+    assert offset == path.stat().st_size
+
+
+def test_truncated_file_is_read_from_the_start(tmp_path):
+    path = tmp_path / "results.ndjson"
+    write(path, record_line("run-1", "web-1.example.com"))
+    records, offset = read_ndjson_records(path, 10_000, 10)
+    assert len(records) == 1
+    assert offset == path.stat().st_size
+
+
+def test_legacy_combined_results_with_dotted_and_dashed_hostnames():
+    content = 'web-1.example.com: {"cpu_speed_test__events_per_second": 1},db_2: {"cpu_speed_test__events_per_second": 2}'
+    assert massage_combined_results_content(content) == {"web-1.example.com": {"cpu_speed_test__events_per_second": 1},
+                                                         "db_2": {"cpu_speed_test__events_per_second": 2}}
+
+
+def test_ingest_only_parses_new_records(db, tmp_path):
+    path = tmp_path / "results.ndjson"
+    write(path, record_line("run-1", "web-1.example.com") + record_line("run-2", "web-1.example.com", timestamp="2024-01-02T00:00:00Z"))
+    assert ingest_ndjson_results(db, str(path)) == 2
+    assert db.get(IngestFileOffset, str(path)).byte_offset == path.stat().st_size
+    assert ingest_ndjson_results(db, str(path)) == 0
+    third_line = record_line("run-3", "web-1.example.com", timestamp="2024-01-03T00:00:00Z")
+    write(path, third_line[:30])
+    assert ingest_ndjson_results(db, str(path)) == 0
+    write(path, third_line[30:])
+    assert ingest_ndjson_results(db, str(path)) == 1
+    assert db.scalar(select(func.count()).select_from(RawBenchmarkSubscores)) == 3
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from web_app.app.utils.scoring import score_matrix, score_hosts, normalize_matrix, metric_directions
+
+# One higher-is-better and one lower-is-better metric
+METRICS = ["cpu_speed_test__events_per_second", "mutex_test__avg_latency"]
+
+
+def test_lower_is_better_metrics_are_inverted():
+    values = [[2000.0, 1.0], [1000.0, 3.0]]
+    assert score_matrix(values, METRICS).tolist() == [100.0, 0.0]
+    assert score_matrix(values, METRICS, method="z_score").tolist() == [1.0, -1.0]
+
+
+def test_unregistered_metrics_are_higher_is_better():
+    assert metric_directions(["site_specific_test__score"]).tolist() == [1.0]
+    assert score_matrix([[1.0], [2.0]], ["site_specific_test__score"]).tolist() == [0.0, 100.0]
+
+
+def test_failed_subtest_drops_out_of_the_weighted_average():
+    values = [[2000.0, 1.0], [1000.0, np.nan], [1500.0, 3.0]]
+    scores = score_matrix(values, METRICS, weights={METRICS[0]: 3.0, METRICS[1]: 1.0})
+    # The failed latency does not count as zero, and does not move the other hosts' latency range either
+    assert scores.tolist() == [100.0, 0.0, pytest.approx(37.5)]
+
+
+def test_host_without_any_usable_metric_scores_nan():
+    scores = score_matrix([[2000.0, 1.0], [np.nan, np.nan]], METRICS)
+    assert scores[0] == 100.0
+    assert np.isnan(scores[1])
+
+
+def test_nan_stays_nan_after_normalization():
+    normalized = normalize_matrix([[1.0], [np.nan], [3.0]], np.array([1.0]))
+    assert normalized[0, 0] == 0.0 and np.isnan(normalized[1, 0]) and normalized[2, 0] == 100.0
+
+
+def test_metric_without_spread_scores_100():
+    assert score_matrix([[1000.0, 1.0], [1000.0, 1.0]], METRICS).tolist() == [100.0, 100.0]
+
+
+def test_runs_are_normalized_separately():
+    values = [[2000.0, 1.0], [1000.0, 3.0], [20.0, 10.0], [10.0, 30.0]]
+    assert score_matrix(values, METRICS, run_labels=["a", "a", "b", "b"]).tolist() == [100.0, 0.0, 100.0, 0.0]
+
+
+def test_baseline_bounds_apply_direction_and_drop_metrics_without_bounds():
+    bounds = (np.array([1000.0, np.nan]), np.array([3000.0, np.nan]))
+    assert score_matrix([[2000.0, 1.0], [4000.0, 9.0]], METRICS, method="baseline", bounds=bounds).tolist() == [50.0, 150.0]
+    bounds = (np.array([1000.0, 1.0]), np.array([3000.0, 5.0]))
+    assert score_matrix([[3000.0, 2.0]], METRICS, method="baseline", bounds=bounds).tolist() == [pytest.approx(87.5)]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        score_matrix([[1.0, 1.0]], METRICS, method="median")
+    with pytest.raises(ValueError):
+        score_matrix([[1.0, 1.0]], METRICS, method="baseline")
+    with pytest.raises(ValueError):
+        score_matrix([[1.0, 1.0]], METRICS, weights={"unknown_metric": 1.0})
+
+
+def test_score_hosts_sorts_best_first_and_nan_last():
+    data = {"slow": {METRICS[0]: 1000.0, METRICS[1]: 3.0}, "failed": {}, "fast": {METRICS[0]: 2000.0, METRICS[1]: 1.0}}
+    assert list(score_hosts(data)) == ["fast", "slow", "failed"]
@@ -1,56 +1,264 @@
-from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore, BenchmarkMetric, BenchmarkAlert
+from web_app.app.database.init_db import SessionLocal
+from web_app.app.database.hosts import current_ip_addresses, host_conditions, select_columns
 from web_app.app.logger_config import setup_logger
+from web_app.app.utils.downsampling import minmax_downsample
+from web_app.app.utils.chart_cache import chart_cache, CHART_POINTS_PER_HOST
+from web_app.app.utils.rollup_resolutions import choose_rollup_resolution
+from web_app.app.utils.rollups import load_rollup_chart_frame, rollups_pay_off, time_range
+from web_app.app.utils.extended_metrics import load_extended_metrics, pivot_extended_metrics
+from web_app.app.utils.metric_registry import column_metrics, sort_metrics
+from web_app.app.utils.worker_pools import render_pool, run_in_pool
+from web_app.app.utils.archive import is_archived, read_archived_frame
+from web_app.app.utils.instrumentation import CHART_RENDER_SECONDS
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from decouple import config
+import gzip
+import hashlib
+import json
+import time
 import warnings
 
 warnings.filterwarnings('ignore', 'The behavior of DatetimeProperties.to_pydatetime is deprecated')
 
 logger = setup_logger()
-MAX_DATA_POINTS_FOR_CHART = config("MAX_DATA_POINTS_FOR_CHART", cast=int)
+SUBSCORE_COLUMNS = column_metrics()
+SERIES_SIGNIFICANT_DIGITS = 6
 
 
-async def generate_benchmark_charts(db: Session):
-    logger.info("Generating benchmark charts.")
+def load_chart_frame(db: Session, model, value_columns, start=None, end=None, hostnames=None):
+    # Only the plotted columns are selected, and the time window is applied in SQL
+    query = select_columns(model, ['datetime', 'hostname'] + value_columns)
+    if hostnames is not None:
+        query = query.where(*host_conditions(model, hostnames))
+    if start is not None:
+        query = query.where(model.datetime >= start)
+    if end is not None:
+        query = query.where(model.datetime <= end)
+    df = pd.DataFrame(db.execute(query).all(), columns=['datetime', 'hostname'] + value_columns)
+    if is_archived(model):
+        archived_df = read_archived_frame(model, list(df.columns), start, end, hostnames)
+        df = pd.concat([archived_df, df], ignore_index=True) if not archived_df.empty else df
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    return with_latest_ip_addresses(db, df)
+
+
+def chart_resolution(db: Session, model, start, end, points, hostnames=None):
+    # Ranges long enough to fill `points` buckets of a rollup resolution read bucket means instead of every raw row,
+    # as long as that reads fewer rows; None charts the raw rows
+    range_start, range_end = time_range(db, model)
+    if range_start is None:
+        return None
+    window_start, window_end = max(start or range_start, range_start), min(end or range_end, range_end)
+    resolution = choose_rollup_resolution(window_start, window_end, points)
+    if resolution is None or not rollups_pay_off(db, model, resolution, window_start, window_end, hostnames):
+        return None
+    return resolution
+
+
+def load_chart_frame_for_range(db: Session, model, value_columns, start, end, points, hostnames=None):
+    resolution = chart_resolution(db, model, start, end, points, hostnames)
+    if resolution is None:
+        return load_chart_frame(db, model, value_columns, start, end, hostnames)
+    logger.info(f"Charting {model.__tablename__} from {resolution} rollups.")
+    return with_latest_ip_addresses(db, load_rollup_chart_frame(db, model, resolution, start, end, hostnames))
+
+
+def with_latest_ip_addresses(db: Session, df):
+    # Rows carry their host's current IP address rather than the one stored with them, so an address change never splits a series
+    ip_addresses = df['hostname'].map(current_ip_addresses(db)).fillna('UNKNOWN')
+    if 'IP_address' in df.columns:
+        df['IP_address'] = ip_addresses
+    else:
+        df.insert(2, 'IP_address', ip_addresses)
+    return df
+
+
+def load_extended_chart_frame(db: Session, start, end, points, hostnames=None):
+    # Same as load_chart_frame_for_range, for whichever metrics of benchmark_metrics have data in the window
+    if time_range(db, BenchmarkMetric)[0] is None:
+        return pd.DataFrame(columns=['datetime', 'hostname', 'IP_address'])
+    resolution = chart_resolution(db, BenchmarkMetric, start, end, points, hostnames)
+    if resolution is None:
+        df = pivot_extended_metrics(load_extended_metrics(db, hostnames, start, end))
+    else:
+        logger.info(f"Charting {BenchmarkMetric.__tablename__} from {resolution} rollups.")
+        df = load_rollup_chart_frame(db, BenchmarkMetric, resolution, start, end, hostnames)
+    return with_latest_ip_addresses(db, df)
+
+
+def load_alert_frame(db: Session, start=None, end=None, hostnames=None):
+    query = select(BenchmarkAlert.datetime, BenchmarkAlert.hostname, BenchmarkAlert.IP_address, BenchmarkAlert.metric, BenchmarkAlert.value,
+                   BenchmarkAlert.robust_z_score)
+    if hostnames is not None:
+        query = query.where(BenchmarkAlert.hostname.in_(list(hostnames)))
+    if start is not None:
+        query = query.where(BenchmarkAlert.datetime >= start)
+    if end is not None:
+        query = query.where(BenchmarkAlert.datetime <= end)
+    return with_latest_ip_addresses(db, pd.DataFrame(db.execute(query).all(), columns=['datetime', 'hostname', 'IP_address', 'metric', 'value', 'robust_z_score']))
+
+
+async def generate_benchmark_charts(generation, start=None, end=None, points=CHART_POINTS_PER_HOST, if_none_match=None):
+    # Rendered HTML only changes when new data is ingested, so it is cached per parameters and ingest generation
+    start_time = time.perf_counter()
+    cache_key = (start, end, points, generation)
+    # The generation is shared through the database, so every worker computes the same ETag
+    etag = '"' + hashlib.sha1(repr(cache_key).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        CHART_RENDER_SECONDS.labels(outcome="not_modified").observe(time.perf_counter() - start_time)
+        return Response(status_code=304, headers=headers)
+    html_content_string = chart_cache.get(cache_key)
+    if html_content_string is None:
+        html_content_string = await run_in_pool(render_pool, render_benchmark_charts_in_new_session, start, end, points)
+        chart_cache.put(cache_key, html_content_string)
+        outcome = "rendered"
+    else:
+        logger.info(f"Serving benchmark charts for window {start} - {end} from the chart cache.")
+        outcome = "cache_hit"
+    CHART_RENDER_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - start_time)
+    return HTMLResponse(content=html_content_string, headers=headers)
+
+
+async def generate_benchmark_series(generation, hostnames=None, metrics=None, start=None, end=None, points=CHART_POINTS_PER_HOST,
+                                    if_none_match=None, accept_encoding=""):
+    # Cached and revalidated like the rendered charts; the JSON is gzipped once and stored that way
+    cache_key = ("series", tuple(sorted(hostnames or ())), tuple(sorted(metrics or ())), start, end, points, generation)
+    etag = '"' + hashlib.sha1(repr(cache_key).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    compressed_content = chart_cache.get(cache_key)
+    if compressed_content is None:
+        compressed_content = await run_in_pool(render_pool, render_benchmark_series_in_new_session, hostnames, metrics, start, end, points)
+        chart_cache.put(cache_key, compressed_content)
+    if "gzip" in accept_encoding:
+        return Response(content=compressed_content, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=gzip.decompress(compressed_content), media_type="application/json", headers=headers)
+
+
+def render_benchmark_series_in_new_session(hostnames, metrics, start, end, points):
+    db = SessionLocal()
+    try:
+        series = build_benchmark_series(db, hostnames, metrics, start, end, points)
+    finally:
+        db.close()
+    return gzip.compress(json.dumps(series, separators=(",", ":")).encode(), compresslevel=6)
+
+
+def significant_digits(values, digits):
+    # Shorter JSON numbers; benchmark results are nowhere near this precise
+    magnitudes = np.floor(np.log10(np.abs(np.where(values == 0, 1, values))))
+    scales = 10.0 ** (digits - 1 - np.nan_to_num(magnitudes))
+    return np.round(values * scales) / scales
+
+
+def columnar_series(long_df, value_columns):
+    # {hostname: {metric: [epoch seconds, *value columns]}}, one array per column instead of one object per point
+    series = {}
+    if long_df.empty:
+        return series
+    long_df = long_df.sort_values(['hostname', 'metric', 'datetime'])
+    timestamps = (long_df['datetime'].to_numpy(dtype='datetime64[s]').astype('int64')).tolist()
+    values = [significant_digits(long_df[column].to_numpy(dtype=float), SERIES_SIGNIFICANT_DIGITS).tolist() for column in value_columns]
+    for (hostname, metric), positions in long_df.groupby(['hostname', 'metric'], sort=False).indices.items():
+        first, last = positions[0], positions[-1] + 1  # Rows of a series are contiguous after the sort
+        series.setdefault(hostname, {})[metric] = [timestamps[first:last]] + [column_values[first:last] for column_values in values]
+    return series
+
+
+def build_benchmark_series(db: Session, hostnames=None, metrics=None, start=None, end=None, points=CHART_POINTS_PER_HOST):
+    """Return the downsampled series of every requested host and metric as compact columnar JSON.
+
+    Subscores, extended metrics and the overall score (as the `overall_score` metric) are all included, so a client
+    can switch metrics without another request. Every series is `[timestamps, values]`, and every regression marker
+    list is `[timestamps, values, robust z-scores]`.
+    """
+    logger.info(f"Building benchmark series for window {start} - {end} with {points} points per host.")
+    raw_df = load_chart_frame_for_range(db, RawBenchmarkSubscores, SUBSCORE_COLUMNS, start, end, points, hostnames)
+    extended_df = load_extended_chart_frame(db, start, end, points, hostnames)
+    extended_columns = [col for col in extended_df.columns if col not in ('datetime', 'hostname', 'IP_address')]
+    overall_df = load_chart_frame_for_range(db, OverallNormalizedScore, ['overall_score'], start, end, points, hostnames)
+    long_df = pd.concat([minmax_downsample(raw_df, SUBSCORE_COLUMNS, points), minmax_downsample(extended_df, extended_columns, points),
+                         minmax_downsample(overall_df, ['overall_score'], points)], ignore_index=True)
+    alert_df = load_alert_frame(db, start, end, hostnames)
+    if metrics:
+        long_df = long_df[long_df['metric'].isin(metrics)]
+        alert_df = alert_df[alert_df['metric'].isin(metrics)]
+    host_to_ip = current_ip_addresses(db, hostnames)
+    series = columnar_series(long_df, ['value'])
+    alerts = columnar_series(alert_df, ['value', 'robust_z_score'])
+    return {
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "points": points,
+        "metrics": sort_metrics(long_df['metric'].unique()),
+        "hosts": {hostname: {"ip_address": host_to_ip.get(hostname) or "UNKNOWN", "series": series.get(hostname, {}), "alerts": alerts.get(hostname, {})}
+                  for hostname in sorted(set(series) | set(alerts))},
+    }
+
+
+def render_benchmark_charts_in_new_session(start, end, points):
+    # Runs on a render pool thread, which must not share the request's session
+    db = SessionLocal()
+    try:
+        return render_benchmark_charts_html(db, start, end, points)
+    finally:
+        db.close()
+
+
+def render_benchmark_charts_html(db: Session, start, end, points):
+    logger.info(f"Generating benchmark charts for window {start} - {end} with {points} points per host.")
     
-    # Query for raw benchmark subscores
-    raw_stats = db.query(RawBenchmarkSubscores).order_by(RawBenchmarkSubscores.datetime.desc()).limit(MAX_DATA_POINTS_FOR_CHART).all()
-    raw_stats_dict = [{column.name: getattr(s, column.name) for column in RawBenchmarkSubscores.__table__.columns} for s in raw_stats]
-    raw_df = pd.DataFrame(raw_stats_dict)
-    raw_df['datetime'] = pd.to_datetime(raw_df['datetime'])
+    # Query raw benchmark subscores for the window and reduce each host's series to a fixed number of points
+    raw_df = load_chart_frame_for_range(db, RawBenchmarkSubscores, SUBSCORE_COLUMNS, start, end, points)
+    extended_df = load_extended_chart_frame(db, start, end, points)
+    extended_columns = [col for col in extended_df.columns if col not in ('datetime', 'hostname', 'IP_address')]
+    raw_long_df = pd.concat([minmax_downsample(raw_df, SUBSCORE_COLUMNS, points), minmax_downsample(extended_df, extended_columns, points)],
+                            ignore_index=True)
     
     subscore_fig = go.Figure()
     
     # Adding traces
-    for ip in raw_df['IP_address'].unique():
-        filtered_df = raw_df[raw_df['IP_address'] == ip]
-        for col in ['cpu_speed_test__events_per_second', 'fileio_test__reads_per_second', 'memory_speed_test__MiB_transferred', 'mutex_test__avg_latency', 'threads_test__avg_latency']:
-            subscore_fig.add_trace(
-                go.Scatter(x=filtered_df['datetime'], y=filtered_df[col], mode='lines', name=f"{ip} - {col}",
-                        hovertemplate=f"IP: {ip}<br>Datetime: %{{x}}<br>Metric: %{{y}}",
-                        visible=(col == 'cpu_speed_test__events_per_second'))
-            )
+    for (ip, col), filtered_df in raw_long_df.groupby(['IP_address', 'metric'], sort=False):
+        subscore_fig.add_trace(
+            go.Scatter(x=filtered_df['datetime'], y=filtered_df['value'], mode='lines', name=f"{ip} - {col}",
+                    hovertemplate=f"IP: {ip}<br>Datetime: %{{x}}<br>Metric: %{{y}}",
+                    visible=(col == 'cpu_speed_test__events_per_second'))
+        )
+    
+    # Mark detected regressions; trace names follow the "<ip> - <metric>" pattern so the dropdowns toggle them too
+    alert_df = load_alert_frame(db, start, end)
+    for (ip, col), filtered_df in alert_df.groupby(['IP_address', 'metric'], sort=False):
+        subscore_fig.add_trace(
+            go.Scatter(x=filtered_df['datetime'], y=filtered_df['value'], mode='markers', name=f"{ip} - {col} - regression",
+                    marker=dict(symbol='x', size=11, color='red'), customdata=filtered_df['robust_z_score'],
+                    hovertemplate=f"Regression<br>IP: {ip}<br>Datetime: %{{x}}<br>Metric: %{{y}}<br>Robust z-score: %{{customdata:.1f}}",
+                    visible=(col == 'cpu_speed_test__events_per_second'))
+        )
     
     # Create buttons for dropdown by metric
     buttons_by_metric = []
-    for col in ['cpu_speed_test__events_per_second', 'fileio_test__reads_per_second', 'memory_speed_test__MiB_transferred', 'mutex_test__avg_latency', 'threads_test__avg_latency']:
+    for col in SUBSCORE_COLUMNS + extended_columns:
         buttons_by_metric.append(
             dict(
-                args=[{"visible": [col in trace.name for trace in subscore_fig.data]}],
+                args=[{"visible": [trace.name.split(" - ")[1] == col for trace in subscore_fig.data]}],
                 label=col,
                 method="update"
             )
         )
     # Create buttons for dropdown by IP
     buttons_by_ip = []
-    for ip in raw_df['IP_address'].unique():
+    for ip in raw_long_df['IP_address'].unique():
         buttons_by_ip.append(
             dict(
-                args=[{"visible": [ip in trace.name for trace in subscore_fig.data]}],
+                args=[{"visible": [trace.name.split(" - ")[0] == ip for trace in subscore_fig.data]}],
                 label=ip,
                 method="update"
             )
@@ -82,10 +290,8 @@ async def generate_benchmark_charts(db: Session):
         ]
     )
 
-    overall_stats = db.query(OverallNormalizedScore).order_by(OverallNormalizedScore.datetime.desc()).limit(MAX_DATA_POINTS_FOR_CHART).all()
-    overall_stats_dict = [{column.name: getattr(s, column.name) for column in OverallNormalizedScore.__table__.columns} for s in overall_stats]
-    overall_df = pd.DataFrame(overall_stats_dict)
-    overall_df['datetime'] = pd.to_datetime(overall_df['datetime'])
+    overall_df = load_chart_frame_for_range(db, OverallNormalizedScore, ['overall_score'], start, end, points)
+    overall_df = minmax_downsample(overall_df, ['overall_score'], points).rename(columns={'value': 'overall_score'})
     overall_fig = px.line(overall_df, x='datetime', y='overall_score', color='hostname',
                         labels={'overall_score': 'Overall Score', 'datetime': 'Datetime', 'hostname': 'Machine'},
                         title='Overall Normalized Scores Over Time', markers=True, line_shape='spline')
@@ -110,5 +316,5 @@ async def generate_benchmark_charts(db: Session):
     </div>
     '''
 
-    return HTMLResponse(content=html_content_string)
+    return html_content_string
 
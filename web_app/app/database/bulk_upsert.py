@@ -0,0 +1,67 @@
+from web_app.app.logger_config import setup_logger
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from decouple import config
+
+logger = setup_logger()
+INGEST_BATCH_SIZE = config("INGEST_BATCH_SIZE", default=500, cast=int)
+
+# Dialects that support INSERT ... ON CONFLICT DO UPDATE natively
+UPSERT_INSERT_CONSTRUCTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def chunked(rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def upsert_rows(db: Session, model, rows, conflict_columns, chunk_size=INGEST_BATCH_SIZE, only_if_not_older_column=None):
+    """Insert or update `rows` (a list of dicts) in chunks, keyed on the unique `conflict_columns`.
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE statement per chunk on SQLite and Postgres,
+    and falls back to a per-row lookup on other dialects. With `only_if_not_older_column`, an existing
+    row is only overwritten by a row whose value in that column is at least as large (e.g. a newer datetime).
+    The caller is responsible for committing.
+    """
+    if not rows:
+        return 0
+    insert_construct = UPSERT_INSERT_CONSTRUCTS.get(db.get_bind().dialect.name)
+    if insert_construct is None:
+        return _upsert_rows_one_at_a_time(db, model, rows, conflict_columns, only_if_not_older_column)
+    update_columns = [column for column in rows[0].keys() if column not in conflict_columns]
+    statement = insert_construct(model.__table__)
+    if update_columns:
+        update_condition = None
+        if only_if_not_older_column:
+            update_condition = model.__table__.c[only_if_not_older_column] <= statement.excluded[only_if_not_older_column]
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={column: statement.excluded[column] for column in update_columns},
+            where=update_condition
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_columns)
+    # executemany() lets the driver batch each chunk into multi-row VALUES clauses
+    for chunk in chunked(rows, chunk_size):
+        db.execute(statement, chunk)
+    return len(rows)
+
+
+def _upsert_rows_one_at_a_time(db: Session, model, rows, conflict_columns, only_if_not_older_column=None):
+    logger.warning(f"Dialect {db.get_bind().dialect.name} has no native upsert; falling back to row-by-row ingest.")
+    for row in rows:
+        conditions = {column: row[column] for column in conflict_columns}
+        record = db.query(model).filter_by(**conditions).first()
+        if record and only_if_not_older_column and getattr(record, only_if_not_older_column) > row[only_if_not_older_column]:
+            continue
+        if record:
+            for k, v in row.items():
+                setattr(record, k, v)
+        else:
+            # Sessions do not autoflush, so later rows with the same key (in this call or the next one) would miss it
+            db.add(model(**row))
+            db.flush()
+    return len(rows)
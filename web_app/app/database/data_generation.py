@@ -0,0 +1,33 @@
+from web_app.app.database.data_models import DataGeneration
+from web_app.app.database.bulk_upsert import upsert_rows
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Only the scheduler's leader ingests, but every worker caches charts and series, so the generation lives in the
+# database and is read on each request rather than kept in process memory.
+INGEST_GENERATION_NAME = "ingest"
+
+
+def ingest_generation_query():
+    # (generation, time of the last bump): the time keeps a recreated database, whose counter restarts at 0, from
+    # matching cache entries and ETags of the old one
+    return select(DataGeneration.generation, DataGeneration.updated_at).where(DataGeneration.name == INGEST_GENERATION_NAME)
+
+
+def bump_ingest_generation(db: Session, now=None):
+    """Record that benchmark data changed, after the change is committed (committed). Returns the new generation."""
+    upsert_rows(db, DataGeneration, [{"name": INGEST_GENERATION_NAME}], ["name"])
+    db.execute(update(DataGeneration.__table__).where(DataGeneration.name == INGEST_GENERATION_NAME)
+               .values(generation=DataGeneration.generation + 1, updated_at=now or datetime.now()))
+    db.commit()
+    return get_ingest_generation(db)
+
+
+def get_ingest_generation(db: Session):
+    return tuple(db.execute(ingest_generation_query()).one_or_none() or (0, None))
+
+
+async def read_ingest_generation(db: AsyncSession):
+    return tuple((await db.execute(ingest_generation_query())).one_or_none() or (0, None))
@@ -1,44 +1,242 @@
 from pydantic import BaseModel
-from sqlalchemy import Column, Float, String, DateTime, Integer, UniqueConstraint
+from sqlalchemy import Column, Float, String, DateTime, Integer, UniqueConstraint, Index, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 Base = declarative_base()
 
+class Host(Base):
+    # One row per benchmarked host; fact tables reference it by `host_id`
+    __tablename__ = 'hosts'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hostname = Column(String, nullable=False, unique=True)
+    IP_address = Column(String)  # The most recently seen IP address
+    instance_type = Column(String)  # From the inventory's host variables
+    region = Column(String)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+
+class HostGroupMembership(Base):
+    # Inventory groups ([group] sections of the Ansible inventory) each host belongs to
+    __tablename__ = 'host_groups'
+    host_id = Column(Integer, ForeignKey('hosts.id'), primary_key=True)
+    group_name = Column(String, primary_key=True)
+    __table_args__ = (Index('ix_host_groups_group_name', 'group_name'),)
+
+class HostIPAddress(Base):
+    # Every IP address a host has reported from, with the first and last time it was seen there
+    __tablename__ = 'host_ip_history'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    host_id = Column(Integer, ForeignKey('hosts.id'), nullable=False)
+    IP_address = Column(String, nullable=False)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    __table_args__ = (UniqueConstraint('host_id', 'IP_address', name='uix_host_ip'),)
+
 class RawBenchmarkSubscores(Base):
+    # Rows reference their host by host_id; the hostname is joined from `hosts`. IP_address is the address the run
+    # measured, kept as provenance since a host's address can change between runs.
     __tablename__ = 'raw_benchmark_subscores'
     id = Column(Integer, primary_key=True, autoincrement=True)
     datetime = Column(DateTime, index=True)
-    hostname = Column(String, index=True)
-    IP_address = Column(String, index=True)
+    IP_address = Column(String)
+    host_id = Column(Integer, ForeignKey('hosts.id'), nullable=False)
     cpu_speed_test__events_per_second = Column(Float)
     fileio_test__reads_per_second = Column(Float)
     memory_speed_test__MiB_transferred = Column(Float)
     mutex_test__avg_latency = Column(Float)
     threads_test__avg_latency = Column(Float)
-    __table_args__ = (UniqueConstraint('datetime', 'hostname', name='uix_1'),)
+    updated_at = Column(DateTime)  # Set whenever ingest writes the row, so rows changed in place are checked for regressions again
+    # Archived tables never reuse the ids of rows that were moved to the archive
+    __table_args__ = (UniqueConstraint('datetime', 'host_id', name='uix_1'),
+                      Index('ix_raw_benchmark_subscores_host_id_datetime', 'host_id', 'datetime'),
+                      Index('ix_raw_benchmark_subscores_updated_at_id', 'updated_at', 'id'),
+                      {'sqlite_autoincrement': True})
     
 class OverallNormalizedScore(Base):
     __tablename__ = 'overall_normalized_score'
     id = Column(Integer, primary_key=True, autoincrement=True)
     datetime = Column(DateTime, index=True)
-    hostname = Column(String, index=True)
-    IP_address = Column(String, index=True)
+    IP_address = Column(String)
+    host_id = Column(Integer, ForeignKey('hosts.id'), nullable=False)
     overall_score = Column(Float)
-    __table_args__ = (UniqueConstraint('datetime', 'hostname', name='uix_2'),)
-    
+    __table_args__ = (UniqueConstraint('datetime', 'host_id', name='uix_2'),
+                      Index('ix_overall_normalized_score_host_id_datetime', 'host_id', 'datetime'))
+
+class BenchmarkMetric(Base):
+    # Long format: one row per run, host and metric, for every metric without its own raw_benchmark_subscores column
+    __tablename__ = 'benchmark_metrics'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    datetime = Column(DateTime, nullable=False)
+    host_id = Column(Integer, ForeignKey('hosts.id'), nullable=False)
+    metric = Column(String, nullable=False)
+    value = Column(Float)
+    __table_args__ = (UniqueConstraint('datetime', 'host_id', 'metric', name='uix_metric'),
+                      Index('ix_benchmark_metrics_host_id_datetime', 'host_id', 'datetime'),
+                      Index('ix_benchmark_metrics_datetime', 'datetime'),
+                      {'sqlite_autoincrement': True})
+
+class LatestHostScore(Base):
+    # Most recent subscores and overall score of every host, kept up to date by ingest for O(hosts) leaderboards
+    __tablename__ = 'latest_host_scores'
+    hostname = Column(String, primary_key=True)
+    IP_address = Column(String)
+    datetime = Column(DateTime, index=True)
+    cpu_speed_test__events_per_second = Column(Float)
+    fileio_test__reads_per_second = Column(Float)
+    memory_speed_test__MiB_transferred = Column(Float)
+    mutex_test__avg_latency = Column(Float)
+    threads_test__avg_latency = Column(Float)
+    overall_score = Column(Float, index=True)
+
+class BenchmarkRollup(Base):
+    # Per-host, per-metric aggregates over hourly, daily and weekly buckets (those coarser than the run interval); `datetime` is the bucket start
+    __tablename__ = 'benchmark_rollups'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    resolution = Column(String, nullable=False)
+    datetime = Column(DateTime, nullable=False)
+    hostname = Column(String, nullable=False)
+    metric = Column(String, nullable=False)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    mean_value = Column(Float)
+    p50_value = Column(Float)
+    p95_value = Column(Float)
+    count = Column(Integer)
+    __table_args__ = (UniqueConstraint('resolution', 'hostname', 'metric', 'datetime', name='uix_rollup'),
+                      Index('ix_benchmark_rollups_resolution_datetime', 'resolution', 'datetime'))
+
+class StaleRollupWeek(Base):
+    # A host's week whose rollup buckets new rows have not reached yet; the scheduler's maintenance pass recomputes it
+    __tablename__ = 'stale_rollup_weeks'
+    hostname = Column(String, primary_key=True)
+    week_start = Column(DateTime, primary_key=True)
+    marked_at = Column(DateTime, nullable=False)
+
+class BenchmarkAlert(Base):
+    # A point that is significantly worse than its host's rolling baseline for that metric
+    __tablename__ = 'benchmark_alerts'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    datetime = Column(DateTime, nullable=False, index=True)
+    hostname = Column(String, nullable=False, index=True)
+    IP_address = Column(String)
+    metric = Column(String, nullable=False)
+    value = Column(Float)
+    baseline_median = Column(Float)
+    baseline_mad = Column(Float)
+    robust_z_score = Column(Float)  # How many scaled MADs worse than the baseline median the value is
+    relative_change = Column(Float)
+    detected_at = Column(DateTime)
+    __table_args__ = (UniqueConstraint('hostname', 'metric', 'datetime', name='uix_alert'),)
+
+class BenchmarkTrialStats(Base):
+    # Repeated-trial mode: every trial of one metric on one host in one run, with their spread
+    __tablename__ = 'benchmark_trial_stats'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    datetime = Column(DateTime, nullable=False, index=True)
+    hostname = Column(String, nullable=False, index=True)
+    metric = Column(String, nullable=False)
+    trial_count = Column(Integer)
+    mean = Column(Float)
+    stddev = Column(Float)
+    coefficient_of_variation = Column(Float)
+    median = Column(Float)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    trial_values = Column(String)  # JSON list of the per-trial results, in run order
+    __table_args__ = (UniqueConstraint('datetime', 'hostname', 'metric', name='uix_trial_stats'),)
+
+class DetectionWatermark(Base):
+    # The last source row, by (updated_at, id), a detection stage has already processed
+    __tablename__ = 'detection_watermarks'
+    name = Column(String, primary_key=True)
+    last_updated_at = Column(DateTime)  # None while rows written before updated_at existed are worked through by id
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+class IngestFileOffset(Base):
+    # How far into an append-only results file (e.g. the NDJSON results log) ingest has already read
+    __tablename__ = 'ingest_file_offsets'
+    path = Column(String, primary_key=True)
+    byte_offset = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+class IngestLedgerEntry(Base):
+    # Whole result files (combined subscores, overall score files) that have already been ingested
+    __tablename__ = 'ingest_ledger'
+    path = Column(String, primary_key=True)
+    file_size = Column(Integer)
+    modified_time = Column(Float)
+    content_hash = Column(String)
+    ingested_at = Column(DateTime)
+
+class ScoringBaseline(Base):
+    # Fixed normalization bounds per metric for the `baseline` scoring mode, so overall scores compare across runs
+    __tablename__ = 'scoring_baselines'
+    metric = Column(String, primary_key=True)
+    low = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    sample_count = Column(Integer, nullable=False)  # Bounds from fewer than SCORING_BASELINE_MIN_SAMPLES values are provisional
+    updated_at = Column(DateTime)
+
+class DataGeneration(Base):
+    # A counter bumped after every committed change to the benchmark data, shared by all workers so their caches of
+    # derived data (rendered charts, series) go stale together
+    __tablename__ = 'data_generations'
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+class SchedulerLease(Base):
+    # A named lease that only one process holds at a time, so a single scheduler leads across workers and machines
+    __tablename__ = 'scheduler_leases'
+    name = Column(String, primary_key=True)
+    holder = Column(String)
+    expires_at = Column(DateTime)
+
+class HostSchedule(Base):
+    # When each host is next due for a scheduled benchmark, and how its recent runs went
+    __tablename__ = 'host_schedules'
+    host_id = Column(Integer, ForeignKey('hosts.id'), primary_key=True)
+    next_due_at = Column(DateTime, nullable=False, index=True)
+    last_run_at = Column(DateTime)
+    last_success_at = Column(DateTime)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+
+class BenchmarkRun(Base):
+    # The persistent run queue: one playbook run over a set of hosts, queued by the schedule, a retry or a manual request
+    __tablename__ = 'benchmark_runs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    reason = Column(String, nullable=False)  # scheduled, retry or manual
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded, partial or failed
+    attempt = Column(Integer, nullable=False, default=1)
+    requested_at = Column(DateTime, nullable=False)
+    not_before = Column(DateTime, nullable=False)  # Retries wait out their backoff here
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    return_code = Column(Integer)
+    __table_args__ = (Index('ix_benchmark_runs_status_not_before', 'status', 'not_before'),)
+
+class BenchmarkRunHost(Base):
+    __tablename__ = 'benchmark_run_hosts'
+    run_id = Column(Integer, ForeignKey('benchmark_runs.id'), primary_key=True)
+    host_id = Column(Integer, ForeignKey('hosts.id'), primary_key=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded or failed
+    __table_args__ = (Index('ix_benchmark_run_hosts_host_id', 'host_id'),)
+
 # Pydantic Response Models
 class HistoricalRawBenchmarkSubscoresResponse(BaseModel):
     id: Optional[int]
     datetime: datetime
     hostname: str
+    host_id: Optional[int] = None  # Id in `hosts`; None for rows archived before the hosts table existed
     IP_address: str
-    cpu_speed_test__events_per_second: float
-    fileio_test__reads_per_second: float
-    memory_speed_test__MiB_transferred: float
-    mutex_test__avg_latency: float
-    threads_test__avg_latency: float
+    cpu_speed_test__events_per_second: Optional[float]  # None when that subtest failed on the host
+    fileio_test__reads_per_second: Optional[float]
+    memory_speed_test__MiB_transferred: Optional[float]
+    mutex_test__avg_latency: Optional[float]
+    threads_test__avg_latency: Optional[float]
     class Config:
         from_attributes = True
 
@@ -46,7 +244,127 @@ class HistoricalOverallNormalizedScoresResponse(BaseModel):
     id: Optional[int]
     datetime: datetime
     hostname: str
+    host_id: Optional[int] = None  # Id in `hosts`; None for rows archived before the hosts table existed
     IP_address: str
     overall_score: float
     class Config:
         from_attributes = True
+
+class LatestHostScoreResponse(BaseModel):
+    hostname: str
+    IP_address: Optional[str]
+    datetime: datetime
+    cpu_speed_test__events_per_second: Optional[float]
+    fileio_test__reads_per_second: Optional[float]
+    memory_speed_test__MiB_transferred: Optional[float]
+    mutex_test__avg_latency: Optional[float]
+    threads_test__avg_latency: Optional[float]
+    overall_score: Optional[float]
+    class Config:
+        from_attributes = True
+
+class BenchmarkRollupResponse(BaseModel):
+    id: Optional[int]
+    resolution: str
+    datetime: datetime
+    hostname: str
+    metric: str
+    min_value: Optional[float]
+    max_value: Optional[float]
+    mean_value: Optional[float]
+    p50_value: Optional[float]
+    p95_value: Optional[float]
+    count: int
+    class Config:
+        from_attributes = True
+
+class BenchmarkMetricResponse(BaseModel):
+    id: Optional[int]
+    datetime: datetime
+    hostname: str
+    host_id: Optional[int] = None  # Id in `hosts`; None for rows archived before the hosts table existed
+    metric: str
+    value: Optional[float]
+    class Config:
+        from_attributes = True
+
+class HostResponse(BaseModel):
+    id: int
+    hostname: str
+    IP_address: Optional[str]
+    instance_type: Optional[str]
+    region: Optional[str]
+    groups: List[str]
+    first_seen: Optional[datetime]
+    last_seen: Optional[datetime]
+    class Config:
+        from_attributes = True
+
+class HostIPAddressResponse(BaseModel):
+    hostname: str
+    IP_address: str
+    first_seen: Optional[datetime]
+    last_seen: Optional[datetime]
+    class Config:
+        from_attributes = True
+
+class MetricDefinitionResponse(BaseModel):
+    name: str
+    direction: int
+    unit: str
+    description: str
+    weight: float
+    column: bool
+    class Config:
+        from_attributes = True
+
+class BenchmarkTrialStatsResponse(BaseModel):
+    id: Optional[int]
+    datetime: datetime
+    hostname: str
+    metric: str
+    trial_count: int
+    mean: Optional[float]
+    stddev: Optional[float]
+    coefficient_of_variation: Optional[float]
+    median: Optional[float]
+    min_value: Optional[float]
+    max_value: Optional[float]
+    trial_values: str
+    class Config:
+        from_attributes = True
+
+class BenchmarkAlertResponse(BaseModel):
+    id: Optional[int]
+    datetime: datetime
+    hostname: str
+    IP_address: Optional[str]
+    metric: str
+    value: Optional[float]
+    baseline_median: Optional[float]
+    baseline_mad: Optional[float]
+    robust_z_score: Optional[float]
+    relative_change: Optional[float]
+    detected_at: Optional[datetime]
+    class Config:
+        from_attributes = True
+
+class BenchmarkRunRequest(BaseModel):
+    hostname: List[str] = []
+    group: List[str] = []
+
+class BenchmarkRunHostResponse(BaseModel):
+    hostname: str
+    status: str
+
+class BenchmarkRunResponse(BaseModel):
+    id: int
+    reason: str
+    status: str
+    attempt: int
+    requested_at: datetime
+    not_before: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    return_code: Optional[int]
+    hosts: List[BenchmarkRunHostResponse]
@@ -0,0 +1,202 @@
+from web_app.app.database.data_models import Host, HostGroupMembership, HostIPAddress, RawBenchmarkSubscores, OverallNormalizedScore, BenchmarkMetric
+from web_app.app.database.bulk_upsert import upsert_rows, chunked
+from web_app.app.logger_config import setup_logger
+from sqlalchemy import MetaData, Table, select, update, delete, func, case, bindparam, DateTime, String
+from sqlalchemy.orm import Session
+
+logger = setup_logger()
+HOST_FACT_MODELS = [RawBenchmarkSubscores, OverallNormalizedScore, BenchmarkMetric]  # Tables whose rows carry a host_id
+INVENTORY_HOST_ATTRIBUTES = ["instance_type", "region"]  # Host variables copied from the inventory onto `hosts`
+UNKNOWN_IP_ADDRESS = "UNKNOWN"
+LOOKUP_CHUNK_SIZE = 500
+# Core tables, so the per-host updates below run as plain executemany rather than ORM bulk updates
+hosts_table = Host.__table__
+ip_history_table = HostIPAddress.__table__
+
+
+def load_hosts(db: Session, hostnames):
+    hosts = {}
+    for hostname_chunk in chunked(sorted(hostnames), LOOKUP_CHUNK_SIZE):
+        hosts.update((host.hostname, host) for host in db.execute(select(Host).where(Host.hostname.in_(hostname_chunk))).scalars())
+    return hosts
+
+
+def lookup_host_ids(db: Session, hostnames):
+    host_ids = {}
+    for hostname_chunk in chunked(sorted(hostnames), LOOKUP_CHUNK_SIZE):
+        host_ids.update(db.execute(select(Host.hostname, Host.id).where(Host.hostname.in_(hostname_chunk))).all())
+    return host_ids
+
+
+def insert_missing_hosts(db: Session, hostnames):
+    # Conflict-free inserts, since concurrent ingests may race on the same new hostname
+    upsert_rows(db, Host, [{"hostname": hostname} for hostname in sorted(hostnames)], ["hostname"])
+
+
+def ensure_hosts(db: Session, hostnames):
+    insert_missing_hosts(db, hostnames)
+    return load_hosts(db, hostnames)
+
+
+def earlier(column, value):
+    # Portable min()/max() of a column and a bound value that ignores NULLs in the column
+    return case((column.is_(None) | (column > value), value), else_=column)
+
+
+def later(column, value):
+    return case((column.is_(None) | (column < value), value), else_=column)
+
+
+def register_hosts(db: Session, rows):
+    """Make sure every host of `rows` (dicts with hostname, datetime and, optionally, IP_address) is in `hosts`.
+
+    Tracks first/last seen times and IP history, keeps the newest IP address on the host and returns {hostname: host_id}.
+    Everything is aggregated per host first and written with one executemany per table. Staged, not committed.
+    """
+    seen = {}  # hostname -> [first seen, last seen, last seen at an IP address, that IP address]
+    sightings = {}  # (hostname, IP address) -> [first seen, last seen]
+    for row in rows:
+        moment = row["datetime"]
+        host_seen = seen.setdefault(row["hostname"], [moment, moment, None, None])
+        host_seen[0], host_seen[1] = min(host_seen[0], moment), max(host_seen[1], moment)
+        ip_address = row.get("IP_address")
+        if ip_address and ip_address != UNKNOWN_IP_ADDRESS:
+            ip_seen = sightings.setdefault((row["hostname"], ip_address), [moment, moment])
+            ip_seen[0], ip_seen[1] = min(ip_seen[0], moment), max(ip_seen[1], moment)
+            if host_seen[2] is None or moment > host_seen[2]:
+                host_seen[2], host_seen[3] = moment, ip_address
+    if not seen:
+        return {}
+    insert_missing_hosts(db, seen)
+    host_ids = lookup_host_ids(db, seen)
+    # A host's IP address is whichever it reported from most recently, so late backfills never roll it back
+    newest_known_ip_seen = select(func.max(ip_history_table.c.last_seen)).where(ip_history_table.c.host_id == hosts_table.c.id).scalar_subquery()
+    ip_seen = bindparam("b_ip_seen", type_=DateTime)
+    host_update = update(hosts_table).where(hosts_table.c.id == bindparam("b_id")).values(
+        first_seen=earlier(hosts_table.c.first_seen, bindparam("b_first_seen", type_=DateTime)),
+        last_seen=later(hosts_table.c.last_seen, bindparam("b_last_seen", type_=DateTime)),
+        IP_address=case((ip_seen >= func.coalesce(newest_known_ip_seen, ip_seen), bindparam("b_IP_address", type_=String)), else_=hosts_table.c.IP_address))
+    db.execute(host_update, [{"b_id": host_ids[hostname], "b_first_seen": first_seen, "b_last_seen": last_seen, "b_ip_seen": ip_seen_at, "b_IP_address": ip_address}
+                             for hostname, (first_seen, last_seen, ip_seen_at, ip_address) in seen.items()])
+    record_ip_addresses(db, host_ids, sightings)
+    return host_ids
+
+
+def record_ip_addresses(db: Session, host_ids, sightings):
+    if not sightings:
+        return
+    upsert_rows(db, HostIPAddress, [{"host_id": host_ids[hostname], "IP_address": ip_address} for hostname, ip_address in sightings],
+                ["host_id", "IP_address"])
+    history_update = (update(ip_history_table)
+                      .where(ip_history_table.c.host_id == bindparam("b_host_id"), ip_history_table.c.IP_address == bindparam("b_IP_address"))
+                      .values(first_seen=earlier(ip_history_table.c.first_seen, bindparam("b_first_seen", type_=DateTime)),
+                              last_seen=later(ip_history_table.c.last_seen, bindparam("b_last_seen", type_=DateTime))))
+    db.execute(history_update, [{"b_host_id": host_ids[hostname], "b_IP_address": ip_address, "b_first_seen": first_seen, "b_last_seen": last_seen}
+                                for (hostname, ip_address), (first_seen, last_seen) in sightings.items()])
+
+
+def sync_inventory_hosts(db: Session, inventory):
+    """Add the inventory's hosts to `hosts` and replace their group memberships and attributes (committed).
+
+    `inventory` maps each hostname to {"IP_address", "groups", "variables"}, as parsed from the Ansible inventory.
+    """
+    if not inventory:
+        return
+    hosts = ensure_hosts(db, inventory)
+    for hostname, details in inventory.items():
+        host = hosts[hostname]
+        host.IP_address = host.IP_address or details.get("IP_address")
+        for attribute in INVENTORY_HOST_ATTRIBUTES:
+            setattr(host, attribute, details["variables"].get(attribute, getattr(host, attribute)))
+    host_ids = [host.id for host in hosts.values()]
+    for host_id_chunk in chunked(host_ids, LOOKUP_CHUNK_SIZE):
+        db.execute(delete(HostGroupMembership).where(HostGroupMembership.host_id.in_(host_id_chunk)))
+    memberships = [{"host_id": hosts[hostname].id, "group_name": group_name} for hostname, details in inventory.items() for group_name in details["groups"]]
+    upsert_rows(db, HostGroupMembership, memberships, ["host_id", "group_name"])
+    db.commit()
+    logger.info(f"Synced {len(inventory)} inventory hosts into {len(memberships)} group memberships.")
+
+
+def backfill_host_ids(db: Session):
+    """Register the hosts of rows written before the hosts table existed and point those rows at them (committed).
+
+    Only such rows still have a hostname column (init_db drops it afterwards), so the tables are reflected from the
+    database instead of taken from the models.
+    """
+    metadata = MetaData()
+    tables = [Table(model.__tablename__, metadata, autoload_with=db.get_bind()) for model in HOST_FACT_MODELS]
+    tables = [table for table in tables if "hostname" in table.c and db.execute(select(table.c.id).where(table.c.host_id.is_(None)).limit(1)).first()]
+    if not tables:
+        return
+    logger.info("Backfilling host ids of existing rows.")
+    # The first and last time each host was seen at each IP address, from the tables that record one
+    rows = []
+    for table in tables:
+        if "IP_address" not in table.c:
+            rows += [{"hostname": hostname, "datetime": first_seen} for hostname, first_seen in
+                     db.execute(select(table.c.hostname, func.min(table.c.datetime)).group_by(table.c.hostname)).all()]
+            continue
+        sightings = (select(table.c.hostname, table.c.IP_address, func.min(table.c.datetime), func.max(table.c.datetime))
+                     .group_by(table.c.hostname, table.c.IP_address))
+        for hostname, ip_address, first_seen, last_seen in db.execute(sightings).all():
+            rows += [{"hostname": hostname, "IP_address": ip_address, "datetime": first_seen}, {"hostname": hostname, "IP_address": ip_address, "datetime": last_seen}]
+    register_hosts(db, rows)
+    for table in tables:
+        host_id = select(Host.id).where(Host.hostname == table.c.hostname).scalar_subquery()
+        db.execute(update(table).where(table.c.host_id.is_(None)).values(host_id=host_id))
+    db.commit()
+    logger.info("Backfilled host ids.")
+
+
+def with_host_ids(rows, host_ids):
+    # Rows for a fact table, which stores the host_id instead of the hostname
+    return [{**{column: value for column, value in row.items() if column != "hostname"}, "host_id": host_ids[row["hostname"]]} for row in rows]
+
+
+def join_hosts(query, model):
+    # Fact tables only store the host_id, so queries selecting Host.hostname next to their columns join `hosts`
+    return query.join_from(model, Host, model.host_id == Host.id)
+
+
+def fact_column(model, column):
+    return Host.hostname if column == "hostname" and model in HOST_FACT_MODELS else getattr(model, column)
+
+
+def select_columns(model, columns):
+    """select() of the named `columns` of `model`, where the hostname of fact table rows is joined from `hosts`."""
+    query = select(*[fact_column(model, column) for column in columns])
+    return join_hosts(query, model) if "hostname" in columns and model in HOST_FACT_MODELS else query
+
+
+def host_conditions(model, hostnames):
+    # Fact tables filter on their integer host_id, resolved through the hosts table; other tables on the hostname.
+    # Not correlated, so the filter also works on queries that join `hosts`.
+    if model in HOST_FACT_MODELS:
+        return (model.host_id.in_(select(Host.id).where(Host.hostname.in_(list(hostnames))).correlate(None)),)
+    return (model.hostname.in_(list(hostnames)),)
+
+
+def group_host_ids(group_names):
+    # Subquery of the ids of hosts in any of `group_names`, for `host_id IN (...)` filters on the fact tables
+    return select(HostGroupMembership.host_id).where(HostGroupMembership.group_name.in_(group_names))
+
+
+def group_hostnames(group_names):
+    return select(Host.hostname).join(HostGroupMembership, HostGroupMembership.host_id == Host.id).where(HostGroupMembership.group_name.in_(group_names))
+
+
+def group_conditions(model, group_names):
+    # Fact tables filter on their integer host_id; tables without one (rollups, trials) on the hostname
+    if not group_names:
+        return ()
+    if model in HOST_FACT_MODELS:
+        return (model.host_id.in_(group_host_ids(group_names)),)
+    return (model.hostname.in_(group_hostnames(group_names)),)
+
+
+def current_ip_addresses(db: Session, hostnames=None):
+    # {hostname: current IP address}; labelling by this keeps a host that changed address on one series
+    query = select(Host.hostname, Host.IP_address)
+    if hostnames is not None:
+        query = query.where(Host.hostname.in_(list(hostnames)))
+    return {hostname: ip_address or UNKNOWN_IP_ADDRESS for hostname, ip_address in db.execute(query).all()}
@@ -1,17 +1,159 @@
-from web_app.app.database.data_models import Base
+from web_app.app.database.data_models import Base, RawBenchmarkSubscores, LatestHostScore
+from web_app.app.database.latest_host_scores import rebuild_latest_host_scores
+from web_app.app.database.hosts import HOST_FACT_MODELS, backfill_host_ids
 from web_app.app.logger_config import setup_logger
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, UniqueConstraint
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from decouple import config
 
 logger = setup_logger()
 SQLALCHEMY_ENGINE_CONNECTION_STRING = config("SQLALCHEMY_ENGINE_CONNECTION_STRING", cast=str) 
-engine = create_engine(SQLALCHEMY_ENGINE_CONNECTION_STRING)
+# Empty means: derive it from SQLALCHEMY_ENGINE_CONNECTION_STRING with the matching async driver
+ASYNC_SQLALCHEMY_ENGINE_CONNECTION_STRING = config("ASYNC_SQLALCHEMY_ENGINE_CONNECTION_STRING", default="", cast=str)
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=10, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=20, cast=int)
+DB_POOL_TIMEOUT_IN_SECONDS = config("DB_POOL_TIMEOUT_IN_SECONDS", default=30, cast=int)
+DB_POOL_RECYCLE_IN_SECONDS = config("DB_POOL_RECYCLE_IN_SECONDS", default=1800, cast=int)
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+# String indexes superseded by the host_id indexes once the hosts table was introduced; hostname filters on the
+# fact tables go through host_id
+OBSOLETE_INDEXES = ["ix_raw_benchmark_subscores_hostname", "ix_raw_benchmark_subscores_IP_address",
+                    "ix_overall_normalized_score_hostname", "ix_overall_normalized_score_IP_address",
+                    "ix_raw_benchmark_subscores_hostname_datetime", "ix_overall_normalized_score_hostname_datetime",
+                    "ix_benchmark_metrics_hostname_datetime"]
+
+
+def async_connection_string(connection_string):
+    url = make_url(connection_string)
+    if url.get_backend_name() not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}; set ASYNC_SQLALCHEMY_ENGINE_CONNECTION_STRING.")
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def engine_options(connection_string):
+    # In-memory SQLite uses a single static connection, which takes no pool sizing
+    url = make_url(connection_string)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT_IN_SECONDS,
+            "pool_recycle": DB_POOL_RECYCLE_IN_SECONDS, "pool_pre_ping": True}
+
+
+engine = create_engine(SQLALCHEMY_ENGINE_CONNECTION_STRING, **engine_options(SQLALCHEMY_ENGINE_CONNECTION_STRING))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_ENGINE_CONNECTION_STRING or async_connection_string(SQLALCHEMY_ENGINE_CONNECTION_STRING),
+                                   **engine_options(SQLALCHEMY_ENGINE_CONNECTION_STRING))
+# Objects stay usable after commit, since async sessions cannot lazily refresh expired attributes
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def add_missing_columns():
+    # create_all() never alters existing tables, so add (nullable) columns introduced since the table was created
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    logger.info(f"Adding column {column.name} to {table.name}.")
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column.type.compile(engine.dialect)}')
+
+def sqlite_sequence_value(connection, table_name):
+    # The highest id an AUTOINCREMENT table has handed out (0 when it has none)
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'").first() is None:
+        return 0
+    return connection.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,)).scalar() or 0
+
+
+def rebuild_sqlite_table(connection, table):
+    """Recreate `table` from its model and copy its rows over, for changes SQLite's ALTER TABLE cannot make.
+
+    Columns the model no longer has are left behind. AUTOINCREMENT tables keep their id sequence.
+    """
+    from web_app.app.utils.archive import archived_max_id  # archive.py imports this module
+    old_table_name = f"{table.name}__old"
+    old_columns = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    old_sequence_value = sqlite_sequence_value(connection, table.name)
+    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old_table_name}"')
+    # The renamed table keeps its index names, which the new table needs
+    for index in inspect(connection).get_indexes(old_table_name):
+        connection.exec_driver_sql(f'DROP INDEX "{index["name"]}"')
+    table.create(connection)
+    columns = ", ".join(f'"{column.name}"' for column in table.columns if column.name in old_columns)
+    connection.exec_driver_sql(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_table_name}"')
+    connection.exec_driver_sql(f'DROP TABLE "{old_table_name}"')
+    if table.dialect_options["sqlite"]["autoincrement"]:
+        # Copying the rows seeds the id sequence with the table's highest id; ids handed out before, archived ones included, count as well
+        model = next(mapper.class_ for mapper in Base.registry.mappers if mapper.local_table is table)
+        connection.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) SELECT ?, 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+                                   (table.name, table.name))
+        connection.exec_driver_sql("UPDATE sqlite_sequence SET seq = MAX(seq, ?, ?) WHERE name = ?", (old_sequence_value, archived_max_id(model), table.name))
+
+
+def migrate_sqlite_autoincrement():
+    # Without AUTOINCREMENT, SQLite hands out the ids of deleted rows again once the highest ones are gone, e.g.
+    # after every row of a table was archived
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not table.dialect_options["sqlite"]["autoincrement"]:
+                continue
+            table_sql = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).scalar()
+            if "AUTOINCREMENT" in table_sql.upper():
+                continue
+            logger.info(f"Rebuilding {table.name} with AUTOINCREMENT ids.")
+            rebuild_sqlite_table(connection, table)
+
+
+def drop_hostname_columns():
+    # Fact table rows used to store their hostname next to the host_id and were unique per (datetime, hostname); they
+    # are now unique per (datetime, host_id). Runs after backfill_host_ids(), which still needs the hostnames.
+    with engine.begin() as connection:
+        for model in HOST_FACT_MODELS:
+            table = model.__table__
+            if "hostname" not in {column["name"] for column in inspect(connection).get_columns(table.name)}:
+                continue
+            logger.info(f"Dropping the hostname column of {table.name}; its rows are keyed on host_id.")
+            if engine.dialect.name == "sqlite":
+                rebuild_sqlite_table(connection, table)
+                continue
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} DROP COLUMN hostname')  # Also drops the unique constraint on it
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ALTER COLUMN host_id SET NOT NULL')
+            for constraint in table.constraints:
+                if isinstance(constraint, UniqueConstraint):
+                    connection.execute(AddConstraint(constraint))
+
+
+def drop_obsolete_indexes():
+    with engine.begin() as connection:
+        for index_name in OBSOLETE_INDEXES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{index_name}"')
 
 def init_db():
     logger.info("Initializing database.")    
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    db = SessionLocal()
+    try:
+        backfill_host_ids(db)
+    finally:
+        db.close()
+    drop_hostname_columns()
+    migrate_sqlite_autoincrement()
+    drop_obsolete_indexes()
+    # create_all() skips indexes added to tables that already exist, so create any that are missing
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        if db.query(LatestHostScore).first() is None and db.query(RawBenchmarkSubscores).first() is not None:
+            rebuild_latest_host_scores(db)
+    finally:
+        db.close()
     logger.info("Database initialized.")
 
 def get_db():
@@ -20,3 +162,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,63 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore, LatestHostScore
+from web_app.app.database.bulk_upsert import upsert_rows, chunked
+from web_app.app.database.hosts import join_hosts, fact_column
+from web_app.app.logger_config import setup_logger
+from sqlalchemy import select, update, delete, func, and_, bindparam
+from sqlalchemy.orm import Session
+
+logger = setup_logger()
+LATEST_SCORE_COLUMNS = [column.name for column in LatestHostScore.__table__.columns]
+LOOKUP_CHUNK_SIZE = 500
+latest_table = LatestHostScore.__table__
+
+
+def newest_row_per_host(rows):
+    return list({row["hostname"]: row for row in sorted(rows, key=lambda row: row["datetime"])}.values())
+
+
+def latest_datetimes(db: Session, hostnames):
+    latest = {}
+    for hostname_chunk in chunked(sorted(hostnames), LOOKUP_CHUNK_SIZE):
+        latest.update(db.execute(select(LatestHostScore.hostname, LatestHostScore.datetime).where(LatestHostScore.hostname.in_(hostname_chunk))).all())
+    return latest
+
+
+def upsert_latest_host_scores(db: Session, raw_rows, overall_rows):
+    """Fold freshly ingested rows into `latest_host_scores`, never replacing a host's row with older data."""
+    # Batches can span several runs, and Postgres rejects an upsert that touches the same host twice
+    raw_rows = newest_row_per_host(raw_rows)
+    overall_rows = newest_row_per_host(overall_rows)
+    overall_by_key = {(row["hostname"], row["datetime"]): row["overall_score"] for row in overall_rows}
+    raw_keys = {(row["hostname"], row["datetime"]) for row in raw_rows}
+    full_rows = [{**{column: row.get(column) for column in LATEST_SCORE_COLUMNS if column != "overall_score"},
+                  "overall_score": overall_by_key.get((row["hostname"], row["datetime"]))} for row in raw_rows]
+    upsert_rows(db, LatestHostScore, full_rows, ["hostname"], only_if_not_older_column="datetime")
+    # Overall scores without raw subscores (rescoring, backfills) update the score of the run that is already stored;
+    # one from a newer run replaces the row with empty subscores, so a score is never shown next to another run's subscores
+    score_only_rows = [row for row in overall_rows if (row["hostname"], row["datetime"]) not in raw_keys]
+    stored_datetimes = latest_datetimes(db, {row["hostname"] for row in score_only_rows})
+    same_run_rows = [{"b_hostname": row["hostname"], "b_datetime": row["datetime"], "b_overall_score": row["overall_score"]}
+                     for row in score_only_rows if stored_datetimes.get(row["hostname"]) == row["datetime"]]
+    newer_run_rows = [{**dict.fromkeys(LATEST_SCORE_COLUMNS), **{column: row[column] for column in ["hostname", "IP_address", "datetime", "overall_score"]}}
+                      for row in score_only_rows if stored_datetimes.get(row["hostname"]) is None or stored_datetimes[row["hostname"]] < row["datetime"]]
+    if same_run_rows:
+        db.execute(update(latest_table).where(latest_table.c.hostname == bindparam("b_hostname"), latest_table.c.datetime == bindparam("b_datetime"))
+                   .values(overall_score=bindparam("b_overall_score")), same_run_rows)
+    upsert_rows(db, LatestHostScore, newer_run_rows, ["hostname"], only_if_not_older_column="datetime")
+
+
+def rebuild_latest_host_scores(db: Session):
+    # One pass over history: each host's newest raw row, joined to the overall score taken at the same time
+    newest = (select(RawBenchmarkSubscores.host_id, func.max(RawBenchmarkSubscores.datetime).label("datetime"))
+              .group_by(RawBenchmarkSubscores.host_id).subquery())
+    latest_rows = (
+        join_hosts(select(*[fact_column(RawBenchmarkSubscores, column) for column in LATEST_SCORE_COLUMNS if column != "overall_score"],
+                          OverallNormalizedScore.overall_score), RawBenchmarkSubscores)
+        .join(newest, and_(RawBenchmarkSubscores.host_id == newest.c.host_id, RawBenchmarkSubscores.datetime == newest.c.datetime))
+        .outerjoin(OverallNormalizedScore, and_(OverallNormalizedScore.host_id == RawBenchmarkSubscores.host_id,
+                                                OverallNormalizedScore.datetime == RawBenchmarkSubscores.datetime))
+    )
+    db.execute(delete(LatestHostScore))
+    db.execute(LatestHostScore.__table__.insert().from_select(LATEST_SCORE_COLUMNS, latest_rows))
+    db.commit()
+    logger.info(f"Rebuilt latest_host_scores with {db.query(LatestHostScore).count()} hosts.")
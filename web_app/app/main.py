@@ -1,23 +1,42 @@
 from web_app.app.database.init_db import init_db
 from web_app.app.routes.api_routes import router as api_router
-from web_app.app.utils.scheduler import start_scheduler
 from web_app.app.logger_config import setup_logger
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from threading import Thread
+from decouple import config
 
 logger = setup_logger()
+# API-only replicas can leave scheduling to the others, and then never load pandas unless a chart or CSV is requested
+SCHEDULER_ENABLED = config("SCHEDULER_ENABLED", default=True, cast=bool)
 description_string = """
 ☁️🏆 Cloud Benchmarker is your One-Stop-Shop to Quickly and Conveniently Test the Performance of Your Cloud Instances and Track It Over Time 🏆☁️
 """
-app = FastAPI(title="Cloud Benchmarker", description=description_string, version="1.0.0", docs_url="/")
 
-app.include_router(api_router)
 
-@app.on_event("startup")
-def startup_event():
+def start_background_scheduler():
+    # The scheduler imports the whole ingest pipeline (pandas included), so it starts off the startup path
+    from web_app.app.utils.scheduler import start_scheduler
+    start_scheduler()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     logger.info("Application startup initiated.")
     init_db()
-    scheduler_thread = Thread(target=start_scheduler)
-    scheduler_thread.daemon = True  # Set thread as daemon
-    scheduler_thread.start()
+    scheduler_thread = None
+    if SCHEDULER_ENABLED:
+        # Every worker starts a scheduler; only the one holding the database lease runs benchmarks
+        scheduler_thread = Thread(target=start_background_scheduler, daemon=True)
+        scheduler_thread.start()
     logger.info("Application startup completed.")
+    yield
+    if scheduler_thread is not None:
+        scheduler_thread.join()
+        from web_app.app.utils.scheduler import stop_scheduler
+        stop_scheduler()
+
+
+app = FastAPI(title="Cloud Benchmarker", description=description_string, version="1.0.0", docs_url="/", lifespan=lifespan)
+
+app.include_router(api_router)
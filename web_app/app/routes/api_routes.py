@@ -1,85 +1,528 @@
-from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore, HistoricalRawBenchmarkSubscoresResponse, HistoricalOverallNormalizedScoresResponse
-from web_app.app.database.init_db import get_db
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore, LatestHostScore, HistoricalRawBenchmarkSubscoresResponse, HistoricalOverallNormalizedScoresResponse, LatestHostScoreResponse, BenchmarkRollup, BenchmarkRollupResponse, BenchmarkAlert, BenchmarkAlertResponse, BenchmarkTrialStats, BenchmarkTrialStatsResponse, BenchmarkMetric, BenchmarkMetricResponse, MetricDefinitionResponse, Host, HostGroupMembership, HostIPAddress, HostResponse, HostIPAddressResponse, BenchmarkRun, BenchmarkRunHost, BenchmarkRunRequest, BenchmarkRunResponse, BenchmarkRunHostResponse
+from web_app.app.database.init_db import get_async_db
+from web_app.app.database.hosts import HOST_FACT_MODELS, group_conditions, group_hostnames, group_host_ids
+from web_app.app.database.data_generation import read_ingest_generation
 from web_app.app.logger_config import setup_logger
-from web_app.app.chart import generate_benchmark_charts
-from datetime import datetime, timedelta
-from typing import List
-from io import StringIO
-from fastapi import APIRouter, Query, Depends
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-import pandas as pd
+from web_app.app.utils.chart_cache import chart_cache, CHART_POINTS_PER_HOST, MAX_DATA_POINTS_FOR_CHART
+from web_app.app.utils.keyset_pagination import cutoff_date_for_time_period, build_keyset_query, encode_cursor, decode_cursor, stream_query_rows
+from web_app.app.utils.archive import is_archived, archived_rows, merge_sorted_rows
+from web_app.app.utils.worker_pools import export_pool, iterate_in_pool
+from web_app.app.utils.rollup_resolutions import ROLLUP_RESOLUTIONS, choose_rollup_resolution, rollup_conditions, rollup_size_queries, bucket_start
+from web_app.app.utils.metric_registry import METRIC_REGISTRY
+from web_app.app.utils.run_queue import request_run
+import web_app.app.utils.instrumentation  # noqa: F401 -- imported for its side effect: registers the pipeline instruments and the latest results collector
+from datetime import datetime
+from typing import List, Optional, Union
+from fastapi import APIRouter, Query, Depends, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
+from itertools import islice
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
+from functools import lru_cache
+import gzip
+import os
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.openmetrics import exposition as openmetrics_exposition
 
 logger = setup_logger()
+API_PAGE_SIZE = config("API_PAGE_SIZE", default=1000, cast=int)
+API_MAX_PAGE_SIZE = config("API_MAX_PAGE_SIZE", default=10000, cast=int)
 
 router = APIRouter()
+DASHBOARD_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static", "index.html")
+
+PAGINATION_PARAMETERS_DESCRIPTION = """- `time_period`: The time range for which data should be fetched (optional). Supported values are `last_7_days`, `last_30_days`, `last_year`.
+- `hostname`: Only return rows for these hostnames (optional, can be repeated).
+- `group`: Only return rows for hosts in these inventory groups (optional, can be repeated; see `/hosts/`).
+- `limit`: Maximum number of rows per page for the JSON format. When more rows are available, the `X-Next-Cursor` response header holds the cursor for the next page.
+- `cursor`: Resume after the last row of the previous page (optional, taken from `X-Next-Cursor`).
+- `format`: `json` (default, paginated), or `ndjson`/`csv` to stream every matching row after `cursor` in constant memory."""
+RESOLUTION_PARAMETER_DESCRIPTION = f"""- `resolution`: `raw` (default), `auto` or one of the maintained rollup resolutions ({', '.join(f'`{resolution}`' for resolution in ROLLUP_RESOLUTIONS)}; resolutions no wider than the run interval are not maintained). Rollups are served from the rollup table: one row per host, metric and bucket holding min, max, mean, p50, p95 and count. With `auto`, a `time_period` long enough to fill the configured number of points per host at a rollup resolution is served from rollups, but only when that takes fewer rows than the raw data. The resolution served is returned in the `X-Resolution` response header."""
+RESOLUTION_PATTERN = f"^(auto|raw|{'|'.join(ROLLUP_RESOLUTIONS)})$"
+INTERNAL_COLUMNS = {"updated_at"}  # Bookkeeping columns left out of the /data/ responses
+
+
+async def resolve_resolution(db: AsyncSession, model, resolution, cutoff_date, hostname=None, group=None):
+    # `auto` only reaches for rollups when a time period bounds the range; unbounded reads stay raw and paginated
+    if resolution != "auto":
+        return None if resolution == "raw" else resolution
+    if cutoff_date is None:
+        return None
+    chosen_resolution = choose_rollup_resolution(cutoff_date, datetime.now())
+    if chosen_resolution is None:
+        return None
+    # A sparse window (few runs per bucket) has fewer raw rows than rollup rows, which hold one metric each
+    conditions = (*((BenchmarkRollup.hostname.in_(hostname),) if hostname else ()), *group_conditions(BenchmarkRollup, group))
+    raw_rows_query, rollup_rows_query = rollup_size_queries(model, chosen_resolution, cutoff_date, conditions=conditions)
+    raw_rows = (await db.execute(raw_rows_query)).scalar() or 0
+    rollup_rows = (await db.execute(rollup_rows_query)).scalar()
+    return chosen_resolution if rollup_rows < raw_rows else None
+
+
+def response_columns(model):
+    # Fact tables store the host_id only; their rows are served with the hostname joined from `hosts` after the datetime
+    columns = [column.name for column in model.__table__.columns if column.name not in INTERNAL_COLUMNS]
+    if model in HOST_FACT_MODELS:
+        columns.insert(columns.index("datetime") + 1, "hostname")
+    return columns
+
+
+async def archive_hostnames(db: AsyncSession, hostname, group):
+    # The archive is partitioned by hostname, so a group filter is resolved to its members' hostnames
+    if not group:
+        return hostname
+    members = set((await db.execute(group_hostnames(group))).scalars())
+    return sorted(members & set(hostname) if hostname else members)
+
+
+async def read_table_data(model, request: Request, response: Response, db: AsyncSession, time_period, hostname, cursor, limit, output_format, resolution="raw", group=None):
+    try:
+        cutoff_date = cutoff_date_for_time_period(time_period) if time_period else None
+        resolution = await resolve_resolution(db, model, resolution, cutoff_date, hostname, group)
+        archive_rows = None
+        if resolution is None:
+            columns = response_columns(model)
+            query = build_keyset_query(model, columns, cutoff_date, hostname, cursor, group_conditions(model, group))
+            if is_archived(model):
+                # Rows moved to the Parquet archive are merged back in, read lazily a month at a time
+                archive_rows = archived_rows(model, columns, cutoff_date, await archive_hostnames(db, hostname, group), decode_cursor(cursor) if cursor else None)
+        else:
+            columns = [column.name for column in BenchmarkRollup.__table__.columns]
+            # Whole buckets only, so the first bucket is not cut short by the cutoff
+            cutoff_date = bucket_start(cutoff_date, resolution) if cutoff_date else None
+            query = build_keyset_query(BenchmarkRollup, columns, cutoff_date, hostname, cursor,
+                                       (*rollup_conditions(model, resolution), *group_conditions(BenchmarkRollup, group)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Resolution"] = resolution or "raw"
+    if output_format != "json":
+        media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(stream_query_rows(query, columns, output_format, archive_rows), media_type=media_type,
+                                 headers={"X-Resolution": resolution or "raw"})
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    if archive_rows is not None:
+        rows = await run_in_threadpool(lambda: list(islice(merge_sorted_rows(rows, archive_rows, columns), limit + 1)))
+    rows = [dict(zip(columns, row)) for row in rows]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["datetime"], rows[-1]["id"])
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return rows
+
 
 @router.get("/data/raw/",
             summary="Get Raw Data",
-            description="""Fetch raw benchmark subscores based on the time period specified.
+            description=f"""Fetch raw benchmark subscores based on the time period specified, ordered by datetime.
 
 ### Parameters:
-- `time_period`: The time range for which data should be fetched (optional). Supported values are `last_7_days`, `last_30_days`, `last_year`.
+{PAGINATION_PARAMETERS_DESCRIPTION}
+{RESOLUTION_PARAMETER_DESCRIPTION}
 
 ### Examples:
 - To get data for the last 7 days: `/data/raw/?time_period=last_7_days`
-- To get all data: `/data/raw/""",
-            response_model=List[HistoricalRawBenchmarkSubscoresResponse],
+- To get the first page of all data: `/data/raw/`
+- To stream all data for one host as CSV: `/data/raw/?hostname=my-host&format=csv`
+- To get daily rollups for the last year: `/data/raw/?time_period=last_year&resolution=day`""",
+            response_model=Union[List[HistoricalRawBenchmarkSubscoresResponse], List[BenchmarkRollupResponse]],
             response_description="A list of raw benchmark subscores.")
-def read_raw_data(db: Session = Depends(get_db), time_period: str = Query(None, alias="time_period")):
+async def read_raw_data(request: Request,
+                  response: Response,
+                  db: AsyncSession = Depends(get_async_db),
+                  time_period: str = Query(None, alias="time_period"),
+                  hostname: Optional[List[str]] = Query(None),
+                  group: Optional[List[str]] = Query(None),
+                  cursor: Optional[str] = Query(None),
+                  limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+                  format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+                  resolution: str = Query("raw", pattern=RESOLUTION_PATTERN)):
     logger.info(f"Fetching raw data for the time_period: {time_period}")    
-    if time_period:
-        if time_period == "last_7_days":
-            cutoff_date = datetime.now() - timedelta(days=7)
-        elif time_period == "last_30_days":
-            cutoff_date = datetime.now() - timedelta(days=30)
-        elif time_period == "last_year":
-            cutoff_date = datetime.now() - timedelta(days=365)
-        else:
-            return {"error": "Invalid time period"}
-        
-        return db.query(RawBenchmarkSubscores).filter(RawBenchmarkSubscores.datetime >= cutoff_date).all()
-    else:
-        return db.query(RawBenchmarkSubscores).all()
+    return await read_table_data(RawBenchmarkSubscores, request, response, db, time_period, hostname, cursor, limit, format, resolution, group)
 
 
 
 @router.get("/data/overall/",
             summary="Get Overall Data",
-            description="""Fetch overall normalized scores based on the time period specified.
+            description=f"""Fetch overall normalized scores based on the time period specified, ordered by datetime.
 
 ### Parameters:
-- `time_period`: The time range for which data should be fetched (optional). Supported values are `last_7_days`, `last_30_days`, `last_year`.
+{PAGINATION_PARAMETERS_DESCRIPTION}
+{RESOLUTION_PARAMETER_DESCRIPTION}
 
 ### Examples:
 - To get data for the last 7 days: `/data/overall/?time_period=last_7_days`
-- To get all data: `/data/overall/""",
-            response_model=List[HistoricalOverallNormalizedScoresResponse],
+- To get the first page of all data: `/data/overall/`
+- To stream all data as NDJSON: `/data/overall/?format=ndjson`
+- To let the API pick rollups for the last year when they are smaller: `/data/overall/?time_period=last_year&resolution=auto`""",
+            response_model=Union[List[HistoricalOverallNormalizedScoresResponse], List[BenchmarkRollupResponse]],
             response_description="A list of overall normalized scores.")
-def read_overall_data(db: Session = Depends(get_db), time_period: str = Query(None, alias="time_period")):
+async def read_overall_data(request: Request,
+                      response: Response,
+                      db: AsyncSession = Depends(get_async_db),
+                      time_period: str = Query(None, alias="time_period"),
+                      hostname: Optional[List[str]] = Query(None),
+                      group: Optional[List[str]] = Query(None),
+                      cursor: Optional[str] = Query(None),
+                      limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+                      format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+                      resolution: str = Query("raw", pattern=RESOLUTION_PATTERN)):
     logger.info(f"Fetching overall data for the time_period: {time_period}")    
+    return await read_table_data(OverallNormalizedScore, request, response, db, time_period, hostname, cursor, limit, format, resolution, group)
+
+
+
+@router.get("/data/trials/",
+            summary="Get Repeated-Trial Statistics",
+            description=f"""Fetch the per-trial results and their mean, standard deviation, coefficient of variation and median, for runs made in repeated-trial mode (`BENCHMARK_TRIALS` > 1), ordered by datetime. The raw subscores of those runs hold the `TRIAL_AGGREGATE` (median by default) of the trials.
+
+### Parameters:
+{PAGINATION_PARAMETERS_DESCRIPTION}
+
+### Examples:
+- To get the trial statistics of the last 7 days: `/data/trials/?time_period=last_7_days`
+- To stream the trial statistics of one host as CSV: `/data/trials/?hostname=my-host&format=csv`""",
+            response_model=List[BenchmarkTrialStatsResponse],
+            response_description="A list of per-host, per-metric trial statistics.")
+async def read_trial_data(request: Request,
+                          response: Response,
+                          db: AsyncSession = Depends(get_async_db),
+                          time_period: str = Query(None, alias="time_period"),
+                          hostname: Optional[List[str]] = Query(None),
+                          group: Optional[List[str]] = Query(None),
+                          cursor: Optional[str] = Query(None),
+                          limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+                          format: str = Query("json", pattern="^(json|ndjson|csv)$")):
+    logger.info(f"Fetching trial statistics for the time_period: {time_period}")
+    return await read_table_data(BenchmarkTrialStats, request, response, db, time_period, hostname, cursor, limit, format, group=group)
+
+
+
+@router.get("/data/metrics/",
+            summary="Get Extended Metrics",
+            description=f"""Fetch the metrics that are stored in long format (one row per run, host and metric) rather than in a raw subscores column, ordered by datetime. These are the extended tests of the metric registry (see `/data/metric_registry/`), such as the CPU scaling curve, sequential file I/O throughput and p95/p99 latencies.
+
+### Parameters:
+{PAGINATION_PARAMETERS_DESCRIPTION}
+{RESOLUTION_PARAMETER_DESCRIPTION}
+
+### Examples:
+- To get the extended metrics of the last 7 days: `/data/metrics/?time_period=last_7_days`
+- To get daily rollups of the extended metrics for the last year: `/data/metrics/?time_period=last_year&resolution=day`""",
+            response_model=Union[List[BenchmarkMetricResponse], List[BenchmarkRollupResponse]],
+            response_description="A list of extended benchmark metrics.")
+async def read_metric_data(request: Request,
+                           response: Response,
+                           db: AsyncSession = Depends(get_async_db),
+                           time_period: str = Query(None, alias="time_period"),
+                           hostname: Optional[List[str]] = Query(None),
+                           group: Optional[List[str]] = Query(None),
+                           cursor: Optional[str] = Query(None),
+                           limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+                           format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+                           resolution: str = Query("raw", pattern=RESOLUTION_PATTERN)):
+    logger.info(f"Fetching extended metrics for the time_period: {time_period}")
+    return await read_table_data(BenchmarkMetric, request, response, db, time_period, hostname, cursor, limit, format, resolution, group)
+
+
+
+@router.get("/data/metric_registry/",
+            summary="Get Metric Registry",
+            description="""List every registered metric with its direction (1 when higher is better, -1 when lower is better), unit, description and default weight in the overall score. Metrics with `column` set are stored in the raw subscores table, all others in the long-format table served by `/data/metrics/`.""",
+            response_model=List[MetricDefinitionResponse],
+            response_description="The registered metrics.")
+def read_metric_registry():
+    return list(METRIC_REGISTRY.values())
+
+
+
+@router.get("/data/latest/",
+            summary="Get Latest Scores",
+            description="""Fetch the most recent subscores and overall score of every host, best overall score first.
+
+This reads the `latest_host_scores` table that ingest keeps up to date, so it costs one row per host no matter how much history is stored.
+
+### Parameters:
+- `hostname`: Only return these hostnames (optional, can be repeated).
+- `group`: Only return hosts in these inventory groups (optional, can be repeated).
+
+### Examples:
+- To get the current leaderboard: `/data/latest/`
+- To get the leaderboard of one inventory group: `/data/latest/?group=webservers`""",
+            response_model=List[LatestHostScoreResponse],
+            response_description="The latest scores of every host.")
+async def read_latest_data(db: AsyncSession = Depends(get_async_db), hostname: Optional[List[str]] = Query(None), group: Optional[List[str]] = Query(None)):
+    logger.info("Fetching latest scores per host.")
+    query = select(LatestHostScore).where(*group_conditions(LatestHostScore, group))
+    if hostname:
+        query = query.where(LatestHostScore.hostname.in_(hostname))
+    query = query.order_by(LatestHostScore.overall_score.desc().nulls_last(), LatestHostScore.hostname)
+    return (await db.execute(query)).scalars().all()
+
+
+
+@router.get("/hosts/",
+            summary="Get Hosts",
+            description="""List every known host with its integer id, current IP address, inventory groups, instance type and region (from the inventory's host variables), and the first and last time it reported a result.
+
+Hosts are registered when their results are ingested and when the Ansible inventory changes; the fact tables reference them by `host_id`.
+
+### Parameters:
+- `group`: Only return hosts in these inventory groups (optional, can be repeated).
+
+### Examples:
+- To list every host: `/hosts/`
+- To list the hosts of two groups: `/hosts/?group=webservers&group=databases`""",
+            response_model=List[HostResponse],
+            response_description="The known hosts.")
+async def read_hosts(db: AsyncSession = Depends(get_async_db), group: Optional[List[str]] = Query(None)):
+    logger.info("Fetching hosts.")
+    query = select(Host).order_by(Host.hostname)
+    if group:
+        query = query.where(Host.id.in_(group_host_ids(group)))
+    hosts = (await db.execute(query)).scalars().all()
+    groups_by_host_id = {}
+    for host_id, group_name in (await db.execute(select(HostGroupMembership.host_id, HostGroupMembership.group_name).order_by(HostGroupMembership.group_name))).all():
+        groups_by_host_id.setdefault(host_id, []).append(group_name)
+    return [HostResponse(id=host.id, hostname=host.hostname, IP_address=host.IP_address, instance_type=host.instance_type, region=host.region,
+                         groups=groups_by_host_id.get(host.id, []), first_seen=host.first_seen, last_seen=host.last_seen) for host in hosts]
+
+
+
+@router.get("/hosts/ip_history/",
+            summary="Get Host IP Address History",
+            description="""List every IP address each host has reported results from, with the first and last time it was seen there, oldest first. Charts and series label a host by its current IP address, so an address change does not split its history.
+
+### Parameters:
+- `hostname`: Only the history of these hostnames (optional, can be repeated).
+
+### Examples:
+- To see where one host has lived: `/hosts/ip_history/?hostname=my-host`""",
+            response_model=List[HostIPAddressResponse],
+            response_description="The IP address history of the hosts.")
+async def read_host_ip_history(db: AsyncSession = Depends(get_async_db), hostname: Optional[List[str]] = Query(None)):
+    logger.info("Fetching host IP address history.")
+    query = (select(Host.hostname, HostIPAddress.IP_address, HostIPAddress.first_seen, HostIPAddress.last_seen)
+             .join(Host, Host.id == HostIPAddress.host_id).order_by(Host.hostname, HostIPAddress.first_seen))
+    if hostname:
+        query = query.where(Host.hostname.in_(hostname))
+    return [HostIPAddressResponse(**row._mapping) for row in (await db.execute(query)).all()]
+
+
+
+async def load_run_responses(db: AsyncSession, runs):
+    hosts_by_run_id = {}
+    run_ids = [run.id for run in runs]
+    if run_ids:
+        host_rows = (await db.execute(select(BenchmarkRunHost.run_id, Host.hostname, BenchmarkRunHost.status)
+                                      .join(Host, Host.id == BenchmarkRunHost.host_id)
+                                      .where(BenchmarkRunHost.run_id.in_(run_ids)).order_by(Host.hostname))).all()
+        for run_id, hostname, status in host_rows:
+            hosts_by_run_id.setdefault(run_id, []).append(BenchmarkRunHostResponse(hostname=hostname, status=status))
+    return [BenchmarkRunResponse(id=run.id, reason=run.reason, status=run.status, attempt=run.attempt, requested_at=run.requested_at,
+                                 not_before=run.not_before, started_at=run.started_at, finished_at=run.finished_at, return_code=run.return_code,
+                                 hosts=hosts_by_run_id.get(run.id, [])) for run in runs]
+
+
+@router.post("/runs/",
+             status_code=202,
+             summary="Request a Benchmark Run",
+             description="""Queue a benchmark run of specific hosts, outside their regular schedule. The request returns at once with the queued run; the scheduler starts it as soon as a run slot (`MAX_CONCURRENT_SHARDS`) is free. Hosts that fail are retried with exponential backoff, like scheduled runs.
+
+### Body:
+- `hostname`: Hostnames to benchmark (as listed by `/hosts/`).
+- `group`: Inventory groups whose hosts to benchmark.
+
+### Examples:
+- `POST /runs/` with `{"hostname": ["web-1.example.com"]}`
+- `POST /runs/` with `{"group": ["databases"]}`""",
+             response_model=BenchmarkRunResponse,
+             response_description="The queued run.")
+async def create_run(run_request: BenchmarkRunRequest, db: AsyncSession = Depends(get_async_db)):
+    hostnames = set(run_request.hostname)
+    if hostnames:
+        known_hostnames = set((await db.execute(select(Host.hostname).where(Host.hostname.in_(hostnames)))).scalars())
+        if hostnames - known_hostnames:
+            raise HTTPException(status_code=404, detail=f"Unknown hosts: {', '.join(sorted(hostnames - known_hostnames))}")
+    if run_request.group:
+        hostnames |= set((await db.execute(group_hostnames(run_request.group))).scalars())
+    if not hostnames:
+        raise HTTPException(status_code=400, detail="No hosts to benchmark; pass known hostnames or non-empty groups.")
+    run_id = await run_in_threadpool(request_run, sorted(hostnames))
+    logger.info(f"Queued manual run {run_id} of {len(hostnames)} hosts.")
+    return (await load_run_responses(db, [await db.get(BenchmarkRun, run_id)]))[0]
+
+
+
+@router.get("/runs/",
+            summary="Get Benchmark Runs",
+            description="""List benchmark runs from the run queue, newest first: scheduled runs of hosts that came due, retries of failed hosts and manual runs requested with `POST /runs/`, with the status of every host in each run.
+
+### Parameters:
+- `status`: Only runs in these states (optional, can be repeated): `queued`, `running`, `succeeded`, `partial` or `failed`.
+- `limit`: Maximum number of runs returned.
+
+### Examples:
+- To see what is waiting to run: `/runs/?status=queued&status=running`""",
+            response_model=List[BenchmarkRunResponse],
+            response_description="A list of benchmark runs.")
+async def read_runs(db: AsyncSession = Depends(get_async_db),
+                    status: Optional[List[str]] = Query(None),
+                    limit: int = Query(100, ge=1, le=API_MAX_PAGE_SIZE)):
+    query = select(BenchmarkRun)
+    if status:
+        query = query.where(BenchmarkRun.status.in_(status))
+    runs = (await db.execute(query.order_by(BenchmarkRun.id.desc()).limit(limit))).scalars().all()
+    return await load_run_responses(db, runs)
+
+
+
+@router.get("/runs/{run_id}",
+            summary="Get a Benchmark Run",
+            description="""Fetch one benchmark run and the status of each of its hosts, e.g. to follow a run requested with `POST /runs/`.""",
+            response_model=BenchmarkRunResponse,
+            response_description="The benchmark run.")
+async def read_run(run_id: int, db: AsyncSession = Depends(get_async_db)):
+    run = await db.get(BenchmarkRun, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
+    return (await load_run_responses(db, [run]))[0]
+
+
+
+@router.get("/alerts/",
+            summary="Get Benchmark Alerts",
+            description="""Fetch detected benchmark regressions, newest first.
+
+After every scheduled ingest, each new subscore is compared with the median and MAD (median absolute deviation) of the same host's previous `ANOMALY_BASELINE_POINTS` values for that metric. A point is flagged when it is at least `ANOMALY_Z_SCORE_THRESHOLD` robust standard deviations worse than that baseline (lower throughput, or higher latency) and differs from the median by at least `ANOMALY_MIN_RELATIVE_CHANGE`.
+
+### Parameters:
+- `time_period`: Only alerts for data points in this time range (optional). Supported values are `last_7_days`, `last_30_days`, `last_year`.
+- `hostname`: Only alerts for these hostnames (optional, can be repeated).
+- `metric`: Only alerts for these metrics (optional, can be repeated).
+- `limit`: Maximum number of alerts returned.
+
+### Examples:
+- To get the latest alerts: `/alerts/`
+- To get last week's CPU alerts: `/alerts/?time_period=last_7_days&metric=cpu_speed_test__events_per_second`""",
+            response_model=List[BenchmarkAlertResponse],
+            response_description="A list of detected regressions.")
+async def read_alerts(db: AsyncSession = Depends(get_async_db),
+                      time_period: str = Query(None, alias="time_period"),
+                      hostname: Optional[List[str]] = Query(None),
+                      metric: Optional[List[str]] = Query(None),
+                      limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE)):
+    logger.info(f"Fetching alerts for the time_period: {time_period}")
+    query = select(BenchmarkAlert)
     if time_period:
-        if time_period == "last_7_days":
-            cutoff_date = datetime.now() - timedelta(days=7)
-        elif time_period == "last_30_days":
-            cutoff_date = datetime.now() - timedelta(days=30)
-        elif time_period == "last_year":
-            cutoff_date = datetime.now() - timedelta(days=365)
-        else:
-            return {"error": "Invalid time period"}
-        
-        return db.query(OverallNormalizedScore).filter(OverallNormalizedScore.datetime >= cutoff_date).all()
-    else:
-        return db.query(OverallNormalizedScore).all()
+        try:
+            query = query.where(BenchmarkAlert.datetime >= cutoff_date_for_time_period(time_period))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if hostname:
+        query = query.where(BenchmarkAlert.hostname.in_(hostname))
+    if metric:
+        query = query.where(BenchmarkAlert.metric.in_(metric))
+    query = query.order_by(BenchmarkAlert.datetime.desc(), BenchmarkAlert.id.desc()).limit(limit)
+    return (await db.execute(query)).scalars().all()
 
 
 
 @router.get("/benchmark_charts/",
             summary="Generate Benchmark Charts",
-            description="Generate benchmark charts based on the available data. To access this endpoint, just navigate to the URL: <your_ip_address>:9999/benchmark_charts/",
+            description="""Generate benchmark charts based on the available data. To access this endpoint, just navigate to the URL: <your_ip_address>:9999/benchmark_charts/
+
+### Parameters:
+- `start`: Only chart data at or after this datetime (optional, defaults to the beginning of history).
+- `end`: Only chart data at or before this datetime (optional, defaults to the latest data).
+- `points`: Maximum number of points drawn per host and metric. Each host's series is downsampled with min/max bucketing so spikes and dips are preserved.
+
+### Examples:
+- To chart all history: `/benchmark_charts/`
+- To chart January 2024 at 100 points per host: `/benchmark_charts/?start=2024-01-01T00:00:00&end=2024-02-01T00:00:00&points=100`""",
             response_description="Generated benchmark charts.")
-async def benchmark_chart(db: Session = Depends(get_db)):
-    return await generate_benchmark_charts(db)
+async def benchmark_chart(request: Request,
+                          start: Optional[datetime] = Query(None),
+                          end: Optional[datetime] = Query(None),
+                          points: int = Query(CHART_POINTS_PER_HOST, ge=2, le=MAX_DATA_POINTS_FOR_CHART),
+                          db: AsyncSession = Depends(get_async_db)):
+    # Charts, series and CSV exports import pandas and Plotly on first use, so replicas start without them
+    from web_app.app.chart import generate_benchmark_charts
+    return await generate_benchmark_charts(await read_ingest_generation(db), start=start, end=end, points=points,
+                                           if_none_match=request.headers.get("if-none-match"))
+
+
+
+@router.get("/data/series/",
+            summary="Get Chart Series",
+            description="""Fetch the downsampled chart series of every host and metric in a time window as compact columnar JSON, for client-side charting (the dashboard at `/dashboard/` is built on it).
+
+### Description:
+- Every series holds at most `points` points per host and metric, reduced with the same min/max bucketing and rollups as `/benchmark_charts/`.
+- Subscores, extended metrics and the overall score (as the `overall_score` metric) are all returned, so switching metrics needs no further request.
+- The response has the shape `{"metrics": [...], "hosts": {"<hostname>": {"ip_address": "...", "series": {"<metric>": [[timestamps], [values]]}, "alerts": {"<metric>": [[timestamps], [values], [robust z-scores]]}}}}`, with timestamps in Unix seconds.
+- Responses are cached until the next ingest, gzipped for clients that accept it and carry an `ETag` for revalidation with `If-None-Match`.
+
+### Parameters:
+- `hostname`: Only these hostnames (optional, can be repeated; defaults to every host).
+- `metric`: Only these metrics (optional, can be repeated; defaults to every metric).
+- `start`, `end`: Only data at or after / at or before these datetimes (optional).
+- `points`: Maximum number of points per host and metric.
+
+### Examples:
+- To get two hosts' series for January 2024: `/data/series/?hostname=web-1.example.com&hostname=web-2.example.com&start=2024-01-01T00:00:00&end=2024-02-01T00:00:00`""",
+            response_description="Columnar chart series per host and metric.")
+async def read_series_data(request: Request,
+                           hostname: Optional[List[str]] = Query(None),
+                           metric: Optional[List[str]] = Query(None),
+                           start: Optional[datetime] = Query(None),
+                           end: Optional[datetime] = Query(None),
+                           points: int = Query(CHART_POINTS_PER_HOST, ge=2, le=MAX_DATA_POINTS_FOR_CHART),
+                           db: AsyncSession = Depends(get_async_db)):
+    from web_app.app.chart import generate_benchmark_series
+    return await generate_benchmark_series(await read_ingest_generation(db), hostname, metric, start, end, points,
+                                           if_none_match=request.headers.get("if-none-match"), accept_encoding=request.headers.get("accept-encoding", ""))
+
+
+
+@router.get("/dashboard/",
+            summary="Benchmark Dashboard",
+            description="Interactive benchmark dashboard, rendered in the browser from `/data/latest/`, `/data/metric_registry/` and `/data/series/`. Series are fetched only for the selected hosts and time window.",
+            response_class=FileResponse,
+            response_description="The dashboard page.")
+def benchmark_dashboard():
+    return FileResponse(DASHBOARD_FILE_PATH, media_type="text/html")
+
+
+
+@router.get("/dashboard/plotly.min.js",
+            summary="Plotly.js Bundle",
+            description="The Plotly.js bundle that ships with the installed plotly package, served to the dashboard so it works without internet access. Browsers cache it for a day and revalidate it by version.",
+            response_description="The Plotly.js bundle.")
+def plotly_bundle(request: Request):
+    version, compressed_bundle = compressed_plotly_bundle()
+    headers = {"ETag": f'"{version}"', "Cache-Control": "public, max-age=86400", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(compressed_bundle, media_type="application/javascript", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(gzip.decompress(compressed_bundle), media_type="application/javascript", headers=headers)
+
+
+@lru_cache(maxsize=1)
+def compressed_plotly_bundle():
+    import plotly.offline
+    return plotly.offline.get_plotlyjs_version(), gzip.compress(plotly.offline.get_plotlyjs().encode())
+
+
+
+@router.get("/benchmark_charts/cache_stats/",
+            summary="Get Chart Cache Statistics",
+            description="Report the size and hit/miss counters of the in-process rendered chart cache.",
+            response_description="Chart cache statistics.")
+def benchmark_chart_cache_stats():
+    return chart_cache.stats()
 
 
 
@@ -88,48 +531,42 @@ async def benchmark_chart(db: Session = Depends(get_db)):
             description="""Generate a CSV file containing historical data for both raw benchmarks and overall normalized scores.
 
 ### Description:
-- This endpoint fetches historical raw benchmark subscores and overall normalized scores from the database.
-- It then merges the data based on the closest timestamps.
-- The final CSV file is generated in memory and returned as a download.
+- This endpoint reads historical raw benchmark subscores from the database in time-ordered chunks.
+- Each raw row is matched to the overall normalized score of the same host with the closest timestamp.
+- Every registered extended metric (see `/data/metric_registry/`) follows as an extra column.
+- Every chunk is written to the response as soon as it is ready, so memory use stays flat regardless of how much history there is.
+
+### Parameters:
+- `compress`: Gzip the CSV on the fly (optional, defaults to `false`).
 
 ### Examples:
-- To generate and download the CSV: `/benchmark_historical_csv/""",
+- To generate and download the CSV: `/benchmark_historical_csv/`
+- To download it gzipped: `/benchmark_historical_csv/?compress=true`""",
             response_description="A CSV file containing historical raw benchmarks and overall normalized scores.")
-async def get_benchmark_historical_csv(db: Session = Depends(get_db)):
+async def get_benchmark_historical_csv(compress: bool = Query(False)):
+    from web_app.app.utils.csv_export import stream_benchmark_historical_csv
     logger.info("Generating benchmark historical CSV.")    
-    # Retrieve historical data from the database for raw benchmarks and overall scores
-    raw_data = db.query(RawBenchmarkSubscores).order_by(RawBenchmarkSubscores.datetime).all()
-    overall_data = db.query(OverallNormalizedScore).order_by(OverallNormalizedScore.datetime).all()
-    # Convert the data to a pandas DataFrame
-    raw_df = pd.DataFrame([{
-        "datetime": entry.datetime,
-        "hostname": entry.hostname,
-        "IP_address": entry.IP_address,
-        "cpu_speed_test__events_per_second": entry.cpu_speed_test__events_per_second,
-        "fileio_test__reads_per_second": entry.fileio_test__reads_per_second,
-        "memory_speed_test__MiB_transferred": entry.memory_speed_test__MiB_transferred,
-        "mutex_test__avg_latency": entry.mutex_test__avg_latency,
-        "threads_test__avg_latency": entry.threads_test__avg_latency} for entry in raw_data])
-    overall_df = pd.DataFrame([{
-        "datetime": entry.datetime,
-        "hostname": entry.hostname,
-        "IP_address": entry.IP_address,
-        "overall_score": entry.overall_score
-    } for entry in overall_data])
-    # Ensure both DataFrames are sorted by datetime
-    raw_df.sort_values('datetime', inplace=True)
-    overall_df.sort_values('datetime', inplace=True)
-    # Merge the DataFrames using the closest timestamps
-    merged_df = pd.merge_asof(raw_df, overall_df, on='datetime', direction='nearest')
-    # Create a CSV in memory
-    csv_file = StringIO()
-    merged_df.to_csv(csv_file, index=False)
-    # Set the file pointer to the beginning of the file
-    csv_file.seek(0)
-    # Get the current datetime
-    current_datetime = datetime.now()
     # Format the CSV filename
-    filename = current_datetime.strftime("benchmark_historical_data__as_of_%m_%d_%Y__%H_%M.csv")
-    logger.info("Benchmark historical CSV generated.")    
-    # Return the CSV file as a response
-    return StreamingResponse(csv_file, media_type="text/csv", headers={"Content-Disposition": f"attachment;filename={filename}"})
+    filename = datetime.now().strftime("benchmark_historical_data__as_of_%m_%d_%Y__%H_%M.csv")
+    media_type = "text/csv"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(iterate_in_pool(export_pool, stream_benchmark_historical_csv(compress)), media_type=media_type, headers={"Content-Disposition": f"attachment;filename={filename}"})
+
+
+
+@router.get("/metrics",
+            summary="Prometheus Metrics",
+            description="""Expose the pipeline's instrumentation for Prometheus to scrape.
+
+### Description:
+- Latency histograms for chart requests (by outcome: `rendered`, `cache_hit`, `not_modified`), CSV exports, ingest (by source) and every scheduler phase and playbook task.
+- Rows ingested per table (a counter and the size of the last ingest), per-host benchmark durations, scheduler lag and the time the last scheduler job completed.
+- The latest subscores (including extended metrics) and overall score of every host, as gauges labelled with the hostname, IP address and metric.
+- Clients that send `Accept: application/openmetrics-text` get the OpenMetrics format, everyone else the Prometheus text format.""",
+            response_description="Metrics in the Prometheus or OpenMetrics text format.")
+def get_metrics(request: Request):
+    if "application/openmetrics-text" in request.headers.get("accept", ""):
+        return Response(openmetrics_exposition.generate_latest(REGISTRY), media_type=openmetrics_exposition.CONTENT_TYPE_LATEST)
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
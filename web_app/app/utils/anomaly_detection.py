@@ -0,0 +1,127 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, BenchmarkAlert, DetectionWatermark
+from web_app.app.database.bulk_upsert import upsert_rows
+from web_app.app.database.hosts import host_conditions, select_columns
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.ingest import RAW_METRIC_COLUMNS
+from web_app.app.utils.extended_metrics import load_extended_metrics
+from web_app.app.utils.scoring import metric_directions
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from decouple import config
+import numpy as np
+import pandas as pd
+
+logger = setup_logger()
+ANOMALY_BASELINE_POINTS = config("ANOMALY_BASELINE_POINTS", default=30, cast=int)
+ANOMALY_MIN_BASELINE_POINTS = config("ANOMALY_MIN_BASELINE_POINTS", default=8, cast=int)
+ANOMALY_LOOKBACK_DAYS = config("ANOMALY_LOOKBACK_DAYS", default=30, cast=int)
+ANOMALY_Z_SCORE_THRESHOLD = config("ANOMALY_Z_SCORE_THRESHOLD", default=5.0, cast=float)
+ANOMALY_MIN_RELATIVE_CHANGE = config("ANOMALY_MIN_RELATIVE_CHANGE", default=0.1, cast=float)
+ANOMALY_DETECTION_BATCH_SIZE = config("ANOMALY_DETECTION_BATCH_SIZE", default=50000, cast=int)
+MAD_TO_STANDARD_DEVIATION = 1.4826  # Makes the MAD of normally distributed data comparable to its standard deviation
+WATERMARK_NAME = "anomaly_detection"
+ALERT_CONFLICT_COLUMNS = ["hostname", "metric", "datetime"]
+
+
+def previous_value_windows(values, series_starts, positions, window):
+    """Return the `window` values preceding each of `positions` within its own series, NaN-padded at series starts.
+
+    `values` is sorted by series and time and `series_starts[i]` is the position of the first value of row i's
+    series, so all series are handled in one (len(positions), window) NumPy gather.
+    """
+    indices = positions[:, None] - np.arange(1, window + 1)[None, :]
+    inside_series = indices >= series_starts[positions][:, None]
+    return np.where(inside_series, values[np.clip(indices, 0, None)], np.nan)
+
+
+def score_against_baseline(long_df, target_mask):
+    """Compare every target row to the median/MAD of the ANOMALY_BASELINE_POINTS earlier values of its series.
+
+    `long_df` holds (hostname, metric, datetime, value) rows sorted by series and time. Returns the target rows
+    with baseline statistics and a robust z-score that is positive when the value moved in the worse direction.
+    """
+    values = long_df["value"].to_numpy(dtype=float)
+    series_codes = long_df.groupby(["hostname", "metric"], sort=False).ngroup().to_numpy()
+    is_series_start = np.r_[True, series_codes[1:] != series_codes[:-1]]
+    series_starts = np.maximum.accumulate(np.where(is_series_start, np.arange(len(values)), 0))
+    positions = np.flatnonzero(target_mask)
+    windows = previous_value_windows(values, series_starts, positions, ANOMALY_BASELINE_POINTS)
+    baseline_counts = np.sum(~np.isnan(windows), axis=1)
+    has_baseline = baseline_counts >= ANOMALY_MIN_BASELINE_POINTS
+    windows, positions = windows[has_baseline], positions[has_baseline]
+    medians = np.nanmedian(windows, axis=1)
+    mads = np.nanmedian(np.abs(windows - medians[:, None]), axis=1)
+    target_df = long_df.iloc[positions].copy()
+    changes = target_df["value"].to_numpy() - medians
+    # A perfectly flat baseline has no spread; a tiny floor keeps the z-score finite instead of dividing by zero
+    scales = np.maximum(MAD_TO_STANDARD_DEVIATION * mads, 1e-9 * np.maximum(np.abs(medians), 1.0))
+    target_df["baseline_median"] = medians
+    target_df["baseline_mad"] = mads
+    target_df["robust_z_score"] = -metric_directions(target_df["metric"]) * changes / scales
+    target_df["relative_change"] = changes / np.where(medians != 0, np.abs(medians), np.nan)
+    return target_df
+
+
+def rows_written_after(last_updated_at, last_id):
+    # Rows written before updated_at existed have none and come first, in id order
+    if last_updated_at is None:
+        return or_(and_(RawBenchmarkSubscores.updated_at.is_(None), RawBenchmarkSubscores.id > last_id), RawBenchmarkSubscores.updated_at.is_not(None))
+    return or_(RawBenchmarkSubscores.updated_at > last_updated_at,
+               and_(RawBenchmarkSubscores.updated_at == last_updated_at, RawBenchmarkSubscores.id > last_id))
+
+
+def detect_batch(db: Session, new_rows_df):
+    # Loads just enough history of the affected hosts to give every new point its baseline window
+    hostnames = new_rows_df["hostname"].unique().tolist()
+    history_start = new_rows_df["datetime"].min() - timedelta(days=ANOMALY_LOOKBACK_DAYS)
+    query = select_columns(RawBenchmarkSubscores, ["id", "datetime", "hostname", "IP_address"] + RAW_METRIC_COLUMNS)
+    query = query.where(*host_conditions(RawBenchmarkSubscores, hostnames))
+    query = query.where(RawBenchmarkSubscores.datetime >= history_start, RawBenchmarkSubscores.datetime <= new_rows_df["datetime"].max())
+    wide_df = pd.DataFrame(db.execute(query).all(), columns=["id", "datetime", "hostname", "IP_address"] + RAW_METRIC_COLUMNS)
+    wide_df["datetime"] = pd.to_datetime(wide_df["datetime"])
+    long_df = wide_df.melt(id_vars=["id", "datetime", "hostname", "IP_address"], var_name="metric", value_name="value")
+    # Metrics from the registry without a column are stored per run alongside the raw row and share its id
+    extended_df = load_extended_metrics(db, hostnames, history_start, new_rows_df["datetime"].max())
+    extended_df = extended_df.merge(wide_df[["id", "datetime", "hostname", "IP_address"]], on=["datetime", "hostname"])
+    long_df = pd.concat([long_df, extended_df[long_df.columns]], ignore_index=True).dropna(subset=["value"])
+    long_df = long_df.sort_values(["hostname", "metric", "datetime", "id"]).reset_index(drop=True)
+    if long_df.empty:
+        return []
+    scored_df = score_against_baseline(long_df, long_df["id"].isin(new_rows_df["id"]).to_numpy())
+    alerts_df = scored_df[(scored_df["robust_z_score"] >= ANOMALY_Z_SCORE_THRESHOLD) & (scored_df["relative_change"].abs() >= ANOMALY_MIN_RELATIVE_CHANGE)]
+    detected_at = datetime.now()
+    return [{"datetime": row.datetime.to_pydatetime(), "hostname": row.hostname, "IP_address": row.IP_address, "metric": row.metric,
+             "value": row.value, "baseline_median": row.baseline_median, "baseline_mad": row.baseline_mad,
+             "robust_z_score": row.robust_z_score, "relative_change": row.relative_change, "detected_at": detected_at}
+            for row in alerts_df.itertuples(index=False)]
+
+
+def detect_anomalies(db: Session, batch_size=ANOMALY_DETECTION_BATCH_SIZE):
+    """Flag raw subscores that regressed against their host's rolling baseline, and store them in `benchmark_alerts`.
+
+    Only rows written since the previous call, new or changed in place by a re-ingest, are checked. They are tracked
+    by (updated_at, id) in `detection_watermarks`, so every run costs the new points plus their baseline windows. The
+    first call works through the whole history in batches.
+    """
+    watermark = db.get(DetectionWatermark, WATERMARK_NAME) or DetectionWatermark(name=WATERMARK_NAME, last_id=0)
+    number_of_alerts = 0
+    while True:
+        new_rows = db.execute(select_columns(RawBenchmarkSubscores, ["id", "datetime", "hostname", "updated_at"])
+                              .where(rows_written_after(watermark.last_updated_at, watermark.last_id))
+                              .order_by(RawBenchmarkSubscores.updated_at.asc().nulls_first(), RawBenchmarkSubscores.id).limit(batch_size)).all()
+        if not new_rows:
+            break
+        new_rows_df = pd.DataFrame([row[:3] for row in new_rows], columns=["id", "datetime", "hostname"])
+        new_rows_df["datetime"] = pd.to_datetime(new_rows_df["datetime"])
+        alert_rows = detect_batch(db, new_rows_df)
+        upsert_rows(db, BenchmarkAlert, alert_rows, ALERT_CONFLICT_COLUMNS)
+        # The watermark is committed with the alerts it covers
+        watermark.last_updated_at, watermark.last_id = new_rows[-1].updated_at, new_rows[-1].id
+        watermark.updated_at = datetime.now()
+        watermark = db.merge(watermark)
+        db.commit()
+        number_of_alerts += len(alert_rows)
+    if number_of_alerts:
+        logger.warning(f"Detected {number_of_alerts} benchmark regressions; see /alerts/.")
+    return number_of_alerts
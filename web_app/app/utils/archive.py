@@ -0,0 +1,281 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, BenchmarkMetric
+from web_app.app.database.init_db import engine
+from web_app.app.database.bulk_upsert import chunked
+from web_app.app.database.hosts import select_columns
+from web_app.app.logger_config import setup_logger
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import and_, itemgetter
+from contextlib import contextmanager
+from sqlalchemy import delete, Integer, Float, String, DateTime
+from sqlalchemy.orm import Session
+from decouple import config
+import fcntl
+import heapq
+import json
+import os
+import uuid
+import zlib
+
+# Cold tier for old raw rows: rows older than ARCHIVE_RETENTION_DAYS move from the database into Parquet files
+# partitioned by month and host group (<table>/month=YYYY-MM/host_group=N/*.parquet), and the readers below merge
+# them back in, so the API, exports and charts see one history while the database only holds recent rows.
+# pandas and pyarrow are imported where they are used, so the API only loads them once there is an archive to read.
+logger = setup_logger()
+ARCHIVE_RETENTION_DAYS = config("ARCHIVE_RETENTION_DAYS", default=0, cast=int)  # 0 keeps every row in the database
+ARCHIVE_DIRECTORY = config("ARCHIVE_DIRECTORY", default="benchmark_archive")
+ARCHIVE_HOST_GROUPS = config("ARCHIVE_HOST_GROUPS", default=16, cast=int)
+ARCHIVE_BATCH_SIZE = config("ARCHIVE_BATCH_SIZE", default=50000, cast=int)
+ARCHIVE_VACUUM = config("ARCHIVE_VACUUM", default=True, cast=bool)
+ARCHIVED_MODELS = [RawBenchmarkSubscores, BenchmarkMetric]
+LAYOUT_FILE_NAME = "layout.json"
+LOCK_FILE_NAME = "archive.lock"
+
+
+@contextmanager
+def archive_lock(exclusive=False):
+    # Readers share the lock; compaction takes it exclusively while it swaps files that readers in any worker
+    # process could otherwise be scanning
+    os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIRECTORY, LOCK_FILE_NAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield  # Closing the file releases the lock
+
+
+def archive_columns(model):
+    # Archived rows keep their hostname, which partitions and filters the archive, next to the host_id the table stores
+    return [column.name for column in model.__table__.columns] + ["hostname"]
+
+
+def arrow_schema(model):
+    # Fixed from the model, so a batch whose column happens to be all NULL still writes the same types
+    import pyarrow as pa
+    arrow_types = {Integer: pa.int64(), Float: pa.float64(), String: pa.string(), DateTime: pa.timestamp("us")}
+    column_types = {**{column.name: arrow_types[type(column.type)] for column in model.__table__.columns}, "hostname": pa.string()}
+    return pa.schema([(name, column_types[name]) for name in archive_columns(model)])
+
+
+def partition_schema():
+    import pyarrow as pa
+    return pa.schema([("month", pa.string()), ("host_group", pa.int32())])
+
+
+def table_directory(model):
+    return os.path.join(ARCHIVE_DIRECTORY, model.__tablename__)
+
+
+def is_archived(model):
+    return model in ARCHIVED_MODELS and os.path.isdir(table_directory(model))
+
+
+def archive_host_groups():
+    # The host group count the archive was first written with wins, so changing the setting never hides old files
+    layout_path = os.path.join(ARCHIVE_DIRECTORY, LAYOUT_FILE_NAME)
+    if os.path.exists(layout_path):
+        with open(layout_path) as f:
+            return json.load(f)["host_groups"]
+    os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+    with open(layout_path, 'w') as f:
+        json.dump({"host_groups": ARCHIVE_HOST_GROUPS}, f)
+    return ARCHIVE_HOST_GROUPS
+
+
+def host_group(hostname, number_of_groups):
+    return zlib.crc32(hostname.encode()) % number_of_groups
+
+
+def month_of(moment):
+    return moment.strftime("%Y-%m")
+
+
+def archive_cutoff(retention_days, now=None):
+    # Whole days, so rows cross the cutoff (and the database is vacuumed) at most once a day
+    return (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=retention_days)
+
+
+def archive_old_rows(db: Session, retention_days=ARCHIVE_RETENTION_DAYS, now=None):
+    """Move rows older than `retention_days` from the archived tables into Parquet, then compact and vacuum.
+
+    Each batch is written before it is deleted, so a crash can only leave rows in both places; readers drop the
+    duplicates by id and the next compaction removes them.
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff = archive_cutoff(retention_days, now)
+    number_of_rows = sum(archive_model_rows(db, model, cutoff) for model in ARCHIVED_MODELS)
+    if number_of_rows:
+        logger.info(f"Archived {number_of_rows} rows older than {cutoff} to {ARCHIVE_DIRECTORY}.")
+        if ARCHIVE_VACUUM:
+            vacuum_database()
+    return number_of_rows
+
+
+def archive_model_rows(db: Session, model, cutoff):
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    schema = arrow_schema(model)
+    number_of_groups = archive_host_groups()
+    touched_partitions = set()
+    number_of_rows = 0
+    query = select_columns(model, archive_columns(model)).where(model.datetime < cutoff).order_by(model.datetime, model.id).limit(ARCHIVE_BATCH_SIZE)
+    while True:
+        rows = db.execute(query).all()
+        if not rows:
+            break
+        df = pd.DataFrame(rows, columns=schema.names)
+        df["datetime"] = pd.to_datetime(df["datetime"])
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        months = df["datetime"].dt.strftime("%Y-%m")
+        groups = df["hostname"].map(lambda hostname: host_group(hostname, number_of_groups)).astype("int32")
+        table = table.append_column("month", pa.array(months, pa.string())).append_column("host_group", pa.array(groups, pa.int32()))
+        with archive_lock(exclusive=True):  # Readers must not scan a half-written file
+            ds.write_dataset(table, table_directory(model), format="parquet", partitioning=ds.partitioning(partition_schema(), flavor="hive"),
+                             basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore")
+        touched_partitions.update(zip(months, groups))
+        for ids in chunked(df["id"].tolist(), 1000):
+            db.execute(delete(model).where(model.id.in_(ids)))
+        db.commit()
+        number_of_rows += len(rows)
+    for month, group in sorted(touched_partitions):
+        compact_partition(os.path.join(table_directory(model), f"month={month}", f"host_group={group}"), schema)
+    return number_of_rows
+
+
+def compact_partition(partition_directory, schema):
+    # Every archive run adds a file per partition; merging them keeps scans to one sorted file per partition
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    file_paths = sorted(os.path.join(partition_directory, name) for name in os.listdir(partition_directory) if name.endswith(".parquet"))
+    if len(file_paths) < 2:
+        return
+    # The merged file is written under a name dataset discovery skips (a leading dot), so readers are only held up
+    # while the files are swapped
+    df = ds.dataset(file_paths, schema=schema, format="parquet").to_table().to_pandas().drop_duplicates(subset="id").sort_values(["datetime", "id"])
+    temporary_path = os.path.join(partition_directory, f".compacted-{uuid.uuid4().hex}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), temporary_path)
+    with archive_lock(exclusive=True):
+        os.replace(temporary_path, os.path.join(partition_directory, f"part-{uuid.uuid4().hex}-0.parquet"))
+        for file_path in file_paths:
+            os.remove(file_path)
+
+
+def vacuum_database():
+    # VACUUM cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if engine.dialect.name == "sqlite":
+            connection.exec_driver_sql("VACUUM")
+            connection.exec_driver_sql("PRAGMA optimize")
+        else:
+            for model in ARCHIVED_MODELS:
+                connection.exec_driver_sql(f"VACUUM ANALYZE {model.__tablename__}")
+    logger.info("Vacuumed the database after archiving.")
+
+
+def archive_filter(start=None, end=None, hostnames=None, values=None, number_of_groups=None):
+    # Month and host group prune whole directories; the datetime and value bounds are pushed down to row groups
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    conditions = []
+    if start is not None:
+        conditions += [ds.field("month") >= month_of(start), ds.field("datetime") >= pa.scalar(start, pa.timestamp("us"))]
+    if end is not None:
+        conditions += [ds.field("month") <= month_of(end), ds.field("datetime") <= pa.scalar(end, pa.timestamp("us"))]
+    if hostnames is not None:
+        conditions += [ds.field("host_group").isin(sorted({host_group(hostname, number_of_groups) for hostname in hostnames})),
+                       ds.field("hostname").isin(list(hostnames))]
+    for column, allowed_values in (values or {}).items():
+        conditions.append(ds.field(column).isin(list(allowed_values)))
+    return reduce(and_, conditions) if conditions else None
+
+
+def iterate_archived_frames(model, columns, start=None, end=None, hostnames=None, after=None, values=None):
+    """Yield the archived rows of `model` one month at a time, in (datetime, id) order, as DataFrames of `columns`.
+
+    `end` is inclusive, `after` is a keyset cursor (datetime, id) and `values` maps columns to their allowed values.
+    """
+    if not is_archived(model):
+        return
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    if after is not None:
+        start = max(start, after[0]) if start is not None else after[0]
+    read_columns = list(dict.fromkeys(list(columns) + ["datetime", "id"]))
+    number_of_groups = archive_host_groups()
+    months = sorted(name.split("=", 1)[1] for name in os.listdir(table_directory(model)) if name.startswith("month="))
+    for month in months:
+        if (start is not None and month < month_of(start)) or (end is not None and month > month_of(end)):
+            continue
+        month_filter = ds.field("month") == month
+        expression = archive_filter(start, end, hostnames, values, number_of_groups)
+        with archive_lock():
+            dataset = ds.dataset(table_directory(model), format="parquet", partitioning=ds.partitioning(partition_schema(), flavor="hive"),
+                                 schema=pa.unify_schemas([arrow_schema(model), partition_schema()]))
+            table = dataset.to_table(columns=read_columns, filter=month_filter if expression is None else month_filter & expression)
+        df = table.to_pandas().drop_duplicates(subset="id").sort_values(["datetime", "id"])
+        if after is not None:
+            df = df[(df["datetime"] > after[0]) | ((df["datetime"] == after[0]) & (df["id"] > after[1]))]
+        if not df.empty:
+            yield df[list(columns)].reset_index(drop=True)
+
+
+def read_archived_frame(model, columns, start=None, end=None, hostnames=None, values=None):
+    import pandas as pd
+    frames = list(iterate_archived_frames(model, columns, start, end, hostnames, values=values))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(columns))
+
+
+def month_column_bounds(model, month, column="datetime"):
+    # (min, max) of a column over one month's archived rows, from the row group statistics in the Parquet footers
+    import pyarrow.parquet as pq
+    month_directory = os.path.join(table_directory(model), f"month={month}")
+    lows, highs = [], []
+    with archive_lock():
+        for group in os.listdir(month_directory):
+            for name in os.listdir(os.path.join(month_directory, group)):
+                if not name.endswith(".parquet"):
+                    continue
+                metadata = pq.read_metadata(os.path.join(month_directory, group, name))
+                column_index = metadata.schema.names.index(column)
+                for row_group_index in range(metadata.num_row_groups):
+                    statistics = metadata.row_group(row_group_index).column(column_index).statistics
+                    if statistics is not None and statistics.has_min_max:
+                        lows.append(statistics.min)
+                        highs.append(statistics.max)
+    return (min(lows), max(highs)) if lows else None
+
+
+def archived_time_range(model):
+    """Return the (min, max) datetime of the archived rows of `model`, or (None, None), reading only the footers of
+    the first and last month that hold rows."""
+    if not is_archived(model):
+        return None, None
+    months = sorted(name.split("=", 1)[1] for name in os.listdir(table_directory(model)) if name.startswith("month="))
+    first = next((bounds for bounds in (month_column_bounds(model, month) for month in months) if bounds), None)
+    if first is None:
+        return None, None
+    last = next(bounds for bounds in (month_column_bounds(model, month) for month in reversed(months)) if bounds)
+    return first[0], last[1]
+
+
+def archived_max_id(model):
+    # The highest row id in the archive, or 0; new rows must never be given an id an archived row already has
+    if not is_archived(model):
+        return 0
+    months = [name.split("=", 1)[1] for name in os.listdir(table_directory(model)) if name.startswith("month=")]
+    return max([bounds[1] for bounds in (month_column_bounds(model, month, "id") for month in months) if bounds] or [0])
+
+
+def archived_rows(model, columns, start=None, hostnames=None, after=None):
+    # Plain Python tuples (None for NULL), the shape database rows come in
+    for df in iterate_archived_frames(model, columns, start, None, hostnames, after):
+        df = df.astype(object).where(df.notna(), None)
+        if "datetime" in df.columns:
+            df["datetime"] = [value.to_pydatetime() for value in df["datetime"]]
+        yield from df.itertuples(index=False, name=None)
+
+
+def merge_sorted_rows(database_rows, archive_rows, columns):
+    # Both inputs are ordered by (datetime, id); rows ingested late can make them overlap in time
+    return heapq.merge(database_rows, archive_rows, key=itemgetter(columns.index("datetime"), columns.index("id")))
@@ -0,0 +1,59 @@
+from web_app.app.logger_config import setup_logger
+from collections import OrderedDict
+from threading import Lock
+from decouple import config
+
+logger = setup_logger()
+CHART_CACHE_MAX_ENTRIES = config("CHART_CACHE_MAX_ENTRIES", default=8, cast=int)
+# Read here rather than in chart.py, so the API can validate chart requests without importing pandas and Plotly
+MAX_DATA_POINTS_FOR_CHART = config("MAX_DATA_POINTS_FOR_CHART", cast=int)
+CHART_POINTS_PER_HOST = config("CHART_POINTS_PER_HOST", default=200, cast=int)
+
+
+class RenderedChartCache:
+    """In-process LRU cache of rendered chart HTML.
+
+    Keys include the ingest generation, so entries rendered before the latest ingest are never served again
+    and simply age out of the LRU order.
+    """
+    def __init__(self, max_entries=CHART_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                evicted_key, _ = self.entries.popitem(last=False)
+                logger.info(f"Evicted rendered chart {evicted_key} from the chart cache.")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+chart_cache = RenderedChartCache()
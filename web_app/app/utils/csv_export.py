@@ -0,0 +1,89 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore
+from web_app.app.database.init_db import SessionLocal
+from web_app.app.database.hosts import select_columns
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.keyset_pagination import rows_after, batched
+from web_app.app.utils.archive import archived_rows, merge_sorted_rows
+from web_app.app.utils.extended_metrics import attach_extended_metrics
+from web_app.app.utils.metric_registry import column_metrics, extended_metrics
+from web_app.app.utils.instrumentation import CSV_EXPORT_SECONDS, CSV_EXPORT_ROWS
+from decouple import config
+import pandas as pd
+import time
+import zlib
+
+logger = setup_logger()
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=5000, cast=int)
+EXPORT_MATCH_TOLERANCE_MINUTES = config("EXPORT_MATCH_TOLERANCE_MINUTES", default=60, cast=int)
+RAW_EXPORT_COLUMNS = ['datetime', 'hostname', 'IP_address'] + column_metrics()
+EXPORT_COLUMNS = RAW_EXPORT_COLUMNS + ['overall_score']
+
+
+def export_columns():
+    # Registered extended metrics follow the overall score; taken from the registry so the header needs no query
+    return EXPORT_COLUMNS + extended_metrics()
+
+
+def iterate_raw_rows(db):
+    # Keyset pagination on (datetime, id), EXPORT_CHUNK_SIZE rows per query
+    raw_query = select_columns(RawBenchmarkSubscores, ['id'] + RAW_EXPORT_COLUMNS)
+    raw_query = raw_query.order_by(RawBenchmarkSubscores.datetime, RawBenchmarkSubscores.id).limit(EXPORT_CHUNK_SIZE)
+    cursor = None
+    while True:
+        query = raw_query if cursor is None else raw_query.where(rows_after(RawBenchmarkSubscores, *cursor))
+        raw_rows = db.execute(query).all()
+        if not raw_rows:
+            return
+        cursor = (raw_rows[-1].datetime, raw_rows[-1].id)
+        yield from raw_rows
+
+
+def iterate_merged_chunks(db):
+    """Yield DataFrames of raw subscores joined to each host's nearest overall score, one time-ordered chunk at a time.
+
+    Raw rows are read with keyset pagination on (datetime, id), merged with any archived rows; for each chunk only the
+    overall scores inside the chunk's time range (widened by the match tolerance) are loaded, so memory stays bounded
+    by EXPORT_CHUNK_SIZE.
+    """
+    tolerance = pd.Timedelta(minutes=EXPORT_MATCH_TOLERANCE_MINUTES)
+    columns = ['id'] + RAW_EXPORT_COLUMNS
+    rows = merge_sorted_rows(iterate_raw_rows(db), archived_rows(RawBenchmarkSubscores, columns), columns)
+    for raw_rows in batched(rows, EXPORT_CHUNK_SIZE):
+        raw_df = pd.DataFrame(raw_rows, columns=columns).drop(columns='id')
+        raw_df['datetime'] = pd.to_datetime(raw_df['datetime'])
+        overall_rows = db.execute(
+            select_columns(OverallNormalizedScore, ['datetime', 'hostname', 'overall_score'])
+            .where(OverallNormalizedScore.datetime >= raw_df['datetime'].iloc[0] - tolerance)
+            .where(OverallNormalizedScore.datetime <= raw_df['datetime'].iloc[-1] + tolerance)
+            .order_by(OverallNormalizedScore.datetime)
+        ).all()
+        overall_df = pd.DataFrame(overall_rows, columns=['datetime', 'hostname', 'overall_score'])
+        overall_df['datetime'] = pd.to_datetime(overall_df['datetime'])
+        # Match each raw row to the closest overall score of the same host only
+        merged_df = pd.merge_asof(raw_df, overall_df, on='datetime', by='hostname', direction='nearest', tolerance=tolerance)
+        # Extended metrics were stored with the raw row, so they match on the exact (datetime, hostname)
+        yield attach_extended_metrics(db, merged_df[EXPORT_COLUMNS], extended_metrics())
+
+
+def stream_benchmark_historical_csv(compress=False):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31 writes a gzip container
+
+    def encode(text):
+        return compressor.compress(text.encode()) if compressor else text.encode()
+
+    start_time = time.perf_counter()
+    db = SessionLocal()
+    try:
+        # The header goes out before any query runs, so clients get the first byte immediately
+        yield encode(",".join(export_columns()) + "\n")
+        number_of_rows = 0
+        for merged_df in iterate_merged_chunks(db):
+            number_of_rows += len(merged_df)
+            CSV_EXPORT_ROWS.inc(len(merged_df))
+            yield encode(merged_df.to_csv(index=False, header=False))
+        if compressor:
+            yield compressor.flush()
+        CSV_EXPORT_SECONDS.observe(time.perf_counter() - start_time)
+        logger.info(f"Benchmark historical CSV streamed with {number_of_rows} rows.")
+    finally:
+        db.close()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+
+def minmax_downsample(df, value_columns, points, group_column="hostname", time_column="datetime"):
+    """Reduce each (group, metric) series to at most `points` rows using min/max bucketing.
+
+    The time range of every group is split into `points // 2` equal-width buckets and the rows holding the
+    minimum and maximum value of each bucket are kept, so spikes and dips survive the reduction. Everything
+    is computed with grouped pandas/NumPy operations rather than per-host Python loops.
+
+    Returns a long-format frame with the group and time columns plus `metric` and `value`.
+    """
+    id_columns = [column for column in df.columns if column not in value_columns]
+    long_df = df.melt(id_vars=id_columns, value_vars=value_columns, var_name="metric", value_name="value")
+    long_df = long_df.dropna(subset=["value"])
+    if long_df.empty:
+        return long_df
+    series_keys = [group_column, "metric"]
+    grouped_times = long_df.groupby(series_keys)[time_column]
+    series_sizes = grouped_times.transform("size").to_numpy()
+    start_times = grouped_times.transform("min").to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    end_times = grouped_times.transform("max").to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    times = long_df[time_column].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    number_of_buckets = max(points // 2, 1)
+    spans = np.maximum(end_times - start_times, 1)
+    buckets = np.minimum((times - start_times) / spans * number_of_buckets, number_of_buckets - 1).astype(np.int64)
+    # Series that already fit within the budget are kept untouched
+    needs_reduction = series_sizes > points
+    kept_df = long_df[~needs_reduction]
+    reduced_df = long_df[needs_reduction].assign(bucket=buckets[needs_reduction])
+    if not reduced_df.empty:
+        bucket_groups = reduced_df.groupby(series_keys + ["bucket"])["value"]
+        selected_index = pd.Index(bucket_groups.idxmin()).union(pd.Index(bucket_groups.idxmax()))
+        reduced_df = reduced_df.loc[selected_index].drop(columns="bucket")
+    result = pd.concat([kept_df, reduced_df])
+    return result.sort_values(series_keys + [time_column]).reset_index(drop=True)
@@ -0,0 +1,71 @@
+from web_app.app.database.data_models import BenchmarkMetric
+from web_app.app.database.hosts import host_conditions, select_columns
+from web_app.app.utils.metric_registry import is_column_metric, sort_metrics
+from web_app.app.utils.trials import aggregate_trials
+from web_app.app.utils.archive import is_archived, read_archived_frame
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import pandas as pd
+
+# Metrics without their own raw_benchmark_subscores column live in the long-format benchmark_metrics table;
+# these helpers turn them into rows on ingest and back into wide (datetime, hostname, *metrics) frames on read.
+
+
+def build_metric_rows(raw_data, datetime_from_run):
+    rows = []
+    for hostname, metrics in raw_data.items():
+        for metric, value in metrics.items():
+            value = aggregate_trials(value)
+            if not is_column_metric(metric) and value is not None:
+                rows.append({"datetime": datetime_from_run, "hostname": hostname, "metric": metric, "value": value})
+    return rows
+
+
+def extended_metrics_query(hostnames=None, start=None, end=None, metrics=None):
+    query = select_columns(BenchmarkMetric, ["datetime", "hostname", "metric", "value"])
+    if hostnames is not None:
+        query = query.where(*host_conditions(BenchmarkMetric, hostnames))
+    if start is not None:
+        query = query.where(BenchmarkMetric.datetime >= start)
+    if end is not None:
+        query = query.where(BenchmarkMetric.datetime <= end)
+    if metrics is not None:
+        query = query.where(BenchmarkMetric.metric.in_(list(metrics)))
+    return query
+
+
+def load_extended_metrics(db: Session, hostnames=None, start=None, end=None, metrics=None):
+    columns = ["datetime", "hostname", "metric", "value"]
+    long_df = pd.DataFrame(db.execute(extended_metrics_query(hostnames, start, end, metrics)).all(), columns=columns)
+    if is_archived(BenchmarkMetric):
+        archived_df = read_archived_frame(BenchmarkMetric, columns, start, end, hostnames, {"metric": metrics} if metrics is not None else None)
+        long_df = pd.concat([archived_df, long_df], ignore_index=True) if not archived_df.empty else long_df
+    long_df["datetime"] = pd.to_datetime(long_df["datetime"])
+    return long_df
+
+
+def pivot_extended_metrics(long_df):
+    if long_df.empty:
+        return pd.DataFrame(columns=["datetime", "hostname"])
+    wide_df = long_df.pivot_table(index=["datetime", "hostname"], columns="metric", values="value", aggfunc="first").reset_index()
+    wide_df.columns.name = None
+    return wide_df[["datetime", "hostname"] + sort_metrics([column for column in wide_df.columns if column not in ("datetime", "hostname")])]
+
+
+def attach_extended_metrics(db: Session, wide_df, metrics=None):
+    """Add one column per extended metric to a frame of (datetime, hostname) rows, e.g. a chunk of raw subscores.
+
+    `metrics` fixes the added columns (missing ones are all NaN); by default every metric found is added.
+    """
+    if wide_df.empty:
+        return wide_df.reindex(columns=list(wide_df.columns) + list(metrics or []))
+    long_df = load_extended_metrics(db, wide_df["hostname"].unique(), wide_df["datetime"].min(), wide_df["datetime"].max(), metrics)
+    extended_df = pivot_extended_metrics(long_df)
+    merged_df = wide_df.merge(extended_df, on=["datetime", "hostname"], how="left")
+    if metrics is not None:
+        merged_df = merged_df.reindex(columns=list(wide_df.columns) + list(metrics))
+    return merged_df
+
+
+def extended_metric_names(db: Session):
+    return sort_metrics(db.execute(select(BenchmarkMetric.metric).distinct()).scalars().all())
@@ -0,0 +1,115 @@
+from web_app.app.utils.metric_registry import METRIC_REGISTRY
+from web_app.app.utils.scoring import score_hosts, DEFAULT_CUSTOM_WEIGHTS
+from web_app.app.utils.trials import aggregate_host_trials
+from datetime import datetime, timezone
+from functools import lru_cache
+import fcntl
+import json
+import math
+import os
+import random
+import zlib
+
+# Fake sysbench results for a simulated fleet, written in the playbook's output formats, so ingest, charts and the
+# API can be load-tested without real hosts. Every host gets a stable hardware profile derived from its hostname,
+# so its series look like one machine over time: per-run noise, the odd noisy-neighbour slowdown and failed test.
+VCPU_CHOICES = [1, 2, 4, 8, 16]
+RUN_NOISE = 0.03  # Log-normal sigma of run-to-run variation
+NOISY_NEIGHBOUR_PROBABILITY = 0.02
+NOISY_NEIGHBOUR_SLOWDOWN = (1.2, 1.6)
+FAILED_TEST_PROBABILITY = 0.005
+PLAYBOOK_THREADS = 4  # The CPU and threads tests run on 4 threads by default
+METRIC_CEILINGS = {"memory_speed_test__MiB_transferred": 102400.0}  # The memory test stops at --memory-total-size=100G
+BENCHMARK_DURATION_SECONDS = (120, 600)  # Time the playbook spends on one host
+
+
+def log_uniform(rng, low, high):
+    return math.exp(rng.uniform(math.log(low), math.log(high)))
+
+
+@lru_cache(maxsize=None)
+def host_profile(hostname):
+    """Return the typical value of every registered metric for `hostname`."""
+    rng = random.Random(zlib.crc32(hostname.encode()))
+    vcpus = rng.choice(VCPU_CHOICES)
+    events_per_core = rng.uniform(300, 1200)
+    random_reads = log_uniform(rng, 100, 20000)
+    random_writes = random_reads * rng.uniform(0.6, 0.7)
+    sequential_read = log_uniform(rng, 100, 3000)
+    mutex_latency = rng.uniform(0.1, 5.0)
+    threads_latency = rng.uniform(0.1, 2.0) * max(1.0, PLAYBOOK_THREADS / vcpus)
+    return {
+        "cpu_speed_test__events_per_second": events_per_core * min(PLAYBOOK_THREADS, vcpus),
+        "fileio_test__reads_per_second": random_reads,
+        "memory_speed_test__MiB_transferred": rng.uniform(20000, 120000),
+        "mutex_test__avg_latency": mutex_latency,
+        "threads_test__avg_latency": threads_latency,
+        "cpu_scaling_test__events_per_second_1_thread": events_per_core,
+        "cpu_scaling_test__events_per_second_nproc_threads": events_per_core * vcpus * rng.uniform(0.9, 0.98),
+        "cpu_scaling_test__events_per_second_2x_nproc_threads": events_per_core * vcpus * rng.uniform(0.95, 1.05),
+        "fileio_test__writes_per_second": random_writes,
+        "fileio_test__fsyncs_per_second": random_writes * 1.28,
+        "fileio_test__seq_read_MiB_per_second": sequential_read,
+        "fileio_test__seq_write_MiB_per_second": sequential_read * rng.uniform(0.3, 0.8),
+        "threads_test__p95_latency": threads_latency * rng.uniform(1.4, 1.8),
+        "threads_test__p99_latency": threads_latency * rng.uniform(2.0, 3.0),
+        "mutex_test__p95_latency": mutex_latency * rng.uniform(1.4, 1.8),
+        "mutex_test__p99_latency": mutex_latency * rng.uniform(2.0, 3.0),
+    }
+
+
+def simulate_host_metrics(hostname, rng, trials=1):
+    # A failed test drops all of its metrics, like a failed playbook task
+    failed_tests = {metric.split("__")[0] for metric in host_profile(hostname) if rng.random() < FAILED_TEST_PROBABILITY}
+    slowdown = rng.uniform(*NOISY_NEIGHBOUR_SLOWDOWN) if rng.random() < NOISY_NEIGHBOUR_PROBABILITY else 1.0
+    metrics = {}
+    for metric, typical_value in host_profile(hostname).items():
+        if metric.split("__")[0] in failed_tests:
+            continue
+        worse = 1 / slowdown if METRIC_REGISTRY[metric].direction > 0 else slowdown
+        ceiling = METRIC_CEILINGS.get(metric, math.inf)
+        values = [round(min(typical_value * worse * rng.lognormvariate(0, RUN_NOISE), ceiling), 2) for _ in range(trials)]
+        metrics[metric] = values if trials > 1 else values[0]
+    return metrics
+
+
+def simulated_fleet(number_of_hosts, prefix="simulated-host"):
+    return {f"{prefix}-{index:05d}.example.com": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}" for index in range(number_of_hosts)}
+
+
+def simulate_run(hostnames, rng, trials=1):
+    """Return one run's {hostname: {metric: value}} results, as the playbook combines them."""
+    return {hostname: simulate_host_metrics(hostname, rng, trials) for hostname in hostnames}
+
+
+def score_run(raw_data):
+    # What the playbook's scoring script writes to the overall results file
+    return score_hosts(aggregate_host_trials(raw_data), weights=DEFAULT_CUSTOM_WEIGHTS)
+
+
+def write_inventory(file_path, host_to_ip):
+    with open(file_path, 'w') as f:
+        f.write("[all]\n" + "".join(f"{hostname} ansible_host={ip}\n" for hostname, ip in host_to_ip.items()))
+
+
+def write_playbook_outputs(raw_data, host_to_ip, combined_results_file=None, overall_results_file=None, ndjson_results_file=None, run_datetime=None):
+    """Write a run's results wherever the playbook would: the combined file, the overall scores and the NDJSON log."""
+    if combined_results_file:
+        with open(combined_results_file, 'w') as f:
+            f.write(",".join(f"{hostname}: {json.dumps(metrics)}" for hostname, metrics in raw_data.items()))
+    if overall_results_file:
+        os.makedirs(os.path.dirname(overall_results_file) or ".", exist_ok=True)
+        with open(overall_results_file, 'w') as f:
+            json.dump(score_run(raw_data), f, indent=4)
+    if ndjson_results_file and raw_data:
+        run_datetime = run_datetime or datetime.now(timezone.utc)
+        timestamp = run_datetime.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        run_id = f"{run_datetime.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{random.randrange(10 ** 9)}"
+        lines = "".join(json.dumps({"run_id": run_id, "timestamp": timestamp, "run_hosts": len(raw_data), "hostname": hostname,
+                                    "ip_address": host_to_ip.get(hostname, hostname), "metrics": metrics,
+                                    "duration_seconds": round(random.uniform(*BENCHMARK_DURATION_SECONDS))}) + "\n"
+                        for hostname, metrics in raw_data.items())
+        # One write under the same lock the playbook takes, so concurrent shards never interleave
+        with open(ndjson_results_file + ".lock", 'w') as lock_file, open(ndjson_results_file, 'a') as f:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            f.write(lines)
@@ -0,0 +1,126 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore, BenchmarkTrialStats, BenchmarkMetric, IngestFileOffset
+from web_app.app.database.bulk_upsert import upsert_rows
+from web_app.app.database.latest_host_scores import upsert_latest_host_scores
+from web_app.app.database.hosts import register_hosts, with_host_ids
+from web_app.app.database.data_generation import bump_ingest_generation
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.rollups import mark_rollups_stale
+from web_app.app.utils.extended_metrics import build_metric_rows
+from web_app.app.utils.metric_registry import column_metrics
+from web_app.app.utils.instrumentation import INGEST_SECONDS, record_ingested_rows, record_host_benchmark_durations
+from web_app.app.utils.results_format import read_ndjson_records, group_records_by_run, parse_record_timestamp
+from web_app.app.utils.scoring import score_hosts, DEFAULT_CUSTOM_WEIGHTS
+from web_app.app.utils.scoring_baseline import SCORING_MODE, baseline_overall_rows
+from web_app.app.utils.trials import aggregate_trials, aggregate_host_trials, build_trial_rows
+from sqlalchemy.orm import Session
+from threading import Lock
+from datetime import datetime
+from decouple import config
+import os
+import time
+
+logger = setup_logger()
+NDJSON_INGEST_BATCH_SIZE = config("NDJSON_INGEST_BATCH_SIZE", default=5000, cast=int)
+
+RAW_METRIC_COLUMNS = column_metrics()  # Every other metric goes to the long-format benchmark_metrics table
+CONFLICT_COLUMNS = ["datetime", "host_id"]  # Matches the uix_1/uix_2 unique constraints
+TRIAL_CONFLICT_COLUMNS = ["datetime", "hostname", "metric"]
+METRIC_CONFLICT_COLUMNS = ["datetime", "host_id", "metric"]
+ndjson_ingest_lock = Lock()  # Concurrent shards finishing at once must not read the same offset twice
+
+
+def build_ingest_rows(raw_data, overall_data, datetime_from_file, host_to_ip):
+    raw_rows = []
+    overall_rows = []
+    for hostname, scores in raw_data.items():
+        conditions = {
+            "datetime": datetime_from_file,
+            "hostname": hostname,
+            "IP_address": host_to_ip.get(hostname, 'UNKNOWN')
+        }
+        raw_rows.append({**conditions, **{column: aggregate_trials(scores.get(column)) for column in RAW_METRIC_COLUMNS}})
+        if hostname in overall_data:
+            overall_rows.append({**conditions, "overall_score": overall_data[hostname]})
+        else:
+            logger.warning(f"No overall score found for host {hostname}; skipping its overall score row.")
+    return raw_rows, overall_rows
+
+
+def build_run_detail_rows(raw_data, datetime_from_run):
+    # Rows for the tables keyed by metric: extended metrics and repeated-trial statistics
+    return build_metric_rows(raw_data, datetime_from_run), build_trial_rows(raw_data, datetime_from_run)
+
+
+def stage_ingest_rows(db: Session, raw_rows, overall_rows, metric_rows=(), trial_rows=()):
+    # Writes without committing, so callers can commit other bookkeeping in the same transaction
+    host_ids = register_hosts(db, raw_rows + overall_rows + list(metric_rows))
+    updated_at = datetime.now()
+    upsert_rows(db, RawBenchmarkSubscores, with_host_ids([{**row, "updated_at": updated_at} for row in raw_rows], host_ids), CONFLICT_COLUMNS)
+    upsert_rows(db, BenchmarkMetric, with_host_ids(metric_rows, host_ids), METRIC_CONFLICT_COLUMNS)
+    if SCORING_MODE == "baseline":
+        # Hosts are scored against the stored baseline instead of the other hosts of their run. Run-relative scores
+        # without subscores (backfilled overall score files) cannot be rescored, so they are dropped rather than
+        # mixed into the baseline-scored series.
+        overall_rows = baseline_overall_rows(db, raw_rows, metric_rows)
+    upsert_rows(db, OverallNormalizedScore, with_host_ids(overall_rows, host_ids), CONFLICT_COLUMNS)
+    upsert_rows(db, BenchmarkTrialStats, list(trial_rows), TRIAL_CONFLICT_COLUMNS)
+    upsert_latest_host_scores(db, raw_rows, overall_rows)
+    mark_rollups_stale(db, raw_rows + overall_rows + list(metric_rows))
+    record_ingested_rows({RawBenchmarkSubscores.__tablename__: len(raw_rows), OverallNormalizedScore.__tablename__: len(overall_rows),
+                          BenchmarkMetric.__tablename__: len(metric_rows), BenchmarkTrialStats.__tablename__: len(trial_rows)})
+
+
+def ingest_data(db: Session, raw_data, overall_data, datetime_from_file, host_to_ip):
+    with INGEST_SECONDS.labels(source="direct").time():
+        raw_rows, overall_rows = build_ingest_rows(raw_data, overall_data, datetime_from_file, host_to_ip)
+        stage_ingest_rows(db, raw_rows, overall_rows, *build_run_detail_rows(raw_data, datetime_from_file))
+        db.commit()
+    bump_ingest_generation(db)
+    logger.info(f"Ingested {len(raw_rows)} raw subscore rows and {len(overall_rows)} overall score rows.")
+
+
+def build_ndjson_run_rows(run_records):
+    # All hosts of a run share the run timestamp and are scored against each other, like the playbook's script does
+    datetime_from_run = parse_record_timestamp(run_records[0]["timestamp"])
+    raw_data = {record["hostname"]: record["metrics"] for record in run_records}
+    host_to_ip = {record["hostname"]: record.get("ip_address", 'UNKNOWN') for record in run_records}
+    overall_data = score_hosts(aggregate_host_trials(raw_data), weights=DEFAULT_CUSTOM_WEIGHTS)
+    raw_rows, overall_rows = build_ingest_rows(raw_data, overall_data, datetime_from_run, host_to_ip)
+    return raw_rows, overall_rows, *build_run_detail_rows(raw_data, datetime_from_run)
+
+
+def ingest_ndjson_results(db: Session, file_path, max_records=NDJSON_INGEST_BATCH_SIZE):
+    """Ingest the records appended to an NDJSON results file since the last call.
+
+    The file offset is stored in `ingest_file_offsets` and committed together with the rows it covers, so a crash
+    never skips or double-counts a record, and unchanged files cost a single stat() call.
+    """
+    if not os.path.exists(file_path):
+        return 0
+    with ndjson_ingest_lock:
+        start_time = time.perf_counter()
+        offset_record = db.get(IngestFileOffset, file_path) or IngestFileOffset(path=file_path, byte_offset=0)
+        number_of_records = 0
+        while True:
+            records, new_offset = read_ndjson_records(file_path, offset_record.byte_offset, max_records)
+            if new_offset == offset_record.byte_offset:
+                break
+            raw_rows, overall_rows, metric_rows, trial_rows = [], [], [], []
+            for run_records in group_records_by_run(records).values():
+                run_raw_rows, run_overall_rows, run_metric_rows, run_trial_rows = build_ndjson_run_rows(run_records)
+                raw_rows += run_raw_rows
+                overall_rows += run_overall_rows
+                metric_rows += run_metric_rows
+                trial_rows += run_trial_rows
+            stage_ingest_rows(db, raw_rows, overall_rows, metric_rows, trial_rows)
+            record_host_benchmark_durations(records)
+            offset_record.byte_offset = new_offset
+            offset_record.updated_at = datetime.now()
+            db.merge(offset_record)
+            db.commit()
+            number_of_records += len(records)
+        if number_of_records:
+            INGEST_SECONDS.labels(source="ndjson").observe(time.perf_counter() - start_time)  # Unchanged files are not counted
+            bump_ingest_generation(db)
+            logger.info(f"Ingested {number_of_records} new records from {file_path}.")
+        return number_of_records
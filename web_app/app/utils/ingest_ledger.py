@@ -0,0 +1,92 @@
+from web_app.app.database.data_models import IngestLedgerEntry, OverallNormalizedScore
+from web_app.app.database.data_generation import bump_ingest_generation
+from web_app.app.database.hosts import host_conditions, select_columns
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.ingest import build_ingest_rows, stage_ingest_rows
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from decouple import config
+import glob
+import hashlib
+import json
+import os
+
+logger = setup_logger()
+BACKFILL_MATCH_TOLERANCE_MINUTES = config("BACKFILL_MATCH_TOLERANCE_MINUTES", default=60, cast=int)
+OVERALL_RESULTS_FILE_TIMESTAMP_FORMAT = '%m_%d_%Y__%H_%M_%S'
+
+
+def hash_file(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def file_needs_ingest(db: Session, file_path):
+    """Return whether `file_path` differs from what the ledger says was last ingested.
+
+    A matching size and mtime is trusted without reading the file; otherwise the content hash decides, so a file
+    that was merely touched or copied is still skipped.
+    """
+    entry = db.get(IngestLedgerEntry, file_path)
+    if entry is None:
+        return True
+    stat = os.stat(file_path)
+    if entry.file_size == stat.st_size and entry.modified_time == stat.st_mtime:
+        return False
+    if entry.content_hash == hash_file(file_path):
+        entry.file_size, entry.modified_time = stat.st_size, stat.st_mtime
+        db.commit()
+        return False
+    return True
+
+
+def record_ingested_file(db: Session, file_path):
+    # Staged only; committed together with the rows ingested from the file
+    stat = os.stat(file_path)
+    db.merge(IngestLedgerEntry(path=file_path, file_size=stat.st_size, modified_time=stat.st_mtime,
+                               content_hash=hash_file(file_path), ingested_at=datetime.now()))
+
+
+def timestamp_from_overall_results_file_name(file_path):
+    # e.g. combined_cloud_benchmarker_results__overall_score_sorted__01_31_2024__18_00_05__shard_2.json
+    name_parts = os.path.basename(file_path).split("__overall_score_sorted__")[-1].removesuffix(".json").split("__")
+    return datetime.strptime("__".join(name_parts[:2]), OVERALL_RESULTS_FILE_TIMESTAMP_FORMAT)
+
+
+def backfill_overall_results_files(db: Session, directory, host_to_ip):
+    """Ingest overall score files that were written but never ingested (only the newest file used to be read).
+
+    Their raw subscores were overwritten long ago, so only overall scores are recovered, stamped with the time in
+    the file name. Hosts that already have an overall score within BACKFILL_MATCH_TOLERANCE_MINUTES of that time
+    were ingested before the ledger existed and are skipped.
+    """
+    tolerance = timedelta(minutes=BACKFILL_MATCH_TOLERANCE_MINUTES)
+    number_of_files = 0
+    for file_path in sorted(glob.glob(os.path.join(directory, "*.json")), key=os.path.getctime):
+        if db.get(IngestLedgerEntry, file_path) is not None:
+            continue
+        try:
+            file_datetime = timestamp_from_overall_results_file_name(file_path)
+            with open(file_path) as f:
+                overall_data = json.load(f)
+        except (ValueError, json.JSONDecodeError) as e:
+            logger.warning(f"Cannot backfill {file_path}: {e}")
+            continue
+        already_ingested_hosts = set(db.execute(
+            select_columns(OverallNormalizedScore, ["hostname"])
+            .where(*host_conditions(OverallNormalizedScore, overall_data.keys()))
+            .where(OverallNormalizedScore.datetime.between(file_datetime - tolerance, file_datetime + tolerance))
+        ).scalars())
+        missing_data = {hostname: score for hostname, score in overall_data.items() if hostname not in already_ingested_hosts}
+        _, overall_rows = build_ingest_rows({hostname: {} for hostname in missing_data}, missing_data, file_datetime, host_to_ip)
+        stage_ingest_rows(db, [], overall_rows)
+        record_ingested_file(db, file_path)
+        db.commit()
+        number_of_files += 1
+        logger.info(f"Backfilled {len(overall_rows)} overall score rows from {file_path}.")
+    if number_of_files:
+        bump_ingest_generation(db)
+    return number_of_files
@@ -0,0 +1,119 @@
+from web_app.app.database.data_models import Host, LatestHostScore, BenchmarkMetric
+from web_app.app.database.init_db import SessionLocal
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.metric_registry import column_metrics
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import select, and_
+from sqlalchemy.exc import SQLAlchemyError
+import time
+
+# Prometheus/OpenMetrics instruments for the pipeline hot paths, served by /metrics. The latest per-host results are
+# read from latest_host_scores on every scrape instead of being kept in gauges, so hosts that leave the fleet drop out.
+logger = setup_logger()
+SLOW_OPERATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+CHART_RENDER_SECONDS = Histogram("cloud_benchmarker_chart_request_seconds", "Time to answer a benchmark chart request.",
+                                 ["outcome"], buckets=SLOW_OPERATION_BUCKETS)
+CSV_EXPORT_SECONDS = Histogram("cloud_benchmarker_csv_export_seconds", "Time to stream a whole historical CSV export.", buckets=SLOW_OPERATION_BUCKETS)
+CSV_EXPORT_ROWS = Counter("cloud_benchmarker_csv_export_rows", "Rows written by historical CSV exports.")
+INGEST_SECONDS = Histogram("cloud_benchmarker_ingest_seconds", "Time to ingest a batch of benchmark results.", ["source"], buckets=SLOW_OPERATION_BUCKETS)
+INGESTED_ROWS = Counter("cloud_benchmarker_ingested_rows", "Rows written by ingest.", ["table"])
+LAST_INGEST_ROWS = Gauge("cloud_benchmarker_last_ingest_rows", "Rows written by the most recent ingest.", ["table"])
+SCHEDULER_PHASE_SECONDS = Histogram("cloud_benchmarker_scheduler_phase_seconds", "Duration of each phase of a scheduler job.",
+                                    ["phase"], buckets=SLOW_OPERATION_BUCKETS)
+PLAYBOOK_TASK_SECONDS = Histogram("cloud_benchmarker_playbook_task_seconds", "Duration of each Ansible playbook task across its hosts.",
+                                  ["task"], buckets=SLOW_OPERATION_BUCKETS)
+HOST_BENCHMARK_SECONDS = Histogram("cloud_benchmarker_host_benchmark_seconds", "Time the playbook spent benchmarking one host.",
+                                   buckets=SLOW_OPERATION_BUCKETS)
+LAST_HOST_BENCHMARK_SECONDS = Gauge("cloud_benchmarker_last_host_benchmark_seconds", "Time the playbook spent benchmarking each host in its latest run.",
+                                    ["hostname"])
+SCHEDULER_LAG_SECONDS = Gauge("cloud_benchmarker_scheduler_lag_seconds", "How long the most recently started benchmark run waited after it became runnable.")
+LAST_JOB_COMPLETED = Gauge("cloud_benchmarker_last_job_completed_timestamp_seconds", "Unix time at which the last scheduler job completed.")
+SCHEDULER_IS_LEADER = Gauge("cloud_benchmarker_scheduler_is_leader", "1 when this process holds the scheduler lease, 0 otherwise.")
+RUN_QUEUE_DEPTH = Gauge("cloud_benchmarker_run_queue_depth", "Benchmark runs waiting in the run queue, including retries still backing off.")
+
+
+def record_ingested_rows(rows_by_table):
+    for table, number_of_rows in rows_by_table.items():
+        INGESTED_ROWS.labels(table=table).inc(number_of_rows)
+        LAST_INGEST_ROWS.labels(table=table).set(number_of_rows)
+
+
+def record_host_benchmark_durations(records):
+    # NDJSON records carry how long the playbook spent on their host
+    for record in records:
+        if record.get("duration_seconds") is not None:
+            HOST_BENCHMARK_SECONDS.observe(float(record["duration_seconds"]))
+            LAST_HOST_BENCHMARK_SECONDS.labels(hostname=record["hostname"]).set(float(record["duration_seconds"]))
+
+
+def playbook_task_timer():
+    """Return a callback for playbook output lines that times every task.
+
+    Ansible prints a `TASK [name]` header when a task starts on all hosts, so the time between two headers is the
+    duration of the first task.
+    """
+    current_task = {"name": None, "started_at": None}
+
+    def on_line(line):
+        if not line.startswith(("TASK [", "RUNNING HANDLER [", "PLAY [", "PLAY RECAP")):
+            return
+        now = time.perf_counter()
+        if current_task["name"]:
+            PLAYBOOK_TASK_SECONDS.labels(task=current_task["name"]).observe(now - current_task["started_at"])
+        is_task = line.startswith(("TASK [", "RUNNING HANDLER ["))
+        current_task["name"] = line[line.find("[") + 1:line.rfind("]")] if is_task else None
+        current_task["started_at"] = now
+
+    return on_line
+
+
+class LatestHostResultsCollector:
+    # Exports every host's latest subscores (including extended metrics of the same run) and overall score
+    def describe(self):
+        # Without describe(), registering the collector would run collect() and query the database at import
+        return self.metric_families()
+
+    def metric_families(self):
+        subscores = GaugeMetricFamily("cloud_benchmarker_latest_subscore", "Latest value of each benchmark metric per host.",
+                                      labels=["hostname", "ip_address", "metric"])
+        overall_scores = GaugeMetricFamily("cloud_benchmarker_latest_overall_score", "Latest overall normalized score per host.",
+                                           labels=["hostname", "ip_address"])
+        result_times = GaugeMetricFamily("cloud_benchmarker_latest_result_timestamp_seconds", "Unix time of each host's latest results.",
+                                         labels=["hostname"])
+        return subscores, overall_scores, result_times
+
+    def collect(self):
+        subscores, overall_scores, result_times = self.metric_families()
+        db = SessionLocal()
+        try:
+            latest_rows = db.execute(select(LatestHostScore)).scalars().all()
+            extended_rows = db.execute(
+                select(LatestHostScore.hostname, LatestHostScore.IP_address, BenchmarkMetric.metric, BenchmarkMetric.value)
+                .join(Host, Host.hostname == LatestHostScore.hostname)
+                .join(BenchmarkMetric, and_(BenchmarkMetric.host_id == Host.id, BenchmarkMetric.datetime == LatestHostScore.datetime))
+            ).all()
+        except SQLAlchemyError as e:
+            logger.error(f"Could not read the latest host results for /metrics: {e}")
+            return
+        finally:
+            db.close()
+        for row in latest_rows:
+            ip_address = row.IP_address or "UNKNOWN"
+            for metric in column_metrics():
+                if getattr(row, metric) is not None:
+                    subscores.add_metric([row.hostname, ip_address, metric], getattr(row, metric))
+            if row.overall_score is not None:
+                overall_scores.add_metric([row.hostname, ip_address], row.overall_score)
+            if row.datetime is not None:
+                result_times.add_metric([row.hostname], row.datetime.timestamp())
+        for hostname, ip_address, metric, value in extended_rows:
+            if value is not None:
+                subscores.add_metric([hostname, ip_address or "UNKNOWN", metric], value)
+        yield subscores
+        yield overall_scores
+        yield result_times
+
+
+REGISTRY.register(LatestHostResultsCollector())
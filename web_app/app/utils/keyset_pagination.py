@@ -0,0 +1,87 @@
+from web_app.app.database.init_db import SessionLocal
+from web_app.app.database.hosts import host_conditions, select_columns
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.archive import merge_sorted_rows
+from datetime import datetime, timedelta
+from io import StringIO
+from itertools import islice
+from sqlalchemy import and_, or_
+from decouple import config
+import base64
+import csv
+import json
+
+logger = setup_logger()
+STREAM_BATCH_SIZE = config("STREAM_BATCH_SIZE", default=1000, cast=int)
+TIME_PERIOD_TO_DAYS = {
+    "last_7_days": 7,
+    "last_30_days": 30,
+    "last_year": 365,
+}
+
+
+def cutoff_date_for_time_period(time_period):
+    if time_period not in TIME_PERIOD_TO_DAYS:
+        raise ValueError(f"Invalid time period: {time_period}")
+    return datetime.now() - timedelta(days=TIME_PERIOD_TO_DAYS[time_period])
+
+
+def encode_cursor(row_datetime, row_id):
+    return base64.urlsafe_b64encode(f"{row_datetime.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        row_datetime, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(row_datetime), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def rows_after(model, cursor_datetime, cursor_id):
+    return or_(model.datetime > cursor_datetime, and_(model.datetime == cursor_datetime, model.id > cursor_id))
+
+
+def build_keyset_query(model, columns, cutoff_date=None, hostnames=None, cursor=None, conditions=()):
+    # Rows are ordered by (datetime, id), so a cursor pointing at the last row served resumes right after it
+    query = select_columns(model, columns).where(*conditions)
+    if cutoff_date is not None:
+        query = query.where(model.datetime >= cutoff_date)
+    if hostnames:
+        query = query.where(*host_conditions(model, hostnames))
+    if cursor is not None:
+        query = query.where(rows_after(model, *decode_cursor(cursor)))
+    return query.order_by(model.datetime, model.id)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def stream_query_rows(query, columns, output_format, archive_rows=None):
+    """Yield encoded NDJSON or CSV chunks for `query`, holding at most STREAM_BATCH_SIZE rows in memory.
+
+    A dedicated session is opened because the generator outlives the request-scoped session. `archive_rows`, in the
+    same (datetime, id) order, are merged in.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        rows = result if archive_rows is None else merge_sorted_rows(result, archive_rows, columns)
+        if output_format == "csv":
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in batched(rows, STREAM_BATCH_SIZE):
+                writer.writerows(batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for batch in batched(rows, STREAM_BATCH_SIZE):
+                yield "".join(json.dumps(dict(zip(columns, row)), default=datetime.isoformat) + "\n" for row in batch)
+    finally:
+        db.close()
@@ -0,0 +1,76 @@
+from web_app.app.logger_config import setup_logger
+from dataclasses import dataclass
+
+logger = setup_logger()
+HIGHER_IS_BETTER = 1
+LOWER_IS_BETTER = -1
+
+
+@dataclass(frozen=True)
+class MetricDefinition:
+    name: str
+    direction: int
+    unit: str
+    description: str
+    weight: float = 0.0  # Weight in DEFAULT_CUSTOM_WEIGHTS; 0 keeps the metric out of the default overall score
+    column: bool = False  # True for the original metrics, which keep their own raw_benchmark_subscores column
+
+
+# Every metric the playbook reports. A new test only needs a playbook task that emits its metric names and an entry
+# here: values of metrics without a column are stored in the long-format benchmark_metrics table, and charts,
+# exports, rollups, scoring and regression detection pick them up from this registry.
+METRICS = [
+    MetricDefinition("cpu_speed_test__events_per_second", HIGHER_IS_BETTER, "events/s", "CPU prime-number events per second", 2.0, column=True),
+    MetricDefinition("fileio_test__reads_per_second", HIGHER_IS_BETTER, "reads/s", "Random read-write file I/O, reads per second", 1.0, column=True),
+    MetricDefinition("memory_speed_test__MiB_transferred", HIGHER_IS_BETTER, "MiB", "Memory transferred in 1K blocks", 2.0, column=True),
+    MetricDefinition("mutex_test__avg_latency", LOWER_IS_BETTER, "ms", "Average mutex test latency", 0.5, column=True),
+    MetricDefinition("threads_test__avg_latency", LOWER_IS_BETTER, "ms", "Average threads test latency", 0.5, column=True),
+    MetricDefinition("cpu_scaling_test__events_per_second_1_thread", HIGHER_IS_BETTER, "events/s", "CPU events per second on 1 thread"),
+    MetricDefinition("cpu_scaling_test__events_per_second_nproc_threads", HIGHER_IS_BETTER, "events/s", "CPU events per second on one thread per CPU"),
+    MetricDefinition("cpu_scaling_test__events_per_second_2x_nproc_threads", HIGHER_IS_BETTER, "events/s", "CPU events per second on two threads per CPU"),
+    MetricDefinition("fileio_test__writes_per_second", HIGHER_IS_BETTER, "writes/s", "Random read-write file I/O, writes per second"),
+    MetricDefinition("fileio_test__fsyncs_per_second", HIGHER_IS_BETTER, "fsyncs/s", "Random read-write file I/O, fsyncs per second"),
+    MetricDefinition("fileio_test__seq_read_MiB_per_second", HIGHER_IS_BETTER, "MiB/s", "Sequential read throughput"),
+    MetricDefinition("fileio_test__seq_write_MiB_per_second", HIGHER_IS_BETTER, "MiB/s", "Sequential write throughput"),
+    MetricDefinition("threads_test__p95_latency", LOWER_IS_BETTER, "ms", "95th percentile threads test latency, from the latency histogram"),
+    MetricDefinition("threads_test__p99_latency", LOWER_IS_BETTER, "ms", "99th percentile threads test latency, from the latency histogram"),
+    MetricDefinition("mutex_test__p95_latency", LOWER_IS_BETTER, "ms", "95th percentile mutex test latency, from the latency histogram"),
+    MetricDefinition("mutex_test__p99_latency", LOWER_IS_BETTER, "ms", "99th percentile mutex test latency, from the latency histogram"),
+]
+METRIC_REGISTRY = {metric.name: metric for metric in METRICS}
+unregistered_metrics_seen = set()
+
+
+def register_metric(definition):
+    # For metrics added at runtime (e.g. by a site-specific playbook); columns cannot be added this way
+    if definition.column:
+        raise ValueError("Metrics registered at runtime are stored in benchmark_metrics and cannot have a column.")
+    METRIC_REGISTRY[definition.name] = definition
+
+
+def column_metrics():
+    return [metric.name for metric in METRIC_REGISTRY.values() if metric.column]
+
+
+def extended_metrics():
+    return [metric.name for metric in METRIC_REGISTRY.values() if not metric.column]
+
+
+def is_column_metric(name):
+    return name in METRIC_REGISTRY and METRIC_REGISTRY[name].column
+
+
+def metric_definition(name):
+    # Unregistered metrics are still stored and charted, and are treated as higher-is-better with no weight
+    if name not in METRIC_REGISTRY:
+        if name not in unregistered_metrics_seen:
+            unregistered_metrics_seen.add(name)
+            logger.warning(f"Metric {name} is not in the metric registry; treating it as higher-is-better.")
+        return MetricDefinition(name, HIGHER_IS_BETTER, "", "Unregistered metric")
+    return METRIC_REGISTRY[name]
+
+
+def sort_metrics(names):
+    # Registry order first, then unregistered metrics alphabetically
+    order = {name: index for index, name in enumerate(METRIC_REGISTRY)}
+    return sorted(names, key=lambda name: (order.get(name, len(order)), name))
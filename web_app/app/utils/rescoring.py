@@ -0,0 +1,135 @@
+from web_app.app.database.data_models import Host, RawBenchmarkSubscores, OverallNormalizedScore, LatestHostScore
+from web_app.app.database.bulk_upsert import upsert_rows, chunked
+from web_app.app.database.latest_host_scores import upsert_latest_host_scores
+from web_app.app.database.hosts import select_columns, with_host_ids
+from web_app.app.database.data_generation import bump_ingest_generation
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.archive import is_archived, read_archived_frame
+from web_app.app.utils.ingest import RAW_METRIC_COLUMNS, CONFLICT_COLUMNS
+from web_app.app.utils.rollup_resolutions import WEEK
+from web_app.app.utils.rollups import bucket_starts, refresh_rollups, window_query
+from web_app.app.utils.scoring import score_matrix
+from web_app.app.utils.scoring_baseline import scored_metrics, load_baseline, baseline_bounds
+from web_app.app.utils.extended_metrics import load_extended_metrics, pivot_extended_metrics
+from datetime import timedelta
+from sqlalchemy import select, update, delete, func, bindparam
+from sqlalchemy.orm import Session
+from decouple import config
+import numpy as np
+import pandas as pd
+
+logger = setup_logger()
+RESCORE_BATCH_SIZE = config("RESCORE_BATCH_SIZE", default=100000, cast=int)
+RAW_COLUMNS = ["datetime", "hostname", "IP_address"] + RAW_METRIC_COLUMNS
+RESCORE_DELETE_CHUNK_SIZE = 500
+latest_table = LatestHostScore.__table__
+
+
+def raw_datetime_counts(db: Session):
+    counts = pd.Series(dict(db.execute(select(RawBenchmarkSubscores.datetime, func.count()).group_by(RawBenchmarkSubscores.datetime)).all()), dtype=float)
+    if is_archived(RawBenchmarkSubscores):
+        counts = counts.add(read_archived_frame(RawBenchmarkSubscores, ["datetime"])["datetime"].value_counts(), fill_value=0)
+    counts.index = pd.to_datetime(counts.index)
+    return counts
+
+
+def overall_datetime_counts(db: Session):
+    counts = pd.Series(dict(db.execute(select(OverallNormalizedScore.datetime, func.count()).group_by(OverallNormalizedScore.datetime)).all()), dtype=float)
+    counts.index = pd.to_datetime(counts.index)
+    return counts
+
+
+def drop_unscored_overall_rows(db: Session, start, end, scored_keys):
+    """Delete the stored overall scores in [start, end) that have no baseline score, i.e. no raw subscores to score
+    (staged, not committed). Returns the hostnames they belonged to."""
+    query = window_query(select_columns(OverallNormalizedScore, ["id", "datetime", "hostname"]), OverallNormalizedScore, None, start, end)
+    unscored_rows = [(row_id, moment, hostname) for row_id, moment, hostname in db.execute(query).all() if (moment, hostname) not in scored_keys]
+    for row_chunk in chunked(unscored_rows, RESCORE_DELETE_CHUNK_SIZE):
+        db.execute(delete(OverallNormalizedScore).where(OverallNormalizedScore.id.in_([row_id for row_id, _, _ in row_chunk])))
+    if unscored_rows:
+        db.execute(update(latest_table).where(latest_table.c.hostname == bindparam("b_hostname"), latest_table.c.datetime == bindparam("b_datetime"))
+                   .values(overall_score=None), [{"b_hostname": hostname, "b_datetime": moment} for _, moment, hostname in unscored_rows])
+        logger.info(f"Dropped {len(unscored_rows)} overall scores without subscores, which baseline scoring cannot rescore.")
+    return {hostname for _, _, hostname in unscored_rows}
+
+
+def rescore_windows(datetime_counts, batch_size):
+    """Split history into [start, end) windows of whole weeks holding about `batch_size` raw rows each.
+
+    A week is never split, so every run is normalized in one batch and every rollup bucket is recomputed from
+    rows that were all rescored in the same batch.
+    """
+    week_counts = datetime_counts.groupby(bucket_starts(pd.Series(datetime_counts.index), "week").to_numpy()).sum()
+    windows = []
+    window_start, window_rows = None, 0
+    for week_start, week_rows in week_counts.items():
+        window_start = window_start if window_start is not None else week_start
+        window_rows += week_rows
+        if window_rows >= batch_size or week_start == week_counts.index[-1]:
+            windows.append((window_start.to_pydatetime(), (week_start + WEEK).to_pydatetime()))
+            window_start, window_rows = None, 0
+    return windows
+
+
+def load_raw_window(db: Session, start, end, extended_metrics):
+    query = window_query(select_columns(RawBenchmarkSubscores, RAW_COLUMNS), RawBenchmarkSubscores, None, start, end)
+    raw_df = pd.DataFrame(db.execute(query).all(), columns=RAW_COLUMNS)
+    last_moment = end - timedelta(microseconds=1)  # The archive and extended metric readers take an inclusive end
+    if is_archived(RawBenchmarkSubscores):
+        archived_df = read_archived_frame(RawBenchmarkSubscores, RAW_COLUMNS, start, last_moment)
+        if not archived_df.empty:
+            raw_df = pd.concat([archived_df, raw_df], ignore_index=True).drop_duplicates(subset=["datetime", "hostname"], keep="last")
+    raw_df["datetime"] = pd.to_datetime(raw_df["datetime"])
+    if extended_metrics:
+        extended_df = pivot_extended_metrics(load_extended_metrics(db, start=start, end=last_moment, metrics=extended_metrics))
+        raw_df = raw_df.merge(extended_df, on=["datetime", "hostname"], how="left").reindex(columns=RAW_COLUMNS + extended_metrics)
+    return raw_df
+
+
+def rescore_history(db: Session, weights=None, method="min_max", batch_size=RESCORE_BATCH_SIZE):
+    """Recompute every stored overall score from the raw subscores, a vectorized batch of whole weeks at a time.
+
+    With the run-relative methods, each ingest run shares one datetime, so rows are normalized against the other
+    hosts of the same run, matching how the playbook scores a fresh run. With `baseline` every row is scored
+    against the stored scoring baseline, and stored overall scores without subscores to score are dropped, so the
+    series never mixes run-relative and baseline scores. Only the overall scores and what is derived from them (their rollups
+    and the latest scores) are rewritten, and each batch is committed on its own.
+    """
+    logger.info(f"Rescoring benchmark history with {method} normalization.")
+    datetime_counts = raw_datetime_counts(db)
+    if method == "baseline":
+        # Weeks that only hold overall scores are visited too, so their unscorable rows are dropped
+        datetime_counts = datetime_counts.add(overall_datetime_counts(db), fill_value=0)
+    windows = rescore_windows(datetime_counts, batch_size)
+    if not windows:
+        logger.info("No raw subscores to rescore.")
+        return 0
+    metrics = scored_metrics(db, weights)
+    extended_metrics = metrics[len(RAW_METRIC_COLUMNS):]
+    bounds = baseline_bounds(load_baseline(db), metrics) if method == "baseline" else None
+    host_ids = dict(db.execute(select(Host.hostname, Host.id)).all())
+    number_of_rows = 0
+    for start, end in windows:
+        raw_df = load_raw_window(db, start, end, extended_metrics)
+        if raw_df.empty and method != "baseline":
+            continue
+        run_labels = raw_df["datetime"].to_numpy() if method != "baseline" else None
+        raw_df["overall_score"] = score_matrix(raw_df[metrics].to_numpy(dtype=float), metrics, weights, method, run_labels, bounds)
+        scored_df = raw_df[~np.isnan(raw_df["overall_score"])]
+        dropped_hostnames = set()
+        if method == "baseline":
+            scored_keys = set(zip(scored_df["datetime"].dt.to_pydatetime(), scored_df["hostname"]))
+            dropped_hostnames = drop_unscored_overall_rows(db, start, end, scored_keys)
+        # Plain Python values for the DB driver; zipping columns is much cheaper than DataFrame.to_dict("records")
+        overall_rows = [{"datetime": moment, "hostname": hostname, "IP_address": ip_address, "overall_score": score}
+                        for moment, hostname, ip_address, score in zip(scored_df["datetime"].dt.to_pydatetime(), scored_df["hostname"],
+                                                                       scored_df["IP_address"], scored_df["overall_score"].tolist())]
+        upsert_rows(db, OverallNormalizedScore, with_host_ids(overall_rows, host_ids), CONFLICT_COLUMNS)
+        upsert_latest_host_scores(db, [], overall_rows)
+        refresh_rollups(db, set(scored_df["hostname"]) | dropped_hostnames, start, end - timedelta(microseconds=1), models=[OverallNormalizedScore])
+        db.commit()
+        number_of_rows += len(overall_rows)
+        logger.info(f"Rescored {number_of_rows} overall score rows up to {end:%Y-%m-%d}.")
+    bump_ingest_generation(db)
+    logger.info(f"Rescored {number_of_rows} overall score rows in {len(windows)} batches.")
+    return number_of_rows
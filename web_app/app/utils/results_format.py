@@ -0,0 +1,65 @@
+from web_app.app.logger_config import setup_logger
+from datetime import datetime
+import json
+import os
+import re
+
+logger = setup_logger()
+# Legacy combined files look like `host-1.example.com: {...},host2: {...}`; hostnames may contain dashes and dots
+COMBINED_RESULTS_HOST_KEY_PATTERN = re.compile(r'(^|,)\s*([^\s,:{}"]+):\s*{')
+
+
+def massage_combined_results_content(content):
+    content = COMBINED_RESULTS_HOST_KEY_PATTERN.sub(r'\1"\2": {', content.strip())
+    return json.loads('{' + content + '}')
+
+
+def parse_record_timestamp(timestamp):
+    # Records carry UTC ISO-8601 timestamps; the database stores naive local datetimes like the rest of the app
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def read_ndjson_records(file_path, byte_offset, max_records):
+    """Read up to `max_records` complete records starting at `byte_offset` of an NDJSON results file.
+
+    Returns the parsed records and the offset just past the last consumed line. A trailing line without a newline
+    is still being written and is left for the next read; if the file shrank below `byte_offset` it was truncated
+    or replaced, so reading restarts from the beginning. Lines of one run are never split across two reads, and a
+    run with fewer lines than its `run_hosts` count is held back until it is complete, so every returned run can
+    be scored against all of its hosts.
+    """
+    if os.path.getsize(file_path) < byte_offset:
+        logger.warning(f"{file_path} is smaller than the stored offset {byte_offset}; reading it from the start.")
+        byte_offset = 0
+    records = []
+    run_start_index, run_start_offset = 0, byte_offset
+    with open(file_path, 'rb') as f:
+        f.seek(byte_offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed record at byte {byte_offset} of {file_path}.")
+                byte_offset += len(line)
+                continue
+            if records and record.get("run_id") != records[-1].get("run_id"):
+                if len(records) >= max_records:
+                    break
+                run_start_index, run_start_offset = len(records), byte_offset
+            records.append(record)
+            byte_offset += len(line)
+    if records and len(records) - run_start_index < records[-1].get("run_hosts", 0):
+        records, byte_offset = records[:run_start_index], run_start_offset
+    return records, byte_offset
+
+
+def group_records_by_run(records):
+    runs = {}
+    for record in records:
+        runs.setdefault(record["run_id"], []).append(record)
+    return runs
@@ -0,0 +1,75 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore, BenchmarkMetric, BenchmarkRollup
+from web_app.app.utils.metric_registry import column_metrics
+from datetime import timedelta
+from sqlalchemy import select, func
+from decouple import config
+
+# Which rollup resolution serves a time range and which rollup rows belong to a table. Kept apart from rollups.py,
+# which builds rollups with pandas, so the API can pick resolutions without importing it.
+ROLLUP_TARGET_POINTS = config("ROLLUP_TARGET_POINTS", default=200, cast=int)
+PLAYBOOK_RUN_INTERVAL_IN_MINUTES = config("PLAYBOOK_RUN_INTERVAL_IN_MINUTES", default=360, cast=int)
+WEEK = timedelta(weeks=1)
+# Coarsest first, so the first resolution that still gives enough buckets for a range wins
+BUCKET_WIDTHS = {
+    "week": WEEK,
+    "day": timedelta(days=1),
+    "hour": timedelta(hours=1),
+}
+# A bucket no wider than the interval between a host's runs holds at most one of its rows, so it would only repeat
+# the raw rows; such resolutions are not maintained
+ROLLUP_RESOLUTIONS = {resolution: width for resolution, width in BUCKET_WIDTHS.items() if width > timedelta(minutes=PLAYBOOK_RUN_INTERVAL_IN_MINUTES)}
+# Wide tables and their metric columns; every metric in the long-format benchmark_metrics table is rolled up as well
+ROLLUP_SOURCE_METRICS = {
+    RawBenchmarkSubscores: column_metrics(),
+    OverallNormalizedScore: ["overall_score"],
+}
+
+
+def bucket_start(moment, resolution):
+    # The start of a single datetime's bucket, as rollups.bucket_starts() computes it for a whole column
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "week":
+        return day - timedelta(days=day.weekday())
+    return day if resolution == "day" else moment.replace(minute=0, second=0, microsecond=0)
+
+
+def choose_rollup_resolution(start, end, target_points=ROLLUP_TARGET_POINTS):
+    """Return the coarsest resolution with at least `target_points` buckets in [start, end], or None for raw rows."""
+    for resolution, width in ROLLUP_RESOLUTIONS.items():
+        if (end - start) / width >= target_points:
+            return resolution
+    return None
+
+
+def rollup_size_queries(model, resolution, start, end=None, conditions=()):
+    """Return queries for roughly how many raw rows of `model` and how many `resolution` rollup rows lie in [start, end].
+
+    The raw row count is summed from the counts of the coarsest rollups, so archived rows count too and the raw
+    table is never scanned. A wide row holds every metric while a rollup row holds one, so rollups only pay off
+    when a bucket holds more rows than there are metrics. `conditions` (e.g. a host filter) apply to both.
+    """
+    coarsest_resolution = next(iter(ROLLUP_RESOLUTIONS))
+    metric_counts = (select(func.sum(BenchmarkRollup.count).label("count"))
+                     .where(*rollup_conditions(model, coarsest_resolution), *bucket_conditions(coarsest_resolution, start, end), *conditions)
+                     .group_by(BenchmarkRollup.metric).subquery())
+    # Every metric of a wide row counts in its own rollup; long-format rows hold one metric each
+    raw_rows = select(func.sum(metric_counts.c.count) if model is BenchmarkMetric else func.max(metric_counts.c.count))
+    rollup_rows = (select(func.count()).select_from(BenchmarkRollup)
+                   .where(*rollup_conditions(model, resolution), *bucket_conditions(resolution, start, end), *conditions))
+    return raw_rows, rollup_rows
+
+
+def bucket_conditions(resolution, start, end=None):
+    # Whole buckets, so the first bucket is not cut short by the start
+    conditions = [BenchmarkRollup.datetime >= bucket_start(start, resolution)]
+    if end is not None:
+        conditions.append(BenchmarkRollup.datetime <= end)
+    return conditions
+
+
+def rollup_conditions(model, resolution):
+    # Restricts `benchmark_rollups` to one resolution and to the metrics that come from `model`
+    if model is BenchmarkMetric:
+        wide_table_metrics = [metric for metrics in ROLLUP_SOURCE_METRICS.values() for metric in metrics]
+        return [BenchmarkRollup.resolution == resolution, BenchmarkRollup.metric.not_in(wide_table_metrics)]
+    return [BenchmarkRollup.resolution == resolution, BenchmarkRollup.metric.in_(ROLLUP_SOURCE_METRICS[model])]
@@ -0,0 +1,194 @@
+from web_app.app.database.data_models import Host, BenchmarkMetric, BenchmarkRollup, StaleRollupWeek
+from web_app.app.database.bulk_upsert import upsert_rows, chunked
+from web_app.app.database.hosts import host_conditions, select_columns
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.archive import is_archived, read_archived_frame, archived_time_range
+from web_app.app.utils.metric_registry import sort_metrics
+from web_app.app.utils.rollup_resolutions import ROLLUP_RESOLUTIONS, ROLLUP_SOURCE_METRICS, WEEK, bucket_start, rollup_conditions, rollup_size_queries
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func, and_, or_, bindparam
+from sqlalchemy.orm import Session
+from decouple import config
+import pandas as pd
+
+logger = setup_logger()
+ROLLUP_BACKFILL_HOSTS_PER_BATCH = config("ROLLUP_BACKFILL_HOSTS_PER_BATCH", default=100, cast=int)
+ROLLUP_CONFLICT_COLUMNS = ["resolution", "hostname", "metric", "datetime"]
+ROLLUP_VALUE_COLUMNS = ["min_value", "max_value", "mean_value", "p50_value", "p95_value", "count"]
+ROLLUP_DELETE_CHUNK_SIZE = 500
+stale_weeks_table = StaleRollupWeek.__table__
+
+
+def bucket_starts(datetimes, resolution):
+    if resolution == "week":
+        days = datetimes.dt.normalize()
+        return days - pd.to_timedelta(days.dt.weekday, unit="D")  # Weeks start on Monday
+    return datetimes.dt.floor("h" if resolution == "hour" else "D")
+
+
+def window_query(query, model, hostnames=None, start=None, end=None):
+    if hostnames is not None:
+        query = query.where(*host_conditions(model, hostnames))
+    if start is not None:
+        query = query.where(model.datetime >= start)
+    if end is not None:
+        query = query.where(model.datetime < end)
+    return query
+
+
+def with_archived_rows(df, model, hostnames, start, end, key_columns):
+    # Archived periods are rolled up too, so a rebuild keeps the buckets of rows that were moved to Parquet
+    if not is_archived(model):
+        return df
+    archived_df = read_archived_frame(model, list(df.columns), start, end - timedelta(microseconds=1) if end is not None else None, hostnames)
+    if archived_df.empty:
+        return df
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    # A crash while archiving can leave a row in both places; the database copy wins
+    return pd.concat([archived_df, df], ignore_index=True).drop_duplicates(subset=key_columns, keep="last")
+
+
+def load_long_metric_frame(db: Session, hostnames=None, start=None, end=None, models=None):
+    # `models` limits the frame to some source tables, e.g. [OverallNormalizedScore] after rescoring
+    frames = []
+    for model, metrics in ROLLUP_SOURCE_METRICS.items():
+        if models is not None and model not in models:
+            continue
+        query = window_query(select_columns(model, ["datetime", "hostname"] + metrics), model, hostnames, start, end)
+        wide_df = pd.DataFrame(db.execute(query).all(), columns=["datetime", "hostname"] + metrics)
+        wide_df = with_archived_rows(wide_df, model, hostnames, start, end, ["datetime", "hostname"])
+        frames.append(wide_df.melt(id_vars=["datetime", "hostname"], var_name="metric", value_name="value"))
+    if models is None or BenchmarkMetric in models:
+        query = select_columns(BenchmarkMetric, ["datetime", "hostname", "metric", "value"])
+        metric_df = pd.DataFrame(db.execute(window_query(query, BenchmarkMetric, hostnames, start, end)).all(), columns=["datetime", "hostname", "metric", "value"])
+        frames.append(with_archived_rows(metric_df, BenchmarkMetric, hostnames, start, end, ["datetime", "hostname", "metric"]))
+    long_df = pd.concat(frames).dropna(subset=["value"])
+    long_df["value"] = long_df["value"].astype(float)  # All-NULL metric columns come back as object dtype
+    long_df["datetime"] = pd.to_datetime(long_df["datetime"])
+    return long_df
+
+
+def compute_rollups(long_df):
+    """Aggregate a long (datetime, hostname, metric, value) frame into rollup rows for every resolution."""
+    rollup_frames = []
+    for resolution in ROLLUP_RESOLUTIONS:
+        grouped = long_df.assign(bucket=bucket_starts(long_df["datetime"], resolution)).groupby(["hostname", "metric", "bucket"])["value"]
+        rollup_df = grouped.agg(min_value="min", max_value="max", mean_value="mean", p50_value="median", count="count")
+        rollup_df["p95_value"] = grouped.quantile(0.95)
+        rollup_frames.append(rollup_df.reset_index().rename(columns={"bucket": "datetime"}).assign(resolution=resolution))
+    return pd.concat(rollup_frames, ignore_index=True)
+
+
+def delete_rollups(db: Session, hostnames, start=None, end=None, models=None):
+    # Removes the buckets of `hostnames` in [start, end) before a full recompute, so buckets whose rows are gone go too
+    conditions = []
+    if start is not None:
+        conditions.append(BenchmarkRollup.datetime >= start)
+    if end is not None:
+        conditions.append(BenchmarkRollup.datetime < end)
+    if models is not None:
+        conditions.append(or_(*[and_(*rollup_conditions(model, resolution)) for model in models for resolution in ROLLUP_RESOLUTIONS]))
+    for hostname_chunk in chunked(sorted(hostnames), ROLLUP_DELETE_CHUNK_SIZE):
+        db.execute(delete(BenchmarkRollup).where(BenchmarkRollup.hostname.in_(hostname_chunk), *conditions))
+
+
+def refresh_rollups(db: Session, hostnames, start=None, end=None, models=None):
+    """Recompute the rollup buckets of `hostnames` that overlap [start, end] from the raw rows (staged, not committed).
+
+    The window is widened to whole weeks, which also covers every hour and day bucket inside it, so each
+    recomputed bucket sees all of its rows and percentiles stay exact. Every bucket of the window is replaced.
+    `models` limits the refresh to the metrics of some source tables.
+    """
+    if not hostnames:
+        return 0
+    window_start = bucket_start(start, "week") if start is not None else None
+    window_end = bucket_start(end, "week") + WEEK if end is not None else None
+    long_df = load_long_metric_frame(db, hostnames, window_start, window_end, models)
+    delete_rollups(db, hostnames, window_start, window_end, models)
+    if long_df.empty or not ROLLUP_RESOLUTIONS:
+        return 0
+    rollup_df = compute_rollups(long_df)
+    column_names = ROLLUP_CONFLICT_COLUMNS + ROLLUP_VALUE_COLUMNS
+    # Plain Python values for the DB driver; zipping columns is much cheaper than DataFrame.to_dict("records")
+    columns = [list(rollup_df[name].dt.to_pydatetime()) if name == "datetime" else rollup_df[name].tolist() for name in column_names]
+    rollup_rows = [dict(zip(column_names, values)) for values in zip(*columns)]
+    upsert_rows(db, BenchmarkRollup, rollup_rows, ROLLUP_CONFLICT_COLUMNS)
+    return len(rollup_rows)
+
+
+def mark_rollups_stale(db: Session, rows):
+    # Called from ingest with the rows just written; recomputing their weeks is left to refresh_stale_rollups()
+    week_starts = {(row["hostname"], bucket_start(row["datetime"], "week")) for row in rows}
+    marked_at = datetime.now()
+    upsert_rows(db, StaleRollupWeek, [{"hostname": hostname, "week_start": week_start, "marked_at": marked_at} for hostname, week_start in sorted(week_starts)],
+                ["hostname", "week_start"])
+
+
+def refresh_stale_rollups(db: Session):
+    """Recompute every week marked stale by ingest, a batch of hosts per week at a time, and clear the marks.
+
+    A mark set again by an ingest that commits while its week is recomputed has a later `marked_at` and is kept.
+    """
+    stale_weeks = pd.DataFrame(db.execute(select(StaleRollupWeek.hostname, StaleRollupWeek.week_start, StaleRollupWeek.marked_at)).all(),
+                               columns=["hostname", "week_start", "marked_at"])
+    number_of_rows = 0
+    for week_start, week_df in stale_weeks.groupby("week_start"):
+        week_start = week_start.to_pydatetime()
+        for batch_df in chunked(list(week_df.itertuples(index=False)), ROLLUP_BACKFILL_HOSTS_PER_BATCH):
+            number_of_rows += refresh_rollups(db, [row.hostname for row in batch_df], week_start, week_start + WEEK - timedelta(microseconds=1))
+            db.execute(stale_weeks_table.delete().where(stale_weeks_table.c.hostname == bindparam("b_hostname"), stale_weeks_table.c.week_start == bindparam("b_week_start"),
+                                                  stale_weeks_table.c.marked_at <= bindparam("b_marked_at")),
+                       [{"b_hostname": row.hostname, "b_week_start": week_start, "b_marked_at": row.marked_at.to_pydatetime()} for row in batch_df])
+            db.commit()
+    if not stale_weeks.empty:
+        logger.info(f"Refreshed the rollups of {len(stale_weeks)} stale host weeks ({number_of_rows} rollup rows).")
+    return len(stale_weeks)
+
+
+def rebuild_rollups(db: Session):
+    """Backfill the rollup tables from the whole history, a batch of hosts at a time."""
+    # Resolutions that are no longer maintained (the run interval grew) would otherwise keep serving old buckets
+    db.execute(delete(BenchmarkRollup).where(BenchmarkRollup.resolution.not_in(list(ROLLUP_RESOLUTIONS))))
+    # Every host ever ingested is in `hosts`, including those whose raw rows were all archived
+    hostnames = sorted(db.execute(select(Host.hostname)).scalars())
+    number_of_rows = 0
+    for hostname_batch in chunked(hostnames, ROLLUP_BACKFILL_HOSTS_PER_BATCH):
+        number_of_rows += refresh_rollups(db, hostname_batch)
+        db.commit()
+        logger.info(f"Rolled up history for {len(hostname_batch)} hosts ({number_of_rows} rollup rows so far).")
+    return number_of_rows
+
+
+def time_range(db: Session, model):
+    # Archived rows count, so a long history whose older rows were archived is still charted from rollups
+    bounds = [bound for bound in [*db.execute(select(func.min(model.datetime), func.max(model.datetime))).one(), *archived_time_range(model)]
+              if bound is not None]
+    return (min(bounds), max(bounds)) if bounds else (None, None)
+
+
+def rollups_pay_off(db: Session, model, resolution, start, end=None, hostnames=None):
+    # True when `resolution` has fewer rollup rows than there are raw rows in the window, as for the API's `auto`
+    conditions = (BenchmarkRollup.hostname.in_(list(hostnames)),) if hostnames is not None else ()
+    raw_rows_query, rollup_rows_query = rollup_size_queries(model, resolution, start, end, conditions)
+    return db.execute(rollup_rows_query).scalar() < (db.execute(raw_rows_query).scalar() or 0)
+
+
+def load_rollup_chart_frame(db: Session, model, resolution, start=None, end=None, hostnames=None):
+    """Return bucket means as a wide (datetime, hostname, *metrics) frame, the shape charts read from the raw tables.
+
+    For `BenchmarkMetric` the metric columns are whichever extended metrics have buckets in the range.
+    """
+    query = select(BenchmarkRollup.datetime, BenchmarkRollup.hostname, BenchmarkRollup.metric, BenchmarkRollup.mean_value)
+    query = query.where(*rollup_conditions(model, resolution))
+    if hostnames is not None:
+        query = query.where(BenchmarkRollup.hostname.in_(list(hostnames)))
+    if start is not None:
+        query = query.where(BenchmarkRollup.datetime >= bucket_start(start, resolution))
+    if end is not None:
+        query = query.where(BenchmarkRollup.datetime <= end)
+    long_df = pd.DataFrame(db.execute(query).all(), columns=["datetime", "hostname", "metric", "mean_value"])
+    metrics = ROLLUP_SOURCE_METRICS.get(model) or sort_metrics(long_df["metric"].unique())
+    wide_df = long_df.pivot_table(index=["datetime", "hostname"], columns="metric", values="mean_value").reset_index()
+    wide_df = wide_df.reindex(columns=["datetime", "hostname"] + metrics)
+    wide_df["datetime"] = pd.to_datetime(wide_df["datetime"])
+    return wide_df
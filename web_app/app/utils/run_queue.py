@@ -0,0 +1,198 @@
+from web_app.app.database.data_models import Host, HostSchedule, BenchmarkRun, BenchmarkRunHost, SchedulerLease
+from web_app.app.database.bulk_upsert import upsert_rows, chunked
+from web_app.app.database.hosts import lookup_host_ids
+from web_app.app.database.init_db import SessionLocal
+from web_app.app.logger_config import setup_logger
+from datetime import datetime, timedelta
+from threading import Event
+from sqlalchemy import select, update, insert, func, or_
+from sqlalchemy.orm import Session
+import zlib
+
+# The scheduler's state lives in the database: a lease that elects one leader among all workers, per-host due
+# times, and a queue of benchmark runs that survives restarts. Only the leader writes schedules and claims runs;
+# anyone (e.g. the API) may queue a run.
+logger = setup_logger()
+SCHEDULER_LEASE_NAME = "scheduler"
+ACTIVE_RUN_STATUSES = ["queued", "running"]
+scheduler_wakeup = Event()  # Set to cut the scheduler loop's sleep short
+
+
+def acquire_lease(db: Session, holder, ttl_seconds, name=SCHEDULER_LEASE_NAME, now=None):
+    """Take or renew the lease `name` for `holder`, unless another holder's lease is still valid. Returns True when held."""
+    now = now or datetime.now()
+    upsert_rows(db, SchedulerLease, [{"name": name}], ["name"])
+    # One conditional UPDATE, so two processes racing for an expired lease cannot both win
+    result = db.execute(update(SchedulerLease.__table__)
+                        .where(SchedulerLease.name == name)
+                        .where(or_(SchedulerLease.holder.is_(None), SchedulerLease.holder == holder, SchedulerLease.expires_at < now))
+                        .values(holder=holder, expires_at=now + timedelta(seconds=ttl_seconds)))
+    db.commit()
+    return result.rowcount == 1
+
+
+def release_lease(db: Session, holder, name=SCHEDULER_LEASE_NAME):
+    db.execute(update(SchedulerLease.__table__).where(SchedulerLease.name == name, SchedulerLease.holder == holder).values(holder=None, expires_at=None))
+    db.commit()
+
+
+def spread_offset(hostname, interval):
+    # A stable point in the interval per host, so the fleet's runs are spread out rather than all due at once
+    return interval * (zlib.crc32(hostname.encode()) / 2 ** 32)
+
+
+def next_due_time(due_at, interval, now):
+    # Whole intervals past the previous due time, so a host keeps its place in the interval even after downtime
+    intervals_behind = int((now - due_at) / interval) + 1 if now >= due_at else 1
+    return due_at + intervals_behind * interval
+
+
+def schedule_new_hosts(db: Session, host_ids, interval, now=None):
+    """Give hosts without a schedule their first due time, spread across the next interval (committed)."""
+    now = now or datetime.now()
+    scheduled = set()
+    for host_id_chunk in chunked(sorted(host_ids.values()), 500):
+        scheduled.update(db.execute(select(HostSchedule.host_id).where(HostSchedule.host_id.in_(host_id_chunk))).scalars())
+    rows = [{"host_id": host_id, "next_due_at": now + spread_offset(hostname, interval), "consecutive_failures": 0}
+            for hostname, host_id in host_ids.items() if host_id not in scheduled]
+    if rows:
+        db.execute(insert(HostSchedule), rows)
+        logger.info(f"Scheduled {len(rows)} new hosts across the next {interval}.")
+    db.commit()
+
+
+def active_host_ids(db: Session):
+    # Hosts already waiting in or running in a queued run are not queued again
+    return set(db.execute(select(BenchmarkRunHost.host_id).join(BenchmarkRun, BenchmarkRun.id == BenchmarkRunHost.run_id)
+                          .where(BenchmarkRun.status.in_(ACTIVE_RUN_STATUSES))).scalars())
+
+
+def enqueue_run(db: Session, host_ids, reason, attempt=1, not_before=None, now=None):
+    """Queue a run of `host_ids` (staged, not committed) and return it."""
+    now = now or datetime.now()
+    run = BenchmarkRun(reason=reason, status="queued", attempt=attempt, requested_at=now, not_before=not_before or now)
+    db.add(run)
+    db.flush()
+    db.execute(insert(BenchmarkRunHost), [{"run_id": run.id, "host_id": host_id, "status": "queued"} for host_id in sorted(set(host_ids))])
+    return run
+
+
+def wake_scheduler():
+    # Queued runs are picked up right away in this process; a leader in another process finds them within a tick
+    scheduler_wakeup.set()
+
+
+def request_run(hostnames, reason="manual"):
+    """Queue a benchmark run of `hostnames` (which must already be in `hosts`) and wake the scheduler. Returns the run id."""
+    db = SessionLocal()
+    try:
+        run = enqueue_run(db, lookup_host_ids(db, hostnames).values(), reason)
+        db.commit()
+        run_id = run.id
+    finally:
+        db.close()
+    wake_scheduler()
+    return run_id
+
+
+def enqueue_due_hosts(db: Session, host_ids, interval, hosts_per_run=0, now=None):
+    """Queue runs for the scheduled hosts in `host_ids` that are due, `hosts_per_run` at a time (0: one run), and
+    move their due times a whole interval on (committed). Returns the queued runs."""
+    now = now or datetime.now()
+    active = active_host_ids(db)
+    due = [schedule for schedule in db.execute(select(HostSchedule).where(HostSchedule.next_due_at <= now).order_by(HostSchedule.next_due_at)).scalars()
+           if schedule.host_id in host_ids and schedule.host_id not in active]
+    for schedule in due:
+        schedule.next_due_at = next_due_time(schedule.next_due_at, interval, now)
+    due_host_ids = [schedule.host_id for schedule in due]
+    runs = [enqueue_run(db, batch, "scheduled", now=now) for batch in chunked(due_host_ids, hosts_per_run if hosts_per_run > 0 else max(len(due_host_ids), 1))]
+    db.commit()
+    if runs:
+        logger.info(f"Queued {len(runs)} scheduled runs for {len(due_host_ids)} due hosts.")
+    return runs
+
+
+def claim_runs(db: Session, limit, now=None):
+    """Mark up to `limit` queued runs whose backoff has passed as running, oldest first (committed).
+
+    Returns (run id, the time it became runnable) pairs.
+    """
+    now = now or datetime.now()
+    if limit <= 0:
+        return []
+    runs = db.execute(select(BenchmarkRun).where(BenchmarkRun.status == "queued", BenchmarkRun.not_before <= now)
+                      .order_by(BenchmarkRun.not_before, BenchmarkRun.id).limit(limit)).scalars().all()
+    claimed = [(run.id, run.not_before) for run in runs]
+    for run in runs:
+        run.status = "running"
+        run.started_at = now
+        db.execute(update(BenchmarkRunHost.__table__).where(BenchmarkRunHost.run_id == run.id).values(status="running"))
+    db.commit()
+    return claimed
+
+
+def requeue_orphaned_runs(db: Session, keep_run_ids=()):
+    # Runs left `running` by a leader that died are started again by the next one
+    orphaned_run_ids = [run_id for run_id in db.execute(select(BenchmarkRun.id).where(BenchmarkRun.status == "running")).scalars()
+                        if run_id not in keep_run_ids]
+    for run_id_chunk in chunked(orphaned_run_ids, 500):
+        db.execute(update(BenchmarkRun.__table__).where(BenchmarkRun.id.in_(run_id_chunk)).values(status="queued", started_at=None))
+        db.execute(update(BenchmarkRunHost.__table__).where(BenchmarkRunHost.run_id.in_(run_id_chunk)).values(status="queued"))
+    db.commit()
+    if orphaned_run_ids:
+        logger.warning(f"Requeued {len(orphaned_run_ids)} runs left running by a previous scheduler.")
+    return orphaned_run_ids
+
+
+def run_hostnames(db: Session, run_id):
+    return dict(db.execute(select(Host.hostname, Host.id).join(BenchmarkRunHost, BenchmarkRunHost.host_id == Host.id)
+                           .where(BenchmarkRunHost.run_id == run_id).order_by(Host.hostname)).all())
+
+
+def retry_delay(attempt, base_delay_seconds, max_delay_seconds):
+    # Exponential backoff: the base delay after the first failure, doubling with every further attempt
+    return timedelta(seconds=min(max_delay_seconds, base_delay_seconds * 2 ** (attempt - 1)))
+
+
+def finish_run(db: Session, run_id, succeeded_host_ids, return_code, retry_limit, base_delay_seconds, max_delay_seconds, now=None):
+    """Record the outcome of a run, update its hosts' schedules and queue a backed-off retry of the hosts that
+    failed, up to `retry_limit` retries (committed). Returns the retry run, if any."""
+    now = now or datetime.now()
+    run = db.get(BenchmarkRun, run_id)
+    host_ids = list(db.execute(select(BenchmarkRunHost.host_id).where(BenchmarkRunHost.run_id == run_id)).scalars())
+    succeeded = [host_id for host_id in host_ids if host_id in succeeded_host_ids]
+    failed = [host_id for host_id in host_ids if host_id not in succeeded_host_ids]
+    for status, status_host_ids in (("succeeded", succeeded), ("failed", failed)):
+        for host_id_chunk in chunked(status_host_ids, 500):
+            db.execute(update(BenchmarkRunHost.__table__).where(BenchmarkRunHost.run_id == run_id, BenchmarkRunHost.host_id.in_(host_id_chunk))
+                       .values(status=status))
+            values = {"last_run_at": now, "consecutive_failures": 0, "last_success_at": now} if status == "succeeded" else \
+                {"last_run_at": now, "consecutive_failures": HostSchedule.consecutive_failures + 1}
+            db.execute(update(HostSchedule.__table__).where(HostSchedule.host_id.in_(host_id_chunk)).values(**values))
+    run.status = "succeeded" if not failed else "failed" if not succeeded else "partial"
+    run.finished_at = now
+    run.return_code = return_code
+    retry = None
+    if failed and run.attempt <= retry_limit:
+        delay = retry_delay(run.attempt, base_delay_seconds, max_delay_seconds)
+        retry = enqueue_run(db, failed, "retry", attempt=run.attempt + 1, not_before=now + delay, now=now)
+        logger.warning(f"Run {run_id}: {len(failed)} of {len(host_ids)} hosts failed; retry {run.attempt} of {retry_limit} queued as run {retry.id} in {delay}.")
+    elif failed:
+        logger.error(f"Run {run_id}: {len(failed)} of {len(host_ids)} hosts failed after {run.attempt} attempts; they wait for their next scheduled run.")
+    db.commit()
+    return retry
+
+
+def seconds_until_next_work(db: Session, host_ids, now=None):
+    # The earliest due time of a host or backoff of a queued run, so the scheduler can sleep until then
+    now = now or datetime.now()
+    next_times = [db.execute(select(func.min(BenchmarkRun.not_before)).where(BenchmarkRun.status == "queued")).scalar()]
+    active = active_host_ids(db)
+    next_times += [next_due_at for host_id, next_due_at in db.execute(select(HostSchedule.host_id, HostSchedule.next_due_at)).all()
+                   if host_id in host_ids and host_id not in active]
+    next_times = [next_time for next_time in next_times if next_time is not None]
+    return max(0.0, (min(next_times) - now).total_seconds()) if next_times else None
+
+
+def queued_run_count(db: Session):
+    return db.execute(select(func.count()).select_from(BenchmarkRun).where(BenchmarkRun.status == "queued")).scalar()
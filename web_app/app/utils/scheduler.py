@@ -1,139 +1,470 @@
-from web_app.app.database.data_models import RawBenchmarkSubscores, OverallNormalizedScore
 from web_app.app.database.init_db import SessionLocal
+from web_app.app.database.data_models import Host
+from web_app.app.database.hosts import sync_inventory_hosts, lookup_host_ids
+from web_app.app.database.data_generation import bump_ingest_generation
+from web_app.app.utils.ingest import build_ingest_rows, build_run_detail_rows, stage_ingest_rows, ingest_ndjson_results
+from web_app.app.utils.anomaly_detection import detect_anomalies
+from web_app.app.utils.archive import archive_old_rows, ARCHIVE_RETENTION_DAYS
+from web_app.app.utils.scoring import DEFAULT_CUSTOM_WEIGHTS
+from web_app.app.utils.scoring_baseline import SCORING_MODE, update_scoring_baseline
+from web_app.app.utils.rescoring import rescore_history
+from web_app.app.utils.rollups import refresh_stale_rollups
+from web_app.app.utils.ingest_ledger import file_needs_ingest, record_ingested_file, backfill_overall_results_files
+from web_app.app.utils.results_format import massage_combined_results_content
+from web_app.app.utils.instrumentation import INGEST_SECONDS, SCHEDULER_PHASE_SECONDS, SCHEDULER_LAG_SECONDS, LAST_JOB_COMPLETED, SCHEDULER_IS_LEADER, RUN_QUEUE_DEPTH, playbook_task_timer
+from web_app.app.utils.run_queue import (acquire_lease, release_lease, schedule_new_hosts, enqueue_due_hosts, claim_runs, requeue_orphaned_runs,
+                                         run_hostnames, finish_run, seconds_until_next_work, queued_run_count, scheduler_wakeup, wake_scheduler)
 from web_app.app.logger_config import setup_logger
 import os
 import json
-import re
-import schedule
-import time
 import glob
+import socket
 import subprocess
-from threading import Thread
+import shlex
+import uuid
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from decouple import config as decouple_config
 
 logger = setup_logger()
-username = os.getlogin()
 ANSIBLE_INVENTORY_FILE_PATH = decouple_config("ANSIBLE_INVENTORY_FILE_PATH", cast=str)
+# Both can point elsewhere, e.g. at a temporary directory and the fleet simulator for load tests
+ANSIBLE_PLAYBOOK_COMMAND = decouple_config("ANSIBLE_PLAYBOOK_COMMAND", default="ansible-playbook", cast=str)
+# Defaults to the home directory of the user running the app (os.getlogin() fails without a controlling terminal)
+BENCHMARK_RESULTS_DIRECTORY = decouple_config("BENCHMARK_RESULTS_DIRECTORY", default="", cast=str) or os.path.expanduser("~")
 PLAYBOOK_RUN_INTERVAL_IN_MINUTES = decouple_config("PLAYBOOK_RUN_INTERVAL_IN_MINUTES", cast=int) 
-NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH = os.path.join(f"/home/{username}", "benchmark_result_output_files/")
-COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH = f"/home/{username}/combined_cloud_benchmarker_results.json"
-initial_setup = False
+BENCHMARK_SHARD_SIZE = decouple_config("BENCHMARK_SHARD_SIZE", default=0, cast=int)  # Most hosts per run; 0 runs all due hosts together
+MAX_CONCURRENT_SHARDS = decouple_config("MAX_CONCURRENT_SHARDS", default=1, cast=int)
+SHARD_TIMEOUT_IN_MINUTES = decouple_config("SHARD_TIMEOUT_IN_MINUTES", default=0, cast=int)  # 0 disables the timeout
+# Repeated-trial mode, passed to the playbook; the defaults run every test once on 4 threads
+BENCHMARK_TRIALS = decouple_config("BENCHMARK_TRIALS", default=1, cast=int)
+BENCHMARK_WARMUP_RUNS = decouple_config("BENCHMARK_WARMUP_RUNS", default=0, cast=int)
+BENCHMARK_THREADS_PER_CPU = decouple_config("BENCHMARK_THREADS_PER_CPU", default=0, cast=float)
+NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH = os.path.join(BENCHMARK_RESULTS_DIRECTORY, "benchmark_result_output_files/")
+COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH = os.path.join(BENCHMARK_RESULTS_DIRECTORY, "combined_cloud_benchmarker_results.json")
+# One JSON record per host and run, appended by the playbook; preferred over the combined file when present
+NDJSON_BENCHMARK_RESULTS_FILE_PATH = os.path.join(BENCHMARK_RESULTS_DIRECTORY, "cloud_benchmarker_results.ndjson")
+# Single-leader scheduling: every worker runs the loop, but only the holder of the database lease queues and runs
+SCHEDULER_TICK_SECONDS = decouple_config("SCHEDULER_TICK_SECONDS", default=60, cast=int)  # Longest sleep between passes
+SCHEDULER_LEASE_SECONDS = decouple_config("SCHEDULER_LEASE_SECONDS", default=180, cast=int)
+SCHEDULER_RETRY_LIMIT = decouple_config("SCHEDULER_RETRY_LIMIT", default=3, cast=int)
+SCHEDULER_RETRY_BASE_DELAY_SECONDS = decouple_config("SCHEDULER_RETRY_BASE_DELAY_SECONDS", default=300, cast=int)
+SCHEDULER_RETRY_MAX_DELAY_SECONDS = decouple_config("SCHEDULER_RETRY_MAX_DELAY_SECONDS", default=3600, cast=int)
+SCHEDULER_HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+parsed_inventory_cache = {}
+synced_inventory_signature = None
+is_leader = False
+maintenance_due = True  # Regression detection and archiving also run on the first pass after taking the lead
+running_run_ids = set()
+scheduler_stop = Event()
 
-if not os.path.exists(NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH):
-    os.makedirs(NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH)
-    initial_setup = True    
 
-if not os.path.exists(COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH):
-    with open(COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH, 'w') as f:
-        f.write("{}")  # Initialize with empty JSON object
-    initial_setup = True        
+def parse_inventory_details(file_path):
+    """Parse an INI Ansible inventory into {hostname: {"IP_address", "groups", "variables"}}.
 
-def parse_inventory(file_path):
+    A host listed under several groups collects all of them; `:vars` and `:children` sections are skipped. The
+    inventory rarely changes, so it is only re-parsed when its size or mtime does.
+    """
+    stat = os.stat(file_path)
+    cached = parsed_inventory_cache.get(file_path)
+    if cached and cached[0] == (stat.st_size, stat.st_mtime):
+        return cached[1]
     logger.info(f"Parsing inventory file at {file_path}.")
-    host_to_ip_dict = {}
+    inventory = {}
+    group_name = "ungrouped"
     with open(file_path, 'r') as f:
         for line in f:
-            if "ansible_host" in line:
-                parts = line.strip().split(" ")
-                hostname = parts[0]
-                ip_address = parts[1].split('=')[1]
-                host_to_ip_dict[hostname] = ip_address
-    return host_to_ip_dict
+            line = line.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                group_name = line[1:-1]
+                continue
+            if ":" in group_name:  # [group:vars] and [group:children] list no hosts
+                continue
+            hostname, *assignments = line.split()
+            details = inventory.setdefault(hostname, {"IP_address": None, "groups": [], "variables": {}})
+            details["variables"].update(assignment.split("=", 1) for assignment in assignments if "=" in assignment)
+            details["IP_address"] = details["variables"].get("ansible_host", details["IP_address"])
+            if group_name not in details["groups"]:
+                details["groups"].append(group_name)
+    parsed_inventory_cache[file_path] = ((stat.st_size, stat.st_mtime), inventory)
+    return inventory
+
+
+def parse_inventory(file_path):
+    return {hostname: details["IP_address"] for hostname, details in parse_inventory_details(file_path).items() if details["IP_address"]}
+
+
+def sync_inventory(file_path):
+    # Group memberships and host attributes only need writing when the inventory file changed
+    global synced_inventory_signature
+    inventory = parse_inventory_details(file_path)
+    signature = parsed_inventory_cache[file_path][0]
+    if signature == synced_inventory_signature:
+        return
+    db = SessionLocal()
+    try:
+        sync_inventory_hosts(db, inventory)
+    finally:
+        db.close()
+    synced_inventory_signature = signature
 
 
 def read_and_massage_json(file_path):
     logger.info(f"Reading and massaging JSON file at {file_path}.")    
     with open(file_path, 'r') as f:
-        content = f.read().strip()
-        content = re.sub(r'(\w+): {', r'"\1": {', content)
-        content = '{' + content + '}'
-    return json.loads(content)
-
-
-def ingest_data(db: Session, raw_data, overall_data, datetime_from_file, host_to_ip):
-    for hostname, scores in raw_data.items():
-        conditions = {
-            "datetime": datetime_from_file,
-            "hostname": hostname,
-            "IP_address": host_to_ip.get(hostname, 'UNKNOWN')
-        }
-        # For raw benchmark subscores
-        raw_record = db.query(RawBenchmarkSubscores).filter_by(**conditions).first()
-        if raw_record:
-            for k, v in scores.items():
-                setattr(raw_record, k, v)
-        else:
-            raw_entry = RawBenchmarkSubscores(**conditions, **scores)
-            db.add(raw_entry)
-        # For overall normalized scores
-        overall_record = db.query(OverallNormalizedScore).filter_by(**conditions).first()
-        if overall_record:
-            overall_record.overall_score = overall_data[hostname]
+        return massage_combined_results_content(f.read())
+
+
+def drain_stream(stream, log_function, prefix, on_line=None):
+    for line in iter(stream.readline, ''):
+        log_function(f"{prefix}{line.strip()}")
+        if on_line:
+            on_line(line.strip())
+    stream.close()
+
+
+def run_playbook(extra_args, log_prefix="", timeout_in_minutes=0):
+    # Both pipes are drained on their own threads so a chatty run can never fill a pipe buffer and deadlock
+    process = subprocess.Popen(
+        shlex.split(ANSIBLE_PLAYBOOK_COMMAND) + ["-v", "-i", ANSIBLE_INVENTORY_FILE_PATH, "benchmark-playbook.yml"] + extra_args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    drain_threads = [Thread(target=drain_stream, args=(process.stdout, logger.info, log_prefix, playbook_task_timer()), daemon=True),
+                     Thread(target=drain_stream, args=(process.stderr, logger.warning, log_prefix), daemon=True)]
+    for drain_thread in drain_threads:
+        drain_thread.start()
+    try:
+        process.wait(timeout=timeout_in_minutes * 60 if timeout_in_minutes > 0 else None)
+    except subprocess.TimeoutExpired:
+        logger.error(f"{log_prefix}Ansible playbook run exceeded {timeout_in_minutes} minutes; killing it.")
+        process.kill()
+        process.wait()
+    for drain_thread in drain_threads:
+        drain_thread.join()
+    return process.returncode
+
+
+def ingest_results_files(combined_results_file_path, overall_results_file_path, host_to_ip, only_if_changed=False):
+    db = SessionLocal()
+    try:
+        if only_if_changed and not any(file_needs_ingest(db, path) for path in [combined_results_file_path, overall_results_file_path]):
+            logger.info(f"{combined_results_file_path} and {overall_results_file_path} are unchanged since they were ingested; skipping.")
+            return False
+        datetime_from_file = datetime.fromtimestamp(os.path.getmtime(combined_results_file_path))
+        logger.info(f"Massaging raw data from JSON file at {combined_results_file_path} into valid JSON.")
+        raw_data = read_and_massage_json(combined_results_file_path)
+        logger.info(f"Reading overall data from JSON file at {overall_results_file_path}.")
+        with open(overall_results_file_path) as f:
+            overall_data = json.load(f)
+        logger.info("Ingesting data into the database.")
+        with INGEST_SECONDS.labels(source="combined_file").time():
+            raw_rows, overall_rows = build_ingest_rows(raw_data, overall_data, datetime_from_file, host_to_ip)
+            stage_ingest_rows(db, raw_rows, overall_rows, *build_run_detail_rows(raw_data, datetime_from_file))
+            # The ledger entries are committed with the rows, so a file is never marked ingested without its data
+            record_ingested_file(db, combined_results_file_path)
+            record_ingested_file(db, overall_results_file_path)
+            db.commit()
+        bump_ingest_generation(db)
+        logger.info(f"Ingested {len(raw_rows)} raw subscore rows and {len(overall_rows)} overall score rows.")
+        return True
+    finally:
+        db.close()
+
+
+def record_ingested_files(file_paths):
+    db = SessionLocal()
+    try:
+        for file_path in file_paths:
+            record_ingested_file(db, file_path)
+        db.commit()
+    finally:
+        db.close()
+
+
+def backfill_unledgered_results(host_to_ip):
+    if os.path.exists(NDJSON_BENCHMARK_RESULTS_FILE_PATH):
+        # Every run since the NDJSON log appeared is ingested from it, with the playbook's own run timestamps
+        return
+    db = SessionLocal()
+    try:
+        backfill_overall_results_files(db, NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH, host_to_ip)
+    finally:
+        db.close()
+
+
+def refresh_rollup_tables():
+    # Ingest only marks the weeks it wrote to; recomputing their buckets is kept out of the ingest transaction
+    db = SessionLocal()
+    try:
+        if refresh_stale_rollups(db):
+            bump_ingest_generation(db)  # Cached long-range charts are built from rollups
+    finally:
+        db.close()
+
+
+def detect_new_anomalies():
+    db = SessionLocal()
+    try:
+        if detect_anomalies(db):
+            bump_ingest_generation(db)  # Cached charts need the new alert markers
+    finally:
+        db.close()
+
+
+def refresh_scoring_baseline():
+    # Provisional bounds follow the growing history; whenever they move, stored scores are rescored against them
+    db = SessionLocal()
+    try:
+        changed_metrics = update_scoring_baseline(db)
+        db.commit()
+        if changed_metrics:
+            rescore_history(db, DEFAULT_CUSTOM_WEIGHTS, "baseline")
+    finally:
+        db.close()
+
+
+def archive_old_results():
+    db = SessionLocal()
+    try:
+        archive_old_rows(db)
+    finally:
+        db.close()
+
+
+def ingest_new_ndjson_results():
+    db = SessionLocal()
+    try:
+        return ingest_ndjson_results(db, NDJSON_BENCHMARK_RESULTS_FILE_PATH)
+    finally:
+        db.close()
+
+
+def run_and_ingest_hosts(hosts, host_to_ip, log_prefix="", slot=None):
+    """Run the playbook on `hosts` and ingest its results. `slot` (one per concurrently running playbook) keeps the
+    result files of concurrent runs apart. Returns the playbook's return code."""
+    shard_suffix = f"__shard_{slot}" if slot is not None else ""
+    combined_results_file_path = COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH.replace(".json", f"{shard_suffix}.json")
+    timestamp = datetime.now().strftime('%m_%d_%Y__%H_%M_%S')
+    overall_results_file_path = os.path.join(NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH, f"combined_cloud_benchmarker_results__overall_score_sorted__{timestamp}{shard_suffix}.json")
+    extra_args = ["-e", f"combined_results_file={combined_results_file_path}", "-e", f"overall_results_file={overall_results_file_path}",
+                  "-e", f"ndjson_results_file={NDJSON_BENCHMARK_RESULTS_FILE_PATH}",
+                  "-e", f"benchmark_trials={BENCHMARK_TRIALS}", "-e", f"benchmark_warmup_runs={BENCHMARK_WARMUP_RUNS}",
+                  "-e", f"benchmark_threads_per_cpu={BENCHMARK_THREADS_PER_CPU}"]
+    if set(hosts) != set(host_to_ip):
+        # localhost stays in the limit, or Ansible would skip the plays that combine, score and write the results
+        extra_args = ["--limit", ",".join(hosts + ["localhost"]), "-e", f"shard_hosts={','.join(hosts)}"] + extra_args
+    logger.info(f"{log_prefix}Now running ansible playbook for {len(hosts)} hosts...")
+    with SCHEDULER_PHASE_SECONDS.labels(phase="playbook").time():
+        return_code = run_playbook(extra_args, log_prefix, SHARD_TIMEOUT_IN_MINUTES)
+    logger.info(f"{log_prefix}Ansible playbook run completed with return code {return_code}.")
+    # Each run is ingested as soon as it finishes instead of waiting for the slowest concurrent run
+    with SCHEDULER_PHASE_SECONDS.labels(phase="ingest").time():
+        if os.path.exists(NDJSON_BENCHMARK_RESULTS_FILE_PATH):
+            ingest_new_ndjson_results()
+            if os.path.exists(overall_results_file_path):
+                # The run's overall scores came from the NDJSON records, so the file must never be backfilled as well
+                record_ingested_files([overall_results_file_path])
+        elif os.path.exists(overall_results_file_path):
+            ingest_results_files(combined_results_file_path, overall_results_file_path, host_to_ip)
         else:
-            overall_entry = OverallNormalizedScore(**conditions, overall_score=overall_data[hostname])
-            db.add(overall_entry)
-    db.commit()
-    
+            logger.warning(f"{log_prefix}No overall results were written to {overall_results_file_path}; nothing to ingest.")
+    return return_code
+
+
+def ingest_existing_results(host_to_ip):
+    # Picks up results written outside the scheduler's own runs; cheap when nothing changed
+    if os.path.exists(NDJSON_BENCHMARK_RESULTS_FILE_PATH):
+        # Only records appended since the last ingest are read
+        return ingest_new_ndjson_results() > 0
+    json_files = glob.glob(f'{NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH}/*.json')
+    if not json_files or not os.path.exists(COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH):
+        return False
+    latest_overall_file = max(json_files, key=os.path.getctime)
+    return ingest_results_files(COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH, latest_overall_file, host_to_ip, only_if_changed=True)
+
+
+def execute_run(run_id, host_to_ip, slot):
+    """Run one claimed run from the queue, then record which hosts produced results and queue retries for the rest."""
+    log_prefix = f"[run {run_id}] "
+    db = SessionLocal()
+    try:
+        host_ids = run_hostnames(db, run_id)
+        # Results are stamped with the playbook's start time in whole seconds
+        started_at = datetime.now().replace(microsecond=0)
+        hosts = [hostname for hostname in host_ids if hostname in host_to_ip]
+        if len(hosts) < len(host_ids):
+            logger.warning(f"{log_prefix}Skipping hosts that are not in the inventory: {sorted(set(host_ids) - set(hosts))}")
+        return_code = None
+        if hosts:
+            try:
+                return_code = run_and_ingest_hosts(hosts, host_to_ip, log_prefix, slot)
+            except Exception:
+                logger.exception(f"{log_prefix}Benchmark run failed")
+        # A host succeeded when ingest saw a result from it since the run started
+        benchmarked_host_ids = [host_ids[hostname] for hostname in hosts]
+        succeeded = {host_id for host_id, last_seen in db.execute(select(Host.id, Host.last_seen).where(Host.id.in_(benchmarked_host_ids))).all()
+                     if last_seen is not None and last_seen >= started_at}
+        finish_run(db, run_id, succeeded, return_code, SCHEDULER_RETRY_LIMIT, SCHEDULER_RETRY_BASE_DELAY_SECONDS, SCHEDULER_RETRY_MAX_DELAY_SECONDS)
+        logger.info(f"{log_prefix}{len(succeeded)} of {len(host_ids)} hosts produced results.")
+    finally:
+        db.close()
+
+
+def run_queued_runs(host_to_ip):
+    """Claim and run queued runs, up to MAX_CONCURRENT_SHARDS at a time, until none is runnable. Returns how many ran."""
+    number_of_runs = 0
+    free_slots = list(range(MAX_CONCURRENT_SHARDS))
+    running = {}
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SHARDS) as executor:
+        while True:
+            if is_leader and not scheduler_stop.is_set():
+                db = SessionLocal()
+                try:
+                    claimed = claim_runs(db, len(free_slots))
+                    RUN_QUEUE_DEPTH.set(queued_run_count(db))
+                finally:
+                    db.close()
+                for run_id, runnable_since in claimed:
+                    SCHEDULER_LAG_SECONDS.set(max(0.0, (datetime.now() - runnable_since).total_seconds()))
+                    slot = free_slots.pop(0)
+                    running_run_ids.add(run_id)
+                    running[executor.submit(execute_run, run_id, host_to_ip, slot if MAX_CONCURRENT_SHARDS > 1 else None)] = (run_id, slot)
+            if not running:
+                return number_of_runs
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                run_id, slot = running.pop(future)
+                running_run_ids.discard(run_id)
+                free_slots.append(slot)
+                number_of_runs += 1
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception(f"[run {run_id}] Recording the run failed")
+
+
+def run_maintenance(host_to_ip):
+    # Older overall score files that were never ingested (only the newest one used to be read) are picked up here.
+    # Their scores are run-relative without subscores to rescore, so baseline scoring has no use for them.
+    if SCORING_MODE != "baseline":
+        with SCHEDULER_PHASE_SECONDS.labels(phase="backfill").time():
+            backfill_unledgered_results(host_to_ip)
+    if SCORING_MODE == "baseline":
+        with SCHEDULER_PHASE_SECONDS.labels(phase="rescore").time():
+            refresh_scoring_baseline()
+    with SCHEDULER_PHASE_SECONDS.labels(phase="rollups").time():
+        refresh_rollup_tables()
+    with SCHEDULER_PHASE_SECONDS.labels(phase="anomaly_detection").time():
+        detect_new_anomalies()
+    if ARCHIVE_RETENTION_DAYS > 0:
+        with SCHEDULER_PHASE_SECONDS.labels(phase="archive").time():
+            archive_old_results()
+
+
 def job():
-    global initial_setup  # Declare it as global to modify it inside the function
-    logger.info("Scheduler job started.")
-    files_to_check = [COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH]
-    if should_run_job(files_to_check) or initial_setup:
-        logger.info("Now running ansible playbook...")
-        process = subprocess.Popen(
-            ["ansible-playbook", "-v", "-i", ANSIBLE_INVENTORY_FILE_PATH, "benchmark-playbook.yml"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        for line in iter(process.stdout.readline, ''):
-            logger.info(line.strip())
-        process.stdout.close()
-        process.wait()
-        logger.info("Ansible playbook run completed.")
-        initial_setup = False  # Reset the flag to False after running
-    else:
-        logger.info("Skipping ansible playbook run since the benchmark results file is not old enough.")
-    datetime_from_file = datetime.fromtimestamp(os.path.getmtime(COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH))
-    logger.info(f"Massaging raw data from JSON file at {COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH} into valid JSON.")
-    raw_data = read_and_massage_json(COMBINED_BENCHMARK_SUBSCORE_RESULTS_FILE_PATH)
-    logger.info("Parsing inventory file.")
+    """One pass of the scheduler: sync the inventory, queue the hosts that are due, run every runnable queued run and
+    ingest, then detect regressions and archive. Returns the seconds until the next scheduled work (None: nothing scheduled)."""
+    with SCHEDULER_PHASE_SECONDS.labels(phase="job").time():
+        seconds_until_next = run_job()
+    LAST_JOB_COMPLETED.set_to_current_time()
+    return seconds_until_next
+
+
+def run_job():
+    global maintenance_due
     host_to_ip = parse_inventory(ANSIBLE_INVENTORY_FILE_PATH)
-    json_files = glob.glob(f'{NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH}/*.json')
-    if json_files:  # Check if the list is not empty
-        latest_overall_file = max(json_files, key=os.path.getctime)
-        logger.info(f"Reading overall data from JSON file at {latest_overall_file}.")
-        overall_data = json.load(open(latest_overall_file))
-        logger.info("Ingesting data into the database.")
-        db = SessionLocal()
-        ingest_data(db, raw_data, overall_data, datetime_from_file, host_to_ip)
-        logger.info("Scheduled job completed!")
-    else:
-        logger.warning("No JSON files found in the specified directory.")
-
-def should_run_job(file_paths):
-    now = datetime.now()
-    for file_path in file_paths:
-        try:
-            modified_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-            if now - modified_time > timedelta(hours=3):
-                return True
-        except FileNotFoundError:
-            logger.warning(f"File {file_path} not found.")
-            continue
-    return False
+    sync_inventory(ANSIBLE_INVENTORY_FILE_PATH)
+    interval = timedelta(minutes=PLAYBOOK_RUN_INTERVAL_IN_MINUTES)
+    db = SessionLocal()
+    try:
+        inventory_host_ids = lookup_host_ids(db, host_to_ip)
+        schedule_new_hosts(db, inventory_host_ids, interval)
+        enqueue_due_hosts(db, set(inventory_host_ids.values()), interval, BENCHMARK_SHARD_SIZE)
+    finally:
+        db.close()
+    number_of_runs = run_queued_runs(host_to_ip)
+    with SCHEDULER_PHASE_SECONDS.labels(phase="ingest").time():
+        ingested = ingest_existing_results(host_to_ip)
+    if number_of_runs or ingested or maintenance_due:
+        run_maintenance(host_to_ip)
+        maintenance_due = False
+        logger.info(f"Scheduler pass completed after {number_of_runs} runs.")
+    db = SessionLocal()
+    try:
+        RUN_QUEUE_DEPTH.set(queued_run_count(db))
+        return seconds_until_next_work(db, set(inventory_host_ids.values()))
+    finally:
+        db.close()
+
+
+def renew_leadership():
+    """Take or renew the scheduler lease; the process that becomes leader requeues runs its predecessor left running."""
+    global is_leader, maintenance_due
+    db = SessionLocal()
+    try:
+        leader = acquire_lease(db, SCHEDULER_HOLDER_ID, SCHEDULER_LEASE_SECONDS)
+        if leader and not is_leader:
+            logger.info(f"Scheduler {SCHEDULER_HOLDER_ID} is now the leader.")
+            requeue_orphaned_runs(db, keep_run_ids=set(running_run_ids))
+            maintenance_due = True
+        elif is_leader and not leader:
+            logger.warning(f"Scheduler {SCHEDULER_HOLDER_ID} lost the leader lease.")
+    except Exception:
+        logger.exception("Could not renew the scheduler lease")
+        leader = False
+    finally:
+        db.close()
+    is_leader = leader
+    SCHEDULER_IS_LEADER.set(int(leader))
+    return leader
+
+
+def run_lease_heartbeat():
+    # Renews the lease on its own thread, so a long playbook run or archive never lets it expire
+    while not scheduler_stop.wait(SCHEDULER_LEASE_SECONDS / 3):
+        was_leader = is_leader
+        if renew_leadership() and not was_leader:
+            wake_scheduler()
+
+
+def run_scheduler_loop():
+    while not scheduler_stop.is_set():
+        sleep_seconds = SCHEDULER_TICK_SECONDS
+        if is_leader:
+            try:
+                seconds_until_next = job()
+                if seconds_until_next is not None:
+                    sleep_seconds = min(sleep_seconds, seconds_until_next)
+            except Exception:
+                logger.exception("Scheduler pass failed")
+        # Sleeps until the next host is due, a run is requested or the tick passes, whichever comes first
+        scheduler_wakeup.wait(timeout=sleep_seconds)
+        scheduler_wakeup.clear()
+
 
 def start_scheduler():
-    logger.info("Scheduler started.")    
-    schedule.every(PLAYBOOK_RUN_INTERVAL_IN_MINUTES).minutes.do(job)
-    job()
-    def run():
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
+    os.makedirs(NORMALIZED_BENCHMARK_OUTPUT_FILES_PATH, exist_ok=True)
+    logger.info(f"Scheduler {SCHEDULER_HOLDER_ID} started.")
+    scheduler_stop.clear()
+    renew_leadership()
+    for target in (run_lease_heartbeat, run_scheduler_loop):
+        Thread(target=target, daemon=True).start()
 
-    # Run the above function in a separate thread
-    scheduler_thread = Thread(target=run)
-    scheduler_thread.start()
+
+def stop_scheduler():
+    # Releasing the lease lets another worker take over at once instead of after it expires
+    scheduler_stop.set()
+    wake_scheduler()
+    if is_leader:
+        db = SessionLocal()
+        try:
+            release_lease(db, SCHEDULER_HOLDER_ID)
+        finally:
+            db.close()
+    logger.info(f"Scheduler {SCHEDULER_HOLDER_ID} stopped.")
@@ -0,0 +1,87 @@
+from web_app.app.utils.metric_registry import METRICS, metric_definition
+import warnings
+import numpy as np
+import pandas as pd
+
+# Directions and default weights come from the metric registry
+METRIC_DIRECTIONS = {metric.name: metric.direction for metric in METRICS}
+DEFAULT_CUSTOM_WEIGHTS = {metric.name: metric.weight for metric in METRICS if metric.weight}
+NORMALIZATION_METHODS = ("min_max", "z_score", "log", "baseline")
+
+
+def metric_directions(metrics):
+    # Metrics without a registered direction are treated as higher-is-better
+    return np.array([metric_definition(metric).direction for metric in metrics], dtype=float)
+
+
+def weight_vector(metrics, weights=None):
+    if weights is None:
+        return np.ones(len(metrics)) / len(metrics)
+    vector = np.array([float(weights.get(metric, 0.0)) for metric in metrics])
+    total_weight = vector.sum()
+    if total_weight == 0:
+        raise ValueError("Sum of custom weights must not be zero.")
+    return vector / total_weight
+
+
+def normalize_matrix(values, directions, method="min_max", run_labels=None, bounds=None):
+    """Normalize a hosts x metrics matrix column by column so that higher always means better.
+
+    `min_max` and `log` map each metric onto 0-100 within a run (a metric with no spread scores 100, as before),
+    `z_score` returns signed standard deviations from the run mean. When `run_labels` is given, statistics are
+    computed separately for the rows of every run, so many runs can be normalized in one vectorized pass.
+    `baseline` maps each metric onto 0-100 between fixed (low, high) `bounds` arrays instead, so scores compare
+    across runs; values outside the bounds score below 0 or above 100, and metrics without bounds (NaN) drop out.
+    NaN (a failed subtest) stays NaN.
+    """
+    if method not in NORMALIZATION_METHODS:
+        raise ValueError(f"Unknown normalization method: {method}")
+    if method == "baseline" and bounds is None:
+        raise ValueError("Baseline normalization needs bounds.")
+    values = np.asarray(values, dtype=float)
+    if method == "log":
+        values = np.log1p(np.clip(values, 0, None))
+    if method == "baseline":
+        lows, highs = (np.asarray(bound, dtype=float) for bound in bounds)
+        values = np.where(np.isnan(lows) | np.isnan(highs), np.nan, values)
+    else:
+        frame = pd.DataFrame(values)
+        grouped = frame.groupby(np.zeros(len(frame)) if run_labels is None else np.asarray(run_labels))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if method == "z_score":
+            means = grouped.transform("mean").to_numpy()
+            stds = grouped.transform("std", ddof=0).to_numpy()
+            normalized = np.where(stds > 0, (values - means) / np.where(stds > 0, stds, 1), 0.0) * directions
+        else:
+            if method != "baseline":
+                lows = grouped.transform("min").to_numpy()
+                highs = grouped.transform("max").to_numpy()
+            spans = highs - lows
+            from_low = (values - lows) / np.where(spans > 0, spans, 1) * 100
+            normalized = np.where(spans > 0, np.where(directions > 0, from_low, 100 - from_low), 100.0)
+    return np.where(np.isnan(values), np.nan, normalized)
+
+
+def score_matrix(values, metrics, weights=None, method="min_max", run_labels=None, bounds=None):
+    """Return one overall score per row of a hosts x metrics matrix.
+
+    Failed subtests (NaN) drop out of a host's weighted average and the remaining weights are renormalized,
+    so a host is not penalized as if it had scored zero. Rows with no usable metric score NaN.
+    """
+    normalized = normalize_matrix(values, metric_directions(metrics), method, run_labels, bounds)
+    weights_matrix = np.where(np.isnan(normalized), 0.0, weight_vector(metrics, weights))
+    weight_totals = weights_matrix.sum(axis=1)
+    weighted_sums = np.nansum(normalized * weights_matrix, axis=1)
+    return np.where(weight_totals > 0, weighted_sums / np.where(weight_totals > 0, weight_totals, 1), np.nan)
+
+
+def score_hosts(data, weights=None, method="min_max"):
+    """Score a {host: {metric: value}} mapping and return {host: score} sorted best first."""
+    hosts = list(data.keys())
+    metrics = list(METRIC_DIRECTIONS.keys())
+    metrics += sorted({metric for host_data in data.values() for metric in host_data} - set(metrics))
+    metrics = [metric for metric in metrics if any(metric in host_data for host_data in data.values())]
+    values = np.array([[data[host].get(metric, np.nan) for metric in metrics] for host in hosts], dtype=float)
+    scores = score_matrix(values, metrics, weights, method)
+    return {hosts[i]: float(scores[i]) for i in np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")}
@@ -0,0 +1,111 @@
+from web_app.app.database.data_models import RawBenchmarkSubscores, ScoringBaseline
+from web_app.app.database.bulk_upsert import upsert_rows
+from web_app.app.database.hosts import group_hostnames, host_conditions
+from web_app.app.logger_config import setup_logger
+from web_app.app.utils.archive import is_archived, read_archived_frame
+from web_app.app.utils.extended_metrics import extended_metric_names, load_extended_metrics
+from web_app.app.utils.metric_registry import column_metrics, is_column_metric
+from web_app.app.utils.scoring import score_matrix, DEFAULT_CUSTOM_WEIGHTS
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from decouple import config
+import numpy as np
+import pandas as pd
+
+# `baseline` (the default) scores every host against fixed per-metric bounds taken from the stored history, so an
+# overall score means the same thing from run to run and trend lines are comparable. `run` normalizes each metric
+# against the other hosts of the same run, as the playbook's scoring script does; scheduled runs only hold the hosts
+# due in one tick, often a single one, so run-relative scores are only meaningful for whole-fleet runs.
+logger = setup_logger()
+SCORING_MODE = config("SCORING_MODE", default="baseline", cast=str)
+SCORING_BASELINE_LOW_PERCENTILE = config("SCORING_BASELINE_LOW_PERCENTILE", default=5, cast=float)
+SCORING_BASELINE_HIGH_PERCENTILE = config("SCORING_BASELINE_HIGH_PERCENTILE", default=95, cast=float)
+# Bounds are recomputed as history grows until they rest on this many values, then stay fixed
+SCORING_BASELINE_MIN_SAMPLES = config("SCORING_BASELINE_MIN_SAMPLES", default=500, cast=int)
+# Empty takes the bounds from every host; an inventory group pins them to a set of reference hosts
+SCORING_BASELINE_GROUP = config("SCORING_BASELINE_GROUP", default="", cast=str)
+
+
+def scored_metrics(db: Session, weights=None):
+    # Extended metrics count when they are weighted (or, with equal weighting, always), like in score_hosts
+    return column_metrics() + [metric for metric in extended_metric_names(db) if weights is None or weights.get(metric)]
+
+
+def baseline_hostnames(db: Session):
+    if not SCORING_BASELINE_GROUP:
+        return None
+    return list(db.execute(group_hostnames([SCORING_BASELINE_GROUP])).scalars())
+
+
+def load_metric_values(db: Session, metrics, hostnames=None):
+    """Return {metric: array of every stored (and archived) value} for `metrics`."""
+    values = {}
+    columns = [metric for metric in metrics if is_column_metric(metric)]
+    if columns:
+        query = select(*[getattr(RawBenchmarkSubscores, column) for column in columns])
+        if hostnames is not None:
+            query = query.where(*host_conditions(RawBenchmarkSubscores, hostnames))
+        wide_df = pd.DataFrame(db.execute(query).all(), columns=columns)
+        if is_archived(RawBenchmarkSubscores):
+            wide_df = pd.concat([read_archived_frame(RawBenchmarkSubscores, columns, hostnames=hostnames), wide_df], ignore_index=True)
+        values.update({column: wide_df[column].to_numpy(dtype=float) for column in columns})
+    extended = [metric for metric in metrics if not is_column_metric(metric)]
+    if extended:
+        long_df = load_extended_metrics(db, hostnames=hostnames, metrics=extended)
+        values.update({metric: long_df.loc[long_df["metric"] == metric, "value"].to_numpy(dtype=float) for metric in extended})
+    return {metric: metric_values[~np.isnan(metric_values)] for metric, metric_values in values.items()}
+
+
+def load_baseline(db: Session):
+    return {row.metric: row for row in db.execute(select(ScoringBaseline)).scalars()}
+
+
+def update_scoring_baseline(db: Session, metrics=None, refresh=False, now=None):
+    """Compute bounds for the metrics that have none yet or only provisional ones, or for all of `metrics` with
+    `refresh` (staged, not committed). Settled bounds never move on their own. Returns the metrics whose bounds changed."""
+    now = now or datetime.now()
+    metrics = metrics if metrics is not None else scored_metrics(db, DEFAULT_CUSTOM_WEIGHTS)
+    baseline = load_baseline(db)
+    stale = [metric for metric in metrics if refresh or metric not in baseline or baseline[metric].sample_count < SCORING_BASELINE_MIN_SAMPLES]
+    if not stale:
+        return []
+    rows = []
+    for metric, metric_values in load_metric_values(db, stale, baseline_hostnames(db)).items():
+        if not len(metric_values):
+            continue
+        low, high = np.percentile(metric_values, [SCORING_BASELINE_LOW_PERCENTILE, SCORING_BASELINE_HIGH_PERCENTILE])
+        current = baseline.get(metric)
+        if current is None or (current.low, current.high, current.sample_count) != (float(low), float(high), len(metric_values)):
+            rows.append({"metric": metric, "low": float(low), "high": float(high), "sample_count": len(metric_values), "updated_at": now})
+    upsert_rows(db, ScoringBaseline, rows, ["metric"])
+    changed = [row["metric"] for row in rows if row["metric"] not in baseline or (baseline[row["metric"]].low, baseline[row["metric"]].high) != (row["low"], row["high"])]
+    if changed:
+        logger.info(f"Updated the scoring baseline of {len(changed)} metrics: {', '.join(changed)}.")
+    return changed
+
+
+def baseline_bounds(baseline, metrics):
+    # (lows, highs) arrays in the order of `metrics`; NaN for metrics without bounds
+    return (np.array([baseline[metric].low if metric in baseline else np.nan for metric in metrics]),
+            np.array([baseline[metric].high if metric in baseline else np.nan for metric in metrics]))
+
+
+def baseline_overall_rows(db: Session, raw_rows, metric_rows=(), weights=DEFAULT_CUSTOM_WEIGHTS):
+    """Score freshly ingested rows against the stored baseline, seeding bounds for metrics seen for the first time.
+
+    The rows must already be written, so a brand new metric's first bounds include them.
+    """
+    if not raw_rows:
+        return []
+    extended_values = {(row["datetime"], row["hostname"], row["metric"]): row["value"] for row in metric_rows}
+    metrics = column_metrics() + sorted({metric for _, _, metric in extended_values if weights is None or weights.get(metric)})
+    baseline = load_baseline(db)
+    if any(metric not in baseline for metric in metrics):
+        update_scoring_baseline(db, [metric for metric in metrics if metric not in baseline])
+        baseline = load_baseline(db)
+    values = np.array([[row.get(metric) if is_column_metric(metric) else extended_values.get((row["datetime"], row["hostname"], metric))
+                        for metric in metrics] for row in raw_rows], dtype=float)
+    scores = score_matrix(values, metrics, weights, "baseline", bounds=baseline_bounds(baseline, metrics))
+    return [{"datetime": row["datetime"], "hostname": row["hostname"], "IP_address": row["IP_address"], "overall_score": float(score)}
+            for row, score in zip(raw_rows, scores) if not np.isnan(score)]
@@ -0,0 +1,48 @@
+from decouple import config
+import json
+import numpy as np
+
+# In repeated-trial mode the playbook reports every metric as a list of per-trial results. The raw subscores table,
+# and with it scoring and charts, keeps one value per metric: the median of the trials by default.
+TRIAL_AGGREGATES = {"median": np.median, "mean": np.mean}
+TRIAL_AGGREGATE = config("TRIAL_AGGREGATE", default="median", cast=str)
+if TRIAL_AGGREGATE not in TRIAL_AGGREGATES:
+    raise ValueError(f"Unknown TRIAL_AGGREGATE: {TRIAL_AGGREGATE}")
+
+
+def trial_values(value):
+    return [float(trial) for trial in value if trial is not None]
+
+
+def aggregate_trials(value, aggregate=TRIAL_AGGREGATE):
+    # Single-shot results are plain numbers and pass through unchanged; a list with no successful trial is missing
+    if not isinstance(value, list):
+        return value
+    values = trial_values(value)
+    return float(TRIAL_AGGREGATES[aggregate](values)) if values else None
+
+
+def aggregate_host_trials(data, aggregate=TRIAL_AGGREGATE):
+    return {hostname: {metric: aggregate_trials(value, aggregate) for metric, value in metrics.items()} for hostname, metrics in data.items()}
+
+
+def trial_statistics(values):
+    mean = float(np.mean(values))
+    stddev = float(np.std(values, ddof=1)) if len(values) > 1 else 0.0
+    return {
+        "trial_count": len(values),
+        "mean": mean,
+        "stddev": stddev,
+        "coefficient_of_variation": stddev / abs(mean) if mean else None,
+        "median": float(np.median(values)),
+        "min_value": float(np.min(values)),
+        "max_value": float(np.max(values)),
+        "trial_values": json.dumps(values),
+    }
+
+
+def build_trial_rows(raw_data, datetime_from_run):
+    # One row per host and metric that was measured with repeated trials
+    return [{"datetime": datetime_from_run, "hostname": hostname, "metric": metric, **trial_statistics(trial_values(value))}
+            for hostname, metrics in raw_data.items() for metric, value in metrics.items()
+            if isinstance(value, list) and trial_values(value)]
@@ -0,0 +1,51 @@
+from web_app.app.logger_config import setup_logger
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from decouple import config
+import asyncio
+import functools
+
+logger = setup_logger()
+# Chart rendering and CSV exporting are CPU-heavy pandas/Plotly work; running them here keeps the event loop free and
+# bounds how many can run at once, so a burst of big requests cannot starve cheap ones of threads or DB connections
+RENDER_POOL_WORKERS = config("RENDER_POOL_WORKERS", default=2, cast=int)
+# `process` renders charts outside this interpreter's GIL, at the cost of worker processes with their own DB connections
+RENDER_POOL_KIND = config("RENDER_POOL_KIND", default="thread", cast=str)
+EXPORT_POOL_WORKERS = config("EXPORT_POOL_WORKERS", default=2, cast=int)
+
+
+def dispose_inherited_connections():
+    # Forked workers must not reuse the parent's pooled connections
+    from web_app.app.database.init_db import engine
+    engine.dispose(close=False)
+
+
+def create_render_pool():
+    if RENDER_POOL_KIND == "process":
+        return ProcessPoolExecutor(max_workers=RENDER_POOL_WORKERS, initializer=dispose_inherited_connections)
+    if RENDER_POOL_KIND != "thread":
+        raise ValueError(f"Unknown RENDER_POOL_KIND: {RENDER_POOL_KIND}")
+    return ThreadPoolExecutor(max_workers=RENDER_POOL_WORKERS, thread_name_prefix="chart-render")
+
+
+render_pool = create_render_pool()
+export_pool = ThreadPoolExecutor(max_workers=EXPORT_POOL_WORKERS, thread_name_prefix="csv-export")
+
+
+async def run_in_pool(pool, function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(function, *args, **kwargs))
+
+
+async def iterate_in_pool(pool, iterator):
+    # Pulls every item of a blocking iterator on `pool`, for StreamingResponse bodies that do heavy work per chunk
+    iterator = iter(iterator)
+    sentinel = object()
+    try:
+        while True:
+            item = await run_in_pool(pool, next, iterator, sentinel)
+            if item is sentinel:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await run_in_pool(pool, close)